@@ -1,11 +1,10 @@
-import sys
 import time
 import random
 from qiskit import QuantumCircuit, transpile
 from qiskit_aer import AerSimulator
-from qiskit.visualization import circuit_drawer
-import matplotlib.pyplot as plt
 from qiskit.qasm3 import dumps as qasm3_dumps
+from functions import load_circuit, parse_technique_args, plot_circuits, render_reports, wait_for_reports
+from instrumentation import JobMetrics, export_metrics, stage
 
 substitution_map = {
     'x': [
@@ -96,16 +95,18 @@ def insert_dynamic_obfuscation(circuit):
     return new_circuit
 
 # Function to execute the circuit and get results using transpile instead of execute
-def execute_circuit(circuit):
+def execute_circuit(circuit, metrics=None):
     simulator = AerSimulator()
     execution_times = []
     counts = None
     for _ in range(10):
         start_time = time.time()
         # Transpile the circuit for the simulator
-        transpiled = transpile(circuit, simulator)
+        with stage(metrics, 'transpile'):
+            transpiled = transpile(circuit, simulator)
         # Run the transpiled circuit on the simulator
-        result = simulator.run(transpiled, shots=1024).result()
+        with stage(metrics, 'simulator.run'):
+            result = simulator.run(transpiled, shots=1024).result()
         counts = result.get_counts()
         end_time = time.time()
         execution_times.append(end_time - start_time)
@@ -130,53 +131,29 @@ def interpret_results(results):
         print(f"Result: {hidden_string}, Count: {value}")
 
 # Function to save the obfuscated circuit to a QASM file
-def save_circuit_to_qasm3(circuit, filename):
-
-    qasm_output = qasm3_dumps(circuit)
+def save_circuit_to_qasm3(circuit, filename, metrics=None):
+    with stage(metrics, 'qasm3_dumps'):
+        qasm_output = qasm3_dumps(circuit)
     with open(filename, 'w') as f:
         f.write(qasm_output)
 
-# Function to plot and compare the original and obfuscated circuits
-def plot_circuits(original_circuit, obfuscated_circuit):
-    original_plot = circuit_drawer(original_circuit, output='mpl', style='clifford')
-    obfuscated_plot = circuit_drawer(obfuscated_circuit, output='mpl', style='clifford')
-
-    original_plot.savefig('original_circuit.png')
-    obfuscated_plot.savefig('obfuscated_circuit.png')
-
-    original_image = plt.imread('original_circuit.png')
-    obfuscated_image = plt.imread('obfuscated_circuit.png')
-
-    plt.figure(figsize=(12, 6))
-
-    plt.subplot(121)
-    plt.title('Original Circuit')
-    plt.imshow(original_image)
-    plt.axis('off')
-
-    plt.subplot(122)
-    plt.title('Obfuscated Circuit')
-    plt.imshow(obfuscated_image)
-    plt.axis('off')
-
-    plt.show()
-
 # Main function to run the script
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python CloakedGates.py input.qasm")
-        sys.exit(1)
-
-    input_qasm = sys.argv[1]
+    args = parse_technique_args('CloakedGates.py')
+    input_qasm = args.input_qasm
     output_qasm = 'CloakedGatesObf.qasm'
 
-    try:
-        original_circuit = QuantumCircuit.from_qasm_file(input_qasm)
-    except Exception:
-        from qiskit.qasm3 import loads as qasm3_loads
-        with open(input_qasm, 'r') as f:
-            original_circuit = qasm3_loads(f.read())
-    obfuscated_circuit = insert_dynamic_obfuscation(original_circuit)
+    metrics = JobMetrics(input_qasm, technique='CloakedGates', trace_memory=args.metrics is not None, profile=args.profile)
+    metrics.start()
+    with metrics.stage('parse'):
+        original_circuit = load_circuit(input_qasm)
+    with metrics.stage('obfuscate'):
+        obfuscated_circuit = insert_dynamic_obfuscation(original_circuit)
+    metrics.record_circuits(original_circuit, obfuscated_circuit)
+
+    if args.report:
+        # Start rendering in the background while the circuits are simulated
+        reports = render_reports(original_circuit, obfuscated_circuit)
 
     print("\nOriginal Circuit:")
     print(original_circuit.draw(output='text'))
@@ -190,8 +167,8 @@ def main():
     print(f"\nOriginal circuit depth: {original_depth}")
     print(f"Obfuscated circuit depth: {obfuscated_depth}")
 
-    original_results, original_time = execute_circuit(original_circuit)
-    obfuscated_results, obfuscated_time = execute_circuit(obfuscated_circuit)
+    original_results, original_time = execute_circuit(original_circuit, metrics)
+    obfuscated_results, obfuscated_time = execute_circuit(obfuscated_circuit, metrics)
 
     print("Original Results:")
     interpret_results(original_results)
@@ -204,10 +181,18 @@ def main():
     print(f"Original Circuit Execution Time: {original_time:.4f} seconds")
     print(f"Obfuscated Circuit Execution Time: {obfuscated_time:.4f} seconds")
 
-    save_circuit_to_qasm3(obfuscated_circuit, output_qasm)
+    save_circuit_to_qasm3(obfuscated_circuit, output_qasm, metrics)
+    metrics.stop()
+    if args.metrics:
+        for filename in export_metrics(metrics, args.metrics):
+            print(f"Metrics written to {filename}")
 
     # Plot the circuits
-    plot_circuits(original_circuit, obfuscated_circuit)
+    if args.report:
+        for filename in wait_for_reports(reports):
+            print(f"Report written to {filename}")
+    else:
+        plot_circuits(original_circuit, obfuscated_circuit)
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,10 @@
-import sys
 import time
 import random
 from qiskit import QuantumCircuit, transpile
 from qiskit_aer import AerSimulator
-from qiskit.visualization import circuit_drawer
-import matplotlib.pyplot as plt
 from qiskit.qasm3 import dumps as qasm3_dumps
+from functions import load_circuit, parse_technique_args, plot_circuits, render_reports, wait_for_reports
+from instrumentation import JobMetrics, export_metrics, stage
 def auxiliary_gate():
     sub_circuit = QuantumCircuit(1, name='auxiliary')
     sub_circuit.h(0)
@@ -82,7 +81,7 @@ def insert_obfuscation(circuit, encapsulate_probability=0.5):
 
     return new_circuit
 
-def execute_circuit(circuit):
+def execute_circuit(circuit, metrics=None):
     simulator = AerSimulator()
     execution_times = []
     counts = None
@@ -91,10 +90,12 @@ def execute_circuit(circuit):
         start_time = time.time()
 
         # Explicit transpilation
-        transpiled = transpile(circuit, simulator)
+        with stage(metrics, 'transpile'):
+            transpiled = transpile(circuit, simulator)
 
         # Run the transpiled circuit
-        result = simulator.run(transpiled, shots=1024).result()
+        with stage(metrics, 'simulator.run'):
+            result = simulator.run(transpiled, shots=1024).result()
         counts = result.get_counts()
 
         end_time = time.time()
@@ -113,51 +114,28 @@ def compare_results(original, obfuscated):
         correct += min(original_count, obfuscated_count)
     return 100 * correct / total if total > 0 else 0
 
-def save_circuit_to_qasm3(circuit, filename):
-
-    qasm_output = qasm3_dumps(circuit)
+def save_circuit_to_qasm3(circuit, filename, metrics=None):
+    with stage(metrics, 'qasm3_dumps'):
+        qasm_output = qasm3_dumps(circuit)
     with open(filename, 'w') as f:
         f.write(qasm_output)
 
-def plot_circuits(original_circuit, obfuscated_circuit):
-    original_plot = circuit_drawer(original_circuit, output='mpl', style='clifford')
-    obfuscated_plot = circuit_drawer(obfuscated_circuit, output='mpl', style='clifford')
-
-    original_plot.savefig('original_circuit.png')
-    obfuscated_plot.savefig('obfuscated_circuit.png')
-
-    original_image = plt.imread('original_circuit.png')
-    obfuscated_image = plt.imread('obfuscated_circuit.png')
-
-    plt.figure(figsize=(12, 6))
-
-    plt.subplot(121)
-    plt.title('Original Circuit')
-    plt.imshow(original_image)
-    plt.axis('off')
-
-    plt.subplot(122)
-    plt.title('Obfuscated Circuit')
-    plt.imshow(obfuscated_image)
-    plt.axis('off')
-
-    plt.show()
-
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python CompositeGates.py input.qasm")
-        sys.exit(1)
-
-    input_qasm = sys.argv[1]
+    args = parse_technique_args('CompositeGates.py')
+    input_qasm = args.input_qasm
     output_qasm = 'CompositeGatesObf.qasm'
 
-    try:
-        original_circuit = QuantumCircuit.from_qasm_file(input_qasm)
-    except Exception:
-        from qiskit.qasm3 import loads as qasm3_loads
-        with open(input_qasm, 'r') as f:
-            original_circuit = qasm3_loads(f.read())
-    obfuscated_circuit = insert_obfuscation(original_circuit)
+    metrics = JobMetrics(input_qasm, technique='CompositeGates', trace_memory=args.metrics is not None, profile=args.profile)
+    metrics.start()
+    with metrics.stage('parse'):
+        original_circuit = load_circuit(input_qasm)
+    with metrics.stage('obfuscate'):
+        obfuscated_circuit = insert_obfuscation(original_circuit)
+    metrics.record_circuits(original_circuit, obfuscated_circuit)
+
+    if args.report:
+        # Start rendering in the background while the circuits are simulated
+        reports = render_reports(original_circuit, obfuscated_circuit)
 
     print("\nOriginal Circuit:")
     print(original_circuit.draw(output='text'))
@@ -171,8 +149,8 @@ def main():
     print(f"\nOriginal circuit depth: {original_depth}")
     print(f"Obfuscated circuit depth: {obfuscated_depth}")
 
-    original_results, original_time = execute_circuit(original_circuit)
-    obfuscated_results, obfuscated_time = execute_circuit(obfuscated_circuit)
+    original_results, original_time = execute_circuit(original_circuit, metrics)
+    obfuscated_results, obfuscated_time = execute_circuit(obfuscated_circuit, metrics)
 
     print("Original Results:")
     for key, value in original_results.items():
@@ -188,10 +166,18 @@ def main():
     print(f"Original Circuit Execution Time: {original_time:.4f} seconds")
     print(f"Obfuscated Circuit Execution Time: {obfuscated_time:.4f} seconds")
 
-    save_circuit_to_qasm3(obfuscated_circuit, output_qasm)
+    save_circuit_to_qasm3(obfuscated_circuit, output_qasm, metrics)
+    metrics.stop()
+    if args.metrics:
+        for filename in export_metrics(metrics, args.metrics):
+            print(f"Metrics written to {filename}")
 
     # Plot the circuits
-    plot_circuits(original_circuit, obfuscated_circuit)
+    if args.report:
+        for filename in wait_for_reports(reports):
+            print(f"Report written to {filename}")
+    else:
+        plot_circuits(original_circuit, obfuscated_circuit)
 
 if __name__ == "__main__":
     main()
@@ -1,27 +1,27 @@
-import sys
 import time
 import random
 from qiskit import QuantumCircuit, transpile
 from qiskit_aer import AerSimulator
-from qiskit.visualization import circuit_drawer
-import matplotlib.pyplot as plt
 from qiskit.qasm3 import dumps as qasm3_dumps
-
-def apply_complex_obfuscation(circuit, qr):
-    identity_sequences = [
-        ["y", "s", "y"],
-        ["h", "s", "h", "s", "h"],
-        ["x", "h", "z", "h", "x"],
-        ["h", "t", "t", "h", "t", "t", "h"],
-        ["z", "h", "y", "h", "z"],
-        ["s", "z", "sdg"],
-        ["t", "s", "tdg"],
-        ["swap", "x", "swap"],
-        ["y", "x", "y", "x", "y"]
-    ]
-
+from functions import load_circuit, parse_technique_args, plot_circuits, render_reports, wait_for_reports
+from instrumentation import JobMetrics, export_metrics, stage
+
+# Each sequence is an identity on its own (up to global phase), so any subset of them keeps the circuit equivalent
+identity_sequences = [
+    ["y", "s", "y", "s"],
+    ["h", "s", "h", "s", "h", "s"],
+    ["x", "h", "z", "h"],
+    ["h", "t", "t", "h", "t", "t", "h", "t", "t"],
+    ["z", "h", "x", "h"],
+    ["s", "z", "sdg", "z"],
+    ["t", "s", "tdg", "sdg"],
+    ["swap", "x", "swap", "swap", "x", "swap"],
+    ["y", "x", "y", "x"]
+]
+
+def apply_complex_obfuscation(circuit, qr, num_sequences=len(identity_sequences)):
     for qubit in qr:
-        random_sequences = random.sample(identity_sequences, k=len(identity_sequences))
+        random_sequences = random.sample(identity_sequences, k=num_sequences)
         for sequence in random_sequences:
             for gate in sequence:
                 if gate == "cx" or gate == "swap":
@@ -30,18 +30,18 @@ def apply_complex_obfuscation(circuit, qr):
                 else:
                     getattr(circuit, gate)(qubit)
 
-def obfuscate_circuit(circuit, qr, obfuscate=False):
+def obfuscate_circuit(circuit, qr, obfuscate=False, num_sequences=len(identity_sequences)):
     if obfuscate:
-        apply_complex_obfuscation(circuit, qr)
+        apply_complex_obfuscation(circuit, qr, num_sequences)
     return circuit
 
-def insert_obfuscation(circuit):
+def insert_obfuscation(circuit, num_sequences=len(identity_sequences)):
     new_circuit = QuantumCircuit(*circuit.qregs, *circuit.cregs)
     qr = circuit.qubits
     measurement_instructions = []
 
     # Apply obfuscation before the original gates
-    obfuscate_circuit(new_circuit, qr, obfuscate=True)
+    obfuscate_circuit(new_circuit, qr, obfuscate=True, num_sequences=num_sequences)
 
     for instr, qargs, cargs in circuit.data:
         if instr.name == 'measure':
@@ -50,14 +50,14 @@ def insert_obfuscation(circuit):
             new_circuit.append(instr, qargs, cargs)
 
     # Apply obfuscation after the original gates
-    obfuscate_circuit(new_circuit, qr, obfuscate=True)
+    obfuscate_circuit(new_circuit, qr, obfuscate=True, num_sequences=num_sequences)
 
     for instr, qargs, cargs in measurement_instructions:
         new_circuit.append(instr, qargs, cargs)
 
     return new_circuit
 
-def execute_circuit(circuit):
+def execute_circuit(circuit, metrics=None):
     simulator = AerSimulator()
     execution_times = []
     counts = None
@@ -65,9 +65,11 @@ def execute_circuit(circuit):
         start_time = time.time()
 
         # Transpile the circuit for the simulator
-        transpiled = transpile(circuit, simulator)
+        with stage(metrics, 'transpile'):
+            transpiled = transpile(circuit, simulator)
         # Run the transpiled circuit
-        result = simulator.run(transpiled, shots=1024).result()
+        with stage(metrics, 'simulator.run'):
+            result = simulator.run(transpiled, shots=1024).result()
         counts = result.get_counts()
 
         end_time = time.time()
@@ -90,51 +92,28 @@ def interpret_results(results):
         hidden_string = key
         print(f"Result: {hidden_string}, Count: {value}")
 
-def save_circuit_to_qasm3(circuit, filename):
-
-    qasm_output = qasm3_dumps(circuit)
+def save_circuit_to_qasm3(circuit, filename, metrics=None):
+    with stage(metrics, 'qasm3_dumps'):
+        qasm_output = qasm3_dumps(circuit)
     with open(filename, 'w') as f:
         f.write(qasm_output)
 
-def plot_circuits(original_circuit, obfuscated_circuit):
-    original_plot = circuit_drawer(original_circuit, output='mpl', style='clifford')
-    obfuscated_plot = circuit_drawer(obfuscated_circuit, output='mpl', style='clifford')
-
-    original_plot.savefig('original_circuit.png')
-    obfuscated_plot.savefig('obfuscated_circuit.png')
-
-    original_image = plt.imread('original_circuit.png')
-    obfuscated_image = plt.imread('obfuscated_circuit.png')
-
-    plt.figure(figsize=(12, 6))
-
-    plt.subplot(121)
-    plt.title('Original Circuit')
-    plt.imshow(original_image)
-    plt.axis('off')
-
-    plt.subplot(122)
-    plt.title('Obfuscated Circuit')
-    plt.imshow(obfuscated_image)
-    plt.axis('off')
-
-    plt.show()
-
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python DelayedGates.py input.qasm")
-        sys.exit(1)
-
-    input_qasm = sys.argv[1]
+    args = parse_technique_args('DelayedGates.py')
+    input_qasm = args.input_qasm
     output_qasm = 'DelayedGatesObf.qasm'
 
-    try:
-        original_circuit = QuantumCircuit.from_qasm_file(input_qasm)
-    except Exception:
-        from qiskit.qasm3 import loads as qasm3_loads
-        with open(input_qasm, 'r') as f:
-            original_circuit = qasm3_loads(f.read())
-    obfuscated_circuit = insert_obfuscation(original_circuit)
+    metrics = JobMetrics(input_qasm, technique='DelayedGates', trace_memory=args.metrics is not None, profile=args.profile)
+    metrics.start()
+    with metrics.stage('parse'):
+        original_circuit = load_circuit(input_qasm)
+    with metrics.stage('obfuscate'):
+        obfuscated_circuit = insert_obfuscation(original_circuit)
+    metrics.record_circuits(original_circuit, obfuscated_circuit)
+
+    if args.report:
+        # Start rendering in the background while the circuits are simulated
+        reports = render_reports(original_circuit, obfuscated_circuit)
 
     print("\nOriginal Circuit:")
     print(original_circuit.draw(output='text'))
@@ -148,8 +127,8 @@ def main():
     print(f"\nOriginal circuit depth: {original_depth}")
     print(f"Obfuscated circuit depth: {obfuscated_depth}")
 
-    original_results, original_time = execute_circuit(original_circuit)
-    obfuscated_results, obfuscated_time = execute_circuit(obfuscated_circuit)
+    original_results, original_time = execute_circuit(original_circuit, metrics)
+    obfuscated_results, obfuscated_time = execute_circuit(obfuscated_circuit, metrics)
 
     print("Original Results:")
     interpret_results(original_results)
@@ -162,10 +141,18 @@ def main():
     print(f"Original Circuit Execution Time: {original_time:.4f} seconds")
     print(f"Obfuscated Circuit Execution Time: {obfuscated_time:.4f} seconds")
 
-    save_circuit_to_qasm3(obfuscated_circuit, output_qasm)
+    save_circuit_to_qasm3(obfuscated_circuit, output_qasm, metrics)
+    metrics.stop()
+    if args.metrics:
+        for filename in export_metrics(metrics, args.metrics):
+            print(f"Metrics written to {filename}")
 
     # Plot the circuits
-    plot_circuits(original_circuit, obfuscated_circuit)
+    if args.report:
+        for filename in wait_for_reports(reports):
+            print(f"Report written to {filename}")
+    else:
+        plot_circuits(original_circuit, obfuscated_circuit)
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,10 @@
-import sys
 import random
 import time
-import matplotlib.pyplot as plt
 from qiskit import QuantumCircuit, transpile
 from qiskit_aer import AerSimulator
-from qiskit.visualization import circuit_drawer
 from qiskit.qasm3 import dumps as qasm3_dumps
+from functions import load_circuit, parse_technique_args, plot_circuits, render_reports, wait_for_reports
+from instrumentation import JobMetrics, export_metrics, stage
 def apply_dynamic_obfuscation(circuit, qr):
     gates = [
         ('h', 'h'), ('x', 'x'), ('z', 'z'), ('s', 'sdg'),
@@ -39,13 +38,13 @@ def apply_gate_pair(circuit, q, gate_pair):
         getattr(circuit, gate1)(q)
         getattr(circuit, gate2)(q)
 
-def obfuscate_circuit(circuit, obfuscate=False):
+def obfuscate_circuit(circuit, obfuscate=False, num_segments=3):
     if obfuscate:
         qr = circuit.qubits
         cr = circuit.clbits
         obfuscated_circuit = QuantumCircuit(len(qr), len(cr))
 
-        segment_length = max(1, len(circuit.data) // 3)  # Split circuit into ~3 segments
+        segment_length = max(1, len(circuit.data) // num_segments)  # Split circuit into ~num_segments segments
         measurement_instructions = []
 
         for i, (instr, qargs, cargs) in enumerate(circuit.data):
@@ -66,17 +65,19 @@ def obfuscate_circuit(circuit, obfuscate=False):
         return obfuscated_circuit
     return circuit
 
-def execute_circuit(circuit):
+def execute_circuit(circuit, metrics=None):
     simulator = AerSimulator()
     execution_times = []
     for _ in range(10):
         start_time = time.time()
 
         # Transpile explicitly
-        transpiled_circuit = transpile(circuit, simulator)
+        with stage(metrics, 'transpile'):
+            transpiled_circuit = transpile(circuit, simulator)
 
         # Run the transpiled circuit
-        result = simulator.run(transpiled_circuit, shots=1024).result()
+        with stage(metrics, 'simulator.run'):
+            result = simulator.run(transpiled_circuit, shots=1024).result()
         counts = result.get_counts()
 
         end_time = time.time()
@@ -99,52 +100,29 @@ def interpret_results(results):
     for key, value in results.items():
         print(f"Hidden string: {key}, Count: {value}")
 
-def save_circuit_to_qasm3(circuit, filename):
-
-    qasm_output = qasm3_dumps(circuit)
+def save_circuit_to_qasm3(circuit, filename, metrics=None):
+    with stage(metrics, 'qasm3_dumps'):
+        qasm_output = qasm3_dumps(circuit)
     with open(filename, 'w') as f:
         f.write(qasm_output)
 
-def plot_circuits(original_circuit, obfuscated_circuit):
-    original_plot = circuit_drawer(original_circuit, output='mpl', style='clifford')
-    obfuscated_plot = circuit_drawer(obfuscated_circuit, output='mpl', style='clifford')
-
-    original_plot.savefig('original_circuit.png')
-    obfuscated_plot.savefig('obfuscated_circuit.png')
-
-    original_image = plt.imread('original_circuit.png')
-    obfuscated_image = plt.imread('obfuscated_circuit.png')
-
-    plt.figure(figsize=(12, 6))
-
-    plt.subplot(121)
-    plt.title('Original Circuit')
-    plt.imshow(original_image)
-    plt.axis('off')
-
-    plt.subplot(122)
-    plt.title('Obfuscated Circuit')
-    plt.imshow(obfuscated_image)
-    plt.axis('off')
-
-    plt.show()
-
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python InverseGates.py input.qasm")
-        sys.exit(1)
-
-    input_qasm = sys.argv[1]
+    args = parse_technique_args('InverseGates.py')
+    input_qasm = args.input_qasm
     output_qasm = 'InverseGatesObf.qasm'
 
-    try:
-        original_circuit = QuantumCircuit.from_qasm_file(input_qasm)
-    except Exception:
-        from qiskit.qasm3 import loads as qasm3_loads
-        with open(input_qasm, 'r') as f:
-            original_circuit = qasm3_loads(f.read())
-    obfuscated_circuit = original_circuit.copy()
-    obfuscated_circuit = obfuscate_circuit(obfuscated_circuit, obfuscate=True)
+    metrics = JobMetrics(input_qasm, technique='InverseGates', trace_memory=args.metrics is not None, profile=args.profile)
+    metrics.start()
+    with metrics.stage('parse'):
+        original_circuit = load_circuit(input_qasm)
+    with metrics.stage('obfuscate'):
+        obfuscated_circuit = original_circuit.copy()
+        obfuscated_circuit = obfuscate_circuit(obfuscated_circuit, obfuscate=True)
+    metrics.record_circuits(original_circuit, obfuscated_circuit)
+
+    if args.report:
+        # Start rendering in the background while the circuits are simulated
+        reports = render_reports(original_circuit, obfuscated_circuit)
 
     print("\nOriginal Circuit:")
     print(original_circuit.draw(output='text'))
@@ -158,8 +136,8 @@ def main():
     print(f"\nOriginal circuit depth: {original_depth}")
     print(f"Obfuscated circuit depth: {obfuscated_depth}")
 
-    original_results, original_time = execute_circuit(original_circuit)
-    obfuscated_results, obfuscated_time = execute_circuit(obfuscated_circuit)
+    original_results, original_time = execute_circuit(original_circuit, metrics)
+    obfuscated_results, obfuscated_time = execute_circuit(obfuscated_circuit, metrics)
 
     print("Original Results:")
     interpret_results(original_results)
@@ -172,10 +150,18 @@ def main():
     print(f"Original Circuit Execution Time: {original_time:.4f} seconds")
     print(f"Obfuscated Circuit Execution Time: {obfuscated_time:.4f} seconds")
 
-    save_circuit_to_qasm3(obfuscated_circuit, output_qasm)
+    save_circuit_to_qasm3(obfuscated_circuit, output_qasm, metrics)
+    metrics.stop()
+    if args.metrics:
+        for filename in export_metrics(metrics, args.metrics):
+            print(f"Metrics written to {filename}")
 
     # Plot the circuits
-    plot_circuits(original_circuit, obfuscated_circuit)
+    if args.report:
+        for filename in wait_for_reports(reports):
+            print(f"Report written to {filename}")
+    else:
+        plot_circuits(original_circuit, obfuscated_circuit)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
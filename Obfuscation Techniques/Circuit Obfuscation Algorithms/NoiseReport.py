@@ -0,0 +1,118 @@
+import json
+import argparse
+from qiskit import transpile
+from qiskit.providers.fake_provider import GenericBackendV2
+from qiskit_aer import AerSimulator
+from qiskit_aer.noise import NoiseModel
+from functions import load_circuit, compare_results
+from techniques import obfuscate, DEFAULT_PARAMETERS
+
+
+def load_backend(name, num_qubits, seed):
+    # 'generic' needs nothing beyond qiskit; any other name is looked up in qiskit_ibm_runtime's
+    # offline snapshots of real devices (e.g. FakeSherbrooke), which ship with the package
+    if name == 'generic':
+        return GenericBackendV2(num_qubits=max(num_qubits, 2), seed=seed)
+    try:
+        from qiskit_ibm_runtime import fake_provider
+    except ImportError:
+        raise ValueError(f"Backend '{name}' needs qiskit_ibm_runtime. Install it or use --backend generic.")
+    if not hasattr(fake_provider, name):
+        raise ValueError(f"Unknown fake backend '{name}'.")
+    return getattr(fake_provider, name)()
+
+
+def instruction_properties(target, name, qubits):
+    if name not in target.operation_names:
+        return None
+    properties = target[name]
+    return properties.get(qubits) if qubits in properties else properties.get(None)
+
+
+def estimated_success_probability(circuit, target):
+    """ Product of (1 - error) over every operation, using the calibrated error of the qubits it runs on """
+    success = 1.0
+    for instr in circuit.data:
+        qubits = tuple(circuit.find_bit(qubit).index for qubit in instr.qubits)
+        properties = instruction_properties(target, instr.operation.name, qubits)
+        if properties is not None and properties.error is not None:
+            success *= 1.0 - properties.error
+    return success
+
+
+def schedule_duration(circuit, target):
+    """ As-soon-as-possible schedule length in seconds, computed in one pass over the circuit """
+    clock = [0.0] * circuit.num_qubits
+    for instr in circuit.data:
+        qubits = [circuit.find_bit(qubit).index for qubit in instr.qubits]
+        if not qubits:
+            continue
+        start = max(clock[qubit] for qubit in qubits)
+        if instr.operation.name == 'delay':
+            duration = instr.operation.duration * (target.dt or 1.0) if instr.operation.unit == 'dt' else 0.0
+        else:
+            properties = instruction_properties(target, instr.operation.name, tuple(qubits))
+            duration = properties.duration if properties is not None and properties.duration else 0.0
+        for qubit in qubits:
+            clock[qubit] = start + duration
+    return max(clock, default=0.0)
+
+
+def two_qubit_gate_count(circuit):
+    return sum(1 for instr in circuit.data if len(instr.qubits) == 2 and instr.operation.name != 'barrier')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the noisy-hardware cost of every circuit obfuscation technique")
+    parser.add_argument("input_qasm")
+    parser.add_argument("--backend", default='generic', help="'generic' or a qiskit_ibm_runtime fake backend class name, e.g. FakeSherbrooke")
+    parser.add_argument("--techniques", nargs='+', default=list(DEFAULT_PARAMETERS), choices=list(DEFAULT_PARAMETERS))
+    parser.add_argument("--optimization-level", type=int, default=1, choices=[0, 1, 2, 3])
+    parser.add_argument("--shots", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default='noise_report.json')
+    args = parser.parse_args()
+
+    original_circuit = load_circuit(args.input_qasm)
+    backend = load_backend(args.backend, original_circuit.num_qubits, args.seed)
+    target = backend.target
+
+    circuits = {'original': original_circuit}
+    for technique in args.techniques:
+        circuits[technique] = obfuscate(technique, original_circuit)
+
+    transpiled = {
+        name: transpile(circuit, backend, optimization_level=args.optimization_level, seed_transpiler=args.seed)
+        for name, circuit in circuits.items()
+    }
+
+    # Ideal reference counts, then every transpiled circuit in one batched noisy job
+    ideal_counts = AerSimulator().run(transpile(original_circuit, AerSimulator()), shots=args.shots).result().get_counts()
+    noisy_simulator = AerSimulator(noise_model=NoiseModel.from_backend(backend), seed_simulator=args.seed)
+    noisy_result = noisy_simulator.run(list(transpiled.values()), shots=args.shots).result()
+
+    report = {'backend': backend.name, 'optimization_level': args.optimization_level, 'shots': args.shots, 'circuits': {}}
+    for index, (name, circuit) in enumerate(transpiled.items()):
+        report['circuits'][name] = {
+            'depth': circuit.depth(),
+            'size': circuit.size(),
+            'two_qubit_gates': two_qubit_gate_count(circuit),
+            'schedule_duration': schedule_duration(circuit, target),
+            'estimated_success_probability': estimated_success_probability(circuit, target),
+            'simulated_accuracy': compare_results(ideal_counts, noisy_result.get_counts(index)),
+        }
+
+    print(f"Backend: {backend.name}")
+    print(f"{'Circuit':<15}{'Depth':>8}{'2Q gates':>10}{'Duration (us)':>15}{'ESP':>8}{'Accuracy':>10}")
+    for name, metrics in report['circuits'].items():
+        print(f"{name:<15}{metrics['depth']:>8}{metrics['two_qubit_gates']:>10}"
+              f"{metrics['schedule_duration'] * 1e6:>15.2f}{metrics['estimated_success_probability']:>8.3f}"
+              f"{metrics['simulated_accuracy']:>9.2f}%")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
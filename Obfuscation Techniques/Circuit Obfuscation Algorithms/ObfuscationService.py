@@ -0,0 +1,380 @@
+import os
+import sys
+import json
+import logging
+import queue
+import signal
+import socket
+import argparse
+import threading
+import http.client
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+from qiskit import transpile
+from qiskit.qasm3 import dumps as qasm3_dumps
+from qiskit_aer import AerSimulator
+from functions import parse_circuit, compare_results
+from techniques import obfuscate, TECHNIQUES, DEFAULT_PARAMETERS
+from instrumentation import JobMetrics, MetricsRegistry, logger
+
+# Everything expensive (qiskit, qiskit_aer, matplotlib and the techniques) is imported once above and
+# inherited by the worker processes, so a submission only pays for its own obfuscation and simulation.
+_simulator = None
+
+
+def _init_worker():
+    global _simulator
+    # Ctrl+C is handled by the service process, which lets running jobs finish and cancels queued ones
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _simulator = AerSimulator()
+
+
+def _job_metrics(request, job):
+    return JobMetrics(job, technique=request.get('technique', 'InverseGates'),
+                      trace_memory=request.get('trace_memory', True), profile=request.get('profile', False))
+
+
+def obfuscate_job(request, job):
+    metrics = _job_metrics(request, job)
+    metrics.start()
+    with metrics.stage('parse'):
+        original_circuit = parse_circuit(request['qasm'])
+    technique = request.get('technique', 'InverseGates')
+    with metrics.stage('obfuscate'):
+        obfuscated_circuit = obfuscate(technique, original_circuit, **request.get('params', {}))
+    metrics.record_circuits(original_circuit, obfuscated_circuit)
+    with metrics.stage('qasm3_dumps'):
+        qasm = qasm3_dumps(obfuscated_circuit)
+    metrics.stop()
+    event = {
+        'status': 'obfuscated',
+        'technique': technique,
+        'original_depth': original_circuit.depth(),
+        'obfuscated_depth': obfuscated_circuit.depth(),
+        'qasm': qasm,
+    }
+    return event, original_circuit, obfuscated_circuit, metrics.to_dict(), metrics.profile_text()
+
+
+def execute_job(request, job, original_circuit, obfuscated_circuit):
+    metrics = _job_metrics(request, job)
+    metrics.start()
+    shots = request.get('shots', 1024)
+    counts = []
+    for circuit in (original_circuit, obfuscated_circuit):
+        with metrics.stage('transpile'):
+            transpiled = transpile(circuit, _simulator)
+        with metrics.stage('simulator.run'):
+            counts.append(_simulator.run(transpiled, shots=shots).result().get_counts())
+    metrics.stop()
+    event = {
+        'status': 'executed',
+        'original_counts': counts[0],
+        'obfuscated_counts': counts[1],
+        'semantic_accuracy': compare_results(counts[0], counts[1]),
+    }
+    return event, metrics.to_dict(), metrics.profile_text()
+
+
+def validate_request(request):
+    if not isinstance(request, dict):
+        raise ValueError("Request body must be a JSON object")
+    if not isinstance(request.get('qasm'), str):
+        raise ValueError("Missing 'qasm' field")
+    technique = request.get('technique', 'InverseGates')
+    if not isinstance(technique, str):
+        raise ValueError("'technique' must be a string")
+    if technique not in TECHNIQUES:
+        raise ValueError(f"Unknown technique '{technique}'")
+    params = request.get('params', {})
+    if not isinstance(params, dict):
+        raise ValueError("'params' must be a JSON object")
+    unknown = sorted(set(params) - set(DEFAULT_PARAMETERS[technique]))
+    if unknown:
+        accepted = ', '.join(DEFAULT_PARAMETERS[technique]) or 'none'
+        raise ValueError(f"Unknown parameters for {technique}: {', '.join(unknown)} (accepted: {accepted})")
+    for flag in ('execute', 'profile', 'trace_memory'):
+        if not isinstance(request.get(flag, False), bool):
+            raise ValueError(f"'{flag}' must be a boolean")
+    shots = request.get('shots', 1024)
+    if isinstance(shots, bool) or not isinstance(shots, int) or shots <= 0:
+        raise ValueError("'shots' must be a positive integer")
+
+
+class ObfuscationService:
+    """ Runs submissions on a bounded process pool and rejects new ones once `max_pending` are in flight """
+
+    def __init__(self, workers=4, max_pending=16):
+        # Obfuscation and transpilation are CPU-bound Python, so each worker is a process with its own simulator
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.active = {}
+        self.next_job = 0
+        self.completed = 0
+        self.metrics = MetricsRegistry()
+        self.job_metrics = {}
+
+    def try_submit(self, request):
+        """ Queue a request and return the queue its events are streamed to, or None when the service is full """
+        if not self.slots.acquire(blocking=False):
+            return None
+        events = queue.Queue()
+        events.put({'status': 'queued'})
+        with self.lock:
+            job = self.next_job
+            self.next_job += 1
+            self.active[job] = events
+        try:
+            future = self.executor.submit(obfuscate_job, request, job)
+        except RuntimeError as e:
+            self._finish(job, {'status': 'error', 'error': f"RuntimeError: {e}"})
+            return events
+        future.add_done_callback(lambda f: self._obfuscated(job, request, f))
+        return events
+
+    def _obfuscated(self, job, request, future):
+        try:
+            event, original_circuit, obfuscated_circuit, metrics, profile = future.result()
+        except Exception as e:
+            self._finish(job, {'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+            return
+        self._put(job, event)
+        self._merge_metrics(job, metrics, profile)
+        if not request.get('execute', False):
+            self._finish(job, {'status': 'done'})
+            return
+        try:
+            next_future = self.executor.submit(execute_job, request, job, original_circuit, obfuscated_circuit)
+        except RuntimeError as e:
+            self._finish(job, {'status': 'error', 'error': f"RuntimeError: {e}"})
+            return
+        next_future.add_done_callback(lambda f: self._executed(job, f))
+
+    def _executed(self, job, future):
+        try:
+            event, metrics, profile = future.result()
+            self._put(job, event)
+            self._merge_metrics(job, metrics, profile)
+        except Exception as e:
+            self._finish(job, {'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+            return
+        self._finish(job, {'status': 'done'})
+
+    def _merge_metrics(self, job, metrics, profile):
+        # A job's stages are split over two worker calls; combine them before it is logged and exported
+        with self.lock:
+            combined = self.job_metrics.setdefault(job, {'job': job, 'technique': metrics['technique'], 'total_seconds': 0.0,
+                                                         'stages': {}, 'counters': {}, 'peak_memory_bytes': None})
+        combined['total_seconds'] += metrics['total_seconds']
+        combined['stages'].update(metrics['stages'])
+        combined['counters'].update(metrics['counters'])
+        if metrics['peak_memory_bytes'] is not None:
+            combined['peak_memory_bytes'] = max(combined['peak_memory_bytes'] or 0, metrics['peak_memory_bytes'])
+        if profile is not None:
+            combined.setdefault('profiles', []).append(profile)
+
+    def _put(self, job, event):
+        with self.lock:
+            events = self.active.get(job)
+        if events is not None:
+            events.put(event)
+
+    def _finish(self, job, event):
+        # Every job ends with exactly one final event and the None sentinel, however it ends
+        with self.lock:
+            events = self.active.pop(job, None)
+            if events is None:
+                return
+            self.completed += 1
+            metrics = self.job_metrics.pop(job, None)
+        if metrics is not None:
+            profiles = metrics.pop('profiles', None)
+            self.metrics.observe(metrics)
+            logger.info(json.dumps(metrics))
+            events.put({'status': 'metrics', **metrics, **({'profiles': profiles} if profiles else {})})
+        events.put(event)
+        events.put(None)
+        self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {'workers': self.workers, 'max_pending': self.max_pending, 'pending': len(self.active),
+                    'completed': self.completed, 'techniques': list(TECHNIQUES)}
+
+    def shutdown(self):
+        # Release every handler still streaming before the queued work is dropped
+        with self.lock:
+            jobs = list(self.active)
+        for job in jobs:
+            self._finish(job, {'status': 'error', 'error': 'Service is shutting down'})
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def _send_json(self, code, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, payload):
+        line = (json.dumps(payload) + '\n').encode()
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, self.server.service.stats())
+        elif self.path == '/metrics':
+            body = self.server.service.metrics.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path != '/obfuscate':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            validate_request(request)
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+
+        events = self.server.service.try_submit(request)
+        if events is None:
+            # Back-pressure: tell the client to retry instead of queueing without bound
+            self._send_json(503, {'error': 'Service is at capacity'}, headers={'Retry-After': '1'})
+            return
+
+        # Stream newline-delimited JSON events as the job progresses
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            while (event := events.get()) is not None:
+                self._send_chunk(event)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away; the job still finishes and frees its slot
+            self.close_connection = True
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def serve(service, host='127.0.0.1', port=8765, unix_socket=None):
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server = UnixHTTPServer(unix_socket, ServiceRequestHandler)
+        address = unix_socket
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+        address = f"http://{host}:{server.server_port}"
+    server.service = service
+    print(f"Obfuscation service listening on {address} "
+          f"({service.workers} workers, up to {service.max_pending} pending submissions)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        service.shutdown()
+        if unix_socket and os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+
+
+def submit(qasm, technique='InverseGates', params=None, execute=False, shots=1024,
+           host='127.0.0.1', port=8765, unix_socket=None, timeout=300, profile=False, trace_memory=True):
+    """ Submit a circuit to a running service and yield its events as they are streamed back """
+    connection = UnixHTTPConnection(unix_socket, timeout=timeout) if unix_socket else http.client.HTTPConnection(host, port, timeout=timeout)
+    body = json.dumps({'qasm': qasm, 'technique': technique, 'params': params or {}, 'execute': execute, 'shots': shots,
+                       'profile': profile, 'trace_memory': trace_memory})
+    try:
+        connection.request('POST', '/obfuscate', body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        if response.status != 200:
+            yield {'status': 'rejected', 'code': response.status, **json.loads(response.read())}
+            return
+        for line in response:
+            yield json.loads(line)
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running local circuit obfuscation service")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="Start the service")
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    serve_parser.add_argument("--max-pending", type=int, default=16, help="Submissions in flight before new ones get 503")
+
+    submit_parser = subparsers.add_parser('submit', help="Submit a QASM file to a running service")
+    submit_parser.add_argument("input_qasm")
+    submit_parser.add_argument("--technique", default='InverseGates', choices=list(TECHNIQUES))
+    submit_parser.add_argument("--params", default='{}', help="Technique parameters as JSON, e.g. '{\"num_segments\": 4}'")
+    submit_parser.add_argument("--execute", action="store_true", help="Also simulate both circuits")
+    submit_parser.add_argument("--shots", type=int, default=1024)
+    submit_parser.add_argument("--profile", action="store_true", help="Capture a cProfile of the job's worker stages")
+    submit_parser.add_argument("--no-trace-memory", action="store_true", help="Skip tracemalloc peak-memory tracking")
+
+    for subparser in (serve_parser, submit_parser):
+        subparser.add_argument("--host", default='127.0.0.1')
+        subparser.add_argument("--port", type=int, default=8765)
+        subparser.add_argument("--unix-socket", default=None, help="Listen on / connect to this Unix socket instead of TCP")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        # One JSON line of per-stage metrics is logged for every finished job
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+        serve(ObfuscationService(args.workers, args.max_pending), args.host, args.port, args.unix_socket)
+        return
+
+    with open(args.input_qasm, 'r') as f:
+        qasm = f.read()
+    for event in submit(qasm, args.technique, json.loads(args.params), args.execute, args.shots,
+                        args.host, args.port, args.unix_socket, profile=args.profile, trace_memory=not args.no_trace_memory):
+        for profile in event.pop('profiles', []):
+            print(profile)
+        print(json.dumps(event, indent=2) if event['status'] in ('obfuscated', 'executed', 'metrics') else json.dumps(event))
+        if event['status'] in ('rejected', 'error'):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
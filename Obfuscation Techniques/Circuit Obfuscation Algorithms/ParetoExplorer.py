@@ -0,0 +1,180 @@
+import sys
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from qiskit import transpile
+from qiskit_aer import AerSimulator
+from qiskit.quantum_info import Statevector
+from functions import load_circuit, compare_results
+from techniques import obfuscate, DEFAULT_PARAMETERS
+
+# Values swept for every knob; add a technique's knob here to include it in the search
+PARAMETER_GRID = {
+    'InverseGates': {'num_segments': [1, 2, 3, 4, 6, 8]},
+    'CompositeGates': {'encapsulate_probability': [0.0, 0.25, 0.5, 0.75, 1.0]},
+    'DelayedGates': {'num_sequences': [1, 2, 3, 5, 7, 9]},
+    'CloakedGates': {},
+}
+
+COST_METRICS = ['depth_overhead', 'gate_overhead', 'transpiled_size_overhead', 'simulation_time_overhead']
+
+
+def parameter_settings(technique):
+    grid = PARAMETER_GRID.get(technique, {})
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def gate_count(circuit):
+    return sum(1 for instr in circuit.data if instr.operation.name not in ('measure', 'barrier'))
+
+
+def simulation_time(simulator, transpiled, shots, repeats):
+    # One untimed warm-up run, then the fastest of the timed runs to damp noise from the other workers
+    counts = simulator.run(transpiled, shots=shots).result().get_counts()
+    execution_times = []
+    for _ in range(repeats):
+        start_time = time.time()
+        simulator.run(transpiled, shots=shots).result()
+        execution_times.append(time.time() - start_time)
+    return counts, min(execution_times)
+
+
+def output_distribution(circuit):
+    # Exact probabilities of the measured outcome; only defined when every measurement is terminal
+    unmeasured = circuit.remove_final_measurements(inplace=False)
+    if any(instr.operation.name == 'measure' for instr in unmeasured.data):
+        return None
+    return Statevector(unmeasured).probabilities_dict()
+
+
+def semantic_accuracy(original, obfuscated, original_counts, obfuscated_counts):
+    """ Overlap of the exact output distributions, falling back to the sampled counts for mid-circuit measurements """
+    original_distribution = output_distribution(original)
+    obfuscated_distribution = output_distribution(obfuscated)
+    if original_distribution is None or obfuscated_distribution is None:
+        return compare_results(original_counts, obfuscated_counts)
+    keys = set(original_distribution).union(obfuscated_distribution)
+    overlap = sum(min(original_distribution.get(key, 0), obfuscated_distribution.get(key, 0)) for key in keys)
+    return round(100 * overlap, 6)
+
+
+def ratio(obfuscated, original):
+    if not original:
+        return 1.0 if not obfuscated else float('inf')
+    return obfuscated / original
+
+
+def evaluate_setting(job):
+    """ Obfuscate one circuit with one parameter setting and measure what it costs and how much of it survives """
+    technique, params, circuit_name, circuit, shots, repeats = job
+    simulator = AerSimulator()
+    obfuscated = obfuscate(technique, circuit, **params)
+
+    original_transpiled = transpile(circuit, simulator)
+    obfuscated_transpiled = transpile(obfuscated, simulator)
+    original_counts, original_time = simulation_time(simulator, original_transpiled, shots, repeats)
+    obfuscated_counts, obfuscated_time = simulation_time(simulator, obfuscated_transpiled, shots, repeats)
+
+    # Gates the optimizer cannot cancel are the part of the obfuscation that survives compilation
+    original_optimized = gate_count(transpile(circuit, simulator, optimization_level=3))
+    obfuscated_optimized = gate_count(transpile(obfuscated, simulator, optimization_level=3))
+    inserted = max(0, gate_count(obfuscated_transpiled) - gate_count(original_transpiled))
+    surviving = max(0, obfuscated_optimized - original_optimized)
+
+    return {
+        'technique': technique,
+        'params': params,
+        'circuit': circuit_name,
+        'depth_overhead': ratio(obfuscated.depth(), circuit.depth()),
+        'gate_overhead': ratio(gate_count(obfuscated), gate_count(circuit)),
+        'transpiled_size_overhead': ratio(obfuscated_transpiled.size(), original_transpiled.size()),
+        'simulation_time_overhead': ratio(obfuscated_time, original_time),
+        'survival': surviving / inserted if inserted else 0.0,
+        'strength': surviving / original_optimized if original_optimized else float(surviving),
+        'semantic_accuracy': semantic_accuracy(circuit, obfuscated, original_counts, obfuscated_counts),
+    }
+
+
+def aggregate(measurements):
+    """ Average the per-circuit measurements of every (technique, params) setting """
+    settings = {}
+    for measurement in measurements:
+        key = (measurement['technique'], json.dumps(measurement['params'], sort_keys=True))
+        settings.setdefault(key, []).append(measurement)
+
+    summary = []
+    for (technique, _), runs in settings.items():
+        entry = {'technique': technique, 'params': runs[0]['params'], 'circuits': len(runs)}
+        for metric in COST_METRICS + ['survival', 'strength', 'semantic_accuracy']:
+            entry[metric] = sum(run[metric] for run in runs) / len(runs)
+        summary.append(entry)
+    return summary
+
+
+def pareto_front(summary, cost_metric):
+    """ Settings for which no other setting is both cheaper and stronger """
+    front = []
+    for candidate in summary:
+        dominated = any(
+            other[cost_metric] <= candidate[cost_metric] and other['strength'] >= candidate['strength']
+            and (other[cost_metric] < candidate[cost_metric] or other['strength'] > candidate['strength'])
+            for other in summary
+        )
+        if not dominated:
+            front.append(candidate)
+    return sorted(front, key=lambda entry: entry[cost_metric])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep technique parameters and report the overhead-versus-strength Pareto front")
+    parser.add_argument("circuits", nargs='+', help="Sample of QASM circuits to evaluate every setting on")
+    parser.add_argument("--techniques", nargs='+', default=list(DEFAULT_PARAMETERS), choices=list(DEFAULT_PARAMETERS))
+    parser.add_argument("--cost", default='simulation_time_overhead', choices=COST_METRICS, help="Overhead metric to trade against strength")
+    parser.add_argument("--budget", type=float, default=None, help="Only keep settings whose cost overhead is at most this ratio")
+    parser.add_argument("--min-accuracy", type=float, default=100.0,
+                        help="Drop settings whose semantic accuracy (in %%) is below this before building the front")
+    parser.add_argument("--shots", type=int, default=1024)
+    parser.add_argument("--repeats", type=int, default=5, help="Timed simulation runs per circuit")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per core)")
+    parser.add_argument("--output", default='pareto_front.json')
+    args = parser.parse_args()
+
+    circuits = [(filename, load_circuit(filename)) for filename in args.circuits]
+    jobs = [
+        (technique, params, filename, circuit, args.shots, args.repeats)
+        for technique in args.techniques
+        for params in parameter_settings(technique)
+        for filename, circuit in circuits
+    ]
+    print(f"Evaluating {len(jobs)} (setting, circuit) pairs...")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        measurements = list(executor.map(evaluate_setting, jobs))
+
+    summary = aggregate(measurements)
+    # A setting that changes the circuit's output is never a valid trade-off, however cheap or strong
+    candidates = [entry for entry in summary if entry['semantic_accuracy'] >= args.min_accuracy]
+    if args.budget is not None:
+        candidates = [entry for entry in candidates if entry[args.cost] <= args.budget]
+    if not candidates:
+        print("No setting fits within the given budget and accuracy threshold.")
+        sys.exit(1)
+    front = pareto_front(candidates, args.cost)
+
+    print(f"\nPareto front ({args.cost} vs strength):")
+    for entry in front:
+        print(f"{entry['technique']:<15} {json.dumps(entry['params']):<35} "
+              f"cost: {entry[args.cost]:.2f}x  strength: {entry['strength']:.2f}  "
+              f"survival: {entry['survival'] * 100:.1f}%  accuracy: {entry['semantic_accuracy']:.2f}%")
+
+    with open(args.output, 'w') as f:
+        json.dump({'cost_metric': args.cost, 'pareto_front': front, 'settings': summary, 'measurements': measurements}, f, indent=2)
+    print(f"\nFull results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
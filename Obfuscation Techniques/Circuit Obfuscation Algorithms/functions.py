@@ -2,14 +2,190 @@ from qiskit import QuantumCircuit, transpile
 from qiskit_aer import AerSimulator
 from qiskit.qasm2 import dumps
 import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from qiskit.visualization import circuit_drawer
 
+def load_circuit(filename: str) -> QuantumCircuit:
+    try:
+        return QuantumCircuit.from_qasm_file(filename)
+    except Exception:
+        from qiskit.qasm3 import loads as qasm3_loads
+        with open(filename, 'r') as f:
+            return qasm3_loads(f.read())
+
+def parse_circuit(qasm: str) -> QuantumCircuit:
+    try:
+        return QuantumCircuit.from_qasm_str(qasm)
+    except Exception:
+        from qiskit.qasm3 import loads as qasm3_loads
+        return qasm3_loads(qasm)
+
 def save_circuit_to_qasm(circuit: QuantumCircuit, filename: str) -> None:
     with open(filename, 'w') as f:
         f.write(dumps(circuit))
         
+# Circuits with more gates than this are only drawn as summaries; full diagrams take minutes and gigabytes
+FULL_DRAW_THRESHOLD = 500
+SUMMARY_BINS = 100
+SUMMARY_TOP_GATES = 8
+
+def parse_technique_args(script_name: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(usage=f"python {script_name} input.qasm [--report] [--metrics PREFIX [--profile]]")
+    parser.add_argument("input_qasm")
+    parser.add_argument("--report", action="store_true",
+                        help="Render headless summary reports in the background instead of opening circuit diagrams")
+    parser.add_argument("--metrics", metavar="PREFIX", default=None,
+                        help="Write per-stage timers, circuit counters and the tracemalloc peak to PREFIX.json and PREFIX.prom")
+    parser.add_argument("--profile", action="store_true", help="Also capture a cProfile of the run to PREFIX.prof")
+    args = parser.parse_args()
+    if args.profile and args.metrics is None:
+        # The profile is written next to the metrics, so without a prefix there is nowhere to put it
+        parser.error("--profile requires --metrics PREFIX")
+    return args
+
+def summarize_circuit(circuit: QuantumCircuit) -> dict:
+    """ Layer of every gate, per-layer gate histograms and per-qubit activity, computed in one pass """
+    qubit_index = {bit: i for i, bit in enumerate(circuit.qubits)}
+    clbit_index = {bit: i for i, bit in enumerate(circuit.clbits)}
+    qubit_frontier = [0] * circuit.num_qubits
+    clbit_frontier = [0] * circuit.num_clbits
+    layer_histograms = []
+    qubit_layers = [[] for _ in range(circuit.num_qubits)]
+    gate_counts = {}
+
+    for instr in circuit.data:
+        name = instr.operation.name
+        if name == 'barrier':
+            continue
+        qubits = [qubit_index[bit] for bit in instr.qubits]
+        clbits = [clbit_index[bit] for bit in instr.clbits]
+        layer = max([qubit_frontier[q] for q in qubits] + [clbit_frontier[c] for c in clbits], default=0)
+        for q in qubits:
+            qubit_frontier[q] = layer + 1
+            qubit_layers[q].append(layer)
+        for c in clbits:
+            clbit_frontier[c] = layer + 1
+        if layer == len(layer_histograms):
+            layer_histograms.append({})
+        layer_histograms[layer][name] = layer_histograms[layer].get(name, 0) + 1
+        gate_counts[name] = gate_counts.get(name, 0) + 1
+
+    return {
+        'num_qubits': circuit.num_qubits,
+        'size': sum(gate_counts.values()),
+        'depth': len(layer_histograms),
+        'gate_counts': gate_counts,
+        'layer_sizes': [sum(histogram.values()) for histogram in layer_histograms],
+        'layer_histograms': layer_histograms,
+        'qubit_layers': qubit_layers,
+    }
+
+def _qubit_activity(summary: dict, bins: int) -> list:
+    # Gates per qubit in each of `bins` equal slices of the circuit's depth (one slice per layer for shallow circuits)
+    depth = max(summary['depth'], 1)
+    bins = min(bins, depth)
+    activity = [[0] * bins for _ in range(summary['num_qubits'])]
+    for qubit, layers in enumerate(summary['qubit_layers']):
+        for layer in layers:
+            activity[qubit][layer * bins // depth] += 1
+    return activity
+
+def draw_summary(figure, original_summary: dict, obfuscated_summary: dict, bins: int = SUMMARY_BINS) -> None:
+    axes = figure.subplot_mosaic([['depth', 'depth'], ['histogram', 'histogram'],
+                                  ['original', 'obfuscated'], ['overhead', 'overhead']])
+    depth_axes, histogram_axes = axes['depth'], axes['histogram']
+
+    depth_axes.plot(original_summary['layer_sizes'], label=f"Original (depth {original_summary['depth']})")
+    depth_axes.plot(obfuscated_summary['layer_sizes'], label=f"Obfuscated (depth {obfuscated_summary['depth']})")
+    depth_axes.set_title('Depth profile')
+    depth_axes.set_xlabel('Layer')
+    depth_axes.set_ylabel('Gates in layer')
+    depth_axes.legend()
+
+    # Stacked per-layer gate histogram of the obfuscated circuit, layers grouped into at most `bins` bars
+    histograms = obfuscated_summary['layer_histograms']
+    group = max(1, -(-len(histograms) // bins))
+    top_gates = sorted(obfuscated_summary['gate_counts'], key=obfuscated_summary['gate_counts'].get, reverse=True)[:SUMMARY_TOP_GATES]
+    positions = list(range(0, len(histograms), group))
+    bottom = [0] * len(positions)
+    for name in top_gates + ['other']:
+        heights = []
+        for start in positions:
+            heights.append(sum(
+                sum(count for gate, count in histogram.items() if gate not in top_gates) if name == 'other' else histogram.get(name, 0)
+                for histogram in histograms[start:start + group]))
+        histogram_axes.bar(positions, heights, width=group, bottom=bottom, align='edge', label=name)
+        bottom = [b + h for b, h in zip(bottom, heights)]
+    histogram_axes.set_title('Obfuscated gate histogram per layer')
+    histogram_axes.set_xlabel('Layer')
+    histogram_axes.legend(ncol=3, fontsize='small')
+
+    # Per-qubit activity over each circuit's own depth; the two maps are side by side, not subtracted,
+    # because the slices of circuits with different depths do not line up
+    original_activity = _qubit_activity(original_summary, bins)
+    obfuscated_activity = _qubit_activity(obfuscated_summary, bins)
+    peak = max([max(row, default=0) for row in original_activity + obfuscated_activity], default=0) or 1
+    for key, title, activity in (('original', 'Original', original_activity), ('obfuscated', 'Obfuscated', obfuscated_activity)):
+        image = axes[key].imshow(activity, aspect='auto', cmap='viridis', interpolation='nearest', vmin=0, vmax=peak)
+        axes[key].set_title(f'{title} per-qubit activity')
+        axes[key].set_xlabel(f'Circuit progress ({len(activity[0]) if activity else 0} slices)')
+        axes[key].set_ylabel('Qubit')
+    figure.colorbar(image, ax=[axes['original'], axes['obfuscated']], label='Gates per slice')
+
+    # Per-qubit overhead on a shared axis: gates added to each qubit over the whole circuit
+    qubits = list(range(original_summary['num_qubits']))
+    overhead = [len(obfuscated_summary['qubit_layers'][q]) - len(original_summary['qubit_layers'][q]) for q in qubits]
+    axes['overhead'].bar(qubits, overhead)
+    axes['overhead'].set_title('Per-qubit gate overhead')
+    axes['overhead'].set_xticks(qubits if len(qubits) <= 32 else qubits[::len(qubits) // 32 + 1])
+    axes['overhead'].set_xlabel('Qubit')
+    axes['overhead'].set_ylabel('Added gates')
+
+def _render_summary_report(original_summary: dict, obfuscated_summary: dict, filename: str) -> str:
+    figure = Figure(figsize=(12, 14), layout='constrained')
+    draw_summary(figure, original_summary, obfuscated_summary)
+    figure.savefig(filename)
+    return filename
+
+def _render_full_diagram(circuit: QuantumCircuit, filename: str) -> str:
+    figure = circuit_drawer(circuit, output='mpl', style='clifford', filename=filename)
+    plt.close(figure)
+    return filename
+
+def _init_render_worker() -> None:
+    matplotlib.use('Agg')
+
+_render_executor = None
+
+def render_reports(original_circuit: QuantumCircuit, obfuscated_circuit: QuantumCircuit,
+                   report_filename: str = 'circuit_summary.png', original_filename: str = 'original_circuit.png',
+                   obfuscated_filename: str = 'obfuscated_circuit.png') -> list:
+    """ Queue headless renders on a background worker process and return their futures """
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ProcessPoolExecutor(max_workers=1, initializer=_init_render_worker)
+
+    original_summary = summarize_circuit(original_circuit)
+    obfuscated_summary = summarize_circuit(obfuscated_circuit)
+    reports = [_render_executor.submit(_render_summary_report, original_summary, obfuscated_summary, report_filename)]
+    if max(original_summary['size'], obfuscated_summary['size']) <= FULL_DRAW_THRESHOLD:
+        reports.append(_render_executor.submit(_render_full_diagram, original_circuit, original_filename))
+        reports.append(_render_executor.submit(_render_full_diagram, obfuscated_circuit, obfuscated_filename))
+    return reports
+
+def wait_for_reports(reports: list) -> list:
+    return [report.result() for report in reports]
+
 def plot_circuits(original_circuit: QuantumCircuit, obfuscated_circuit: QuantumCircuit, original_filename: str = 'original_circuit.png', obfuscated_filename: str ='obfuscated_circuit.png') -> None:
+    if max(original_circuit.size(), obfuscated_circuit.size()) > FULL_DRAW_THRESHOLD:
+        draw_summary(plt.figure(figsize=(12, 14), layout='constrained'), summarize_circuit(original_circuit), summarize_circuit(obfuscated_circuit))
+        plt.show()
+        return
+
     original_plot = circuit_drawer(original_circuit, output='mpl', style='clifford', filename=original_filename)
     obfuscated_plot = circuit_drawer(obfuscated_circuit, output='mpl', style='clifford', filename=obfuscated_filename)
     plt.close(original_plot)
@@ -39,3 +215,10 @@ def execute_circuit(circuit: QuantumCircuit):
     average_execution_time = sum(execution_times) / len(execution_times)
     return result.get_counts(), average_execution_time
 
+def compare_results(original: dict, obfuscated: dict) -> float:
+    keys = set(original.keys()).union(obfuscated.keys())
+    total = sum(original.values())
+    correct = 0
+    for key in keys:
+        correct += min(original.get(key, 0), obfuscated.get(key, 0))
+    return 100 * correct / total if total > 0 else 0
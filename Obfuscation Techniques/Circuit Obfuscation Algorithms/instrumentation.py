@@ -0,0 +1,163 @@
+import io
+import json
+import time
+import cProfile
+import logging
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger('obfusqate.metrics')
+
+PROFILE_LINES = 25
+
+
+class JobMetrics:
+    """ Per-stage timers, circuit counters, tracemalloc peak and an optional cProfile capture for one job """
+
+    def __init__(self, job, technique=None, trace_memory=True, profile=False):
+        self.job = job
+        self.technique = technique
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self.stages = {}
+        self.counters = {}
+        self.peak_memory = None
+        self.profiler = None
+        self._started_tracing = False
+        self._start_time = None
+        self.total_time = None
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        if self.trace_memory:
+            # Only stop tracing at the end if this job was the one that started it
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self._started_tracing:
+                tracemalloc.stop()
+        self.total_time = time.perf_counter() - self._start_time
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start_time
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def record_circuits(self, original_circuit, obfuscated_circuit):
+        self.count('original_gates', original_circuit.size())
+        self.count('obfuscated_gates', obfuscated_circuit.size())
+        self.count('original_depth', original_circuit.depth())
+        self.count('obfuscated_depth', obfuscated_circuit.depth())
+        self.count('inserted_gates', obfuscated_circuit.size() - original_circuit.size())
+
+    def profile_text(self, lines=PROFILE_LINES):
+        if self.profiler is None:
+            return None
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative').print_stats(lines)
+        return stream.getvalue()
+
+    def to_dict(self):
+        return {
+            'job': self.job,
+            'technique': self.technique,
+            'total_seconds': self.total_time,
+            'stages': self.stages,
+            'counters': self.counters,
+            'peak_memory_bytes': self.peak_memory,
+        }
+
+
+def stage(metrics, name):
+    """ `metrics.stage(name)`, or a no-op when the caller is not collecting metrics """
+    return metrics.stage(name) if metrics is not None else nullcontext()
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items() if value is not None) + '}'
+
+
+class MetricsRegistry:
+    """ Aggregates finished jobs (as produced by JobMetrics.to_dict) and renders them in Prometheus text format """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.stage_seconds = {}
+        self.stage_runs = {}
+        self.counters = {}
+        self.peak_memory = {}
+
+    def observe(self, job_metrics):
+        technique = job_metrics.get('technique') or 'unknown'
+        with self.lock:
+            self.jobs[technique] = self.jobs.get(technique, 0) + 1
+            for name, seconds in job_metrics['stages'].items():
+                key = (technique, name)
+                self.stage_seconds[key] = self.stage_seconds.get(key, 0.0) + seconds
+                self.stage_runs[key] = self.stage_runs.get(key, 0) + 1
+            for name, value in job_metrics['counters'].items():
+                key = (technique, name)
+                self.counters[key] = self.counters.get(key, 0) + value
+            if job_metrics.get('peak_memory_bytes') is not None:
+                self.peak_memory[technique] = max(self.peak_memory.get(technique, 0), job_metrics['peak_memory_bytes'])
+
+    def to_prometheus(self):
+        with self.lock:
+            lines = [
+                '# HELP obfusqate_jobs_total Jobs finished per technique.',
+                '# TYPE obfusqate_jobs_total counter',
+            ]
+            lines += [f'obfusqate_jobs_total{_labels(technique=t)} {n}' for t, n in self.jobs.items()]
+            lines += [
+                '# HELP obfusqate_stage_seconds Time spent in each technique stage.',
+                '# TYPE obfusqate_stage_seconds summary',
+            ]
+            for (t, name), seconds in self.stage_seconds.items():
+                lines.append(f'obfusqate_stage_seconds_sum{_labels(technique=t, stage=name)} {seconds:.6f}')
+                lines.append(f'obfusqate_stage_seconds_count{_labels(technique=t, stage=name)} {self.stage_runs[(t, name)]}')
+            lines += [
+                '# HELP obfusqate_circuit_total Gate, depth and inserted-gate counters summed over jobs.',
+                '# TYPE obfusqate_circuit_total counter',
+            ]
+            lines += [f'obfusqate_circuit_total{_labels(technique=t, counter=name)} {value}'
+                      for (t, name), value in self.counters.items()]
+            lines += [
+                '# HELP obfusqate_peak_memory_bytes Highest tracemalloc peak of any job.',
+                '# TYPE obfusqate_peak_memory_bytes gauge',
+            ]
+            lines += [f'obfusqate_peak_memory_bytes{_labels(technique=t)} {peak}' for t, peak in self.peak_memory.items()]
+        return '\n'.join(lines) + '\n'
+
+
+def export_metrics(metrics, prefix):
+    """ Write <prefix>.json, <prefix>.prom and, when profiling was on, <prefix>.prof; returns the written paths """
+    registry = MetricsRegistry()
+    registry.observe(metrics.to_dict())
+    paths = [f'{prefix}.json', f'{prefix}.prom']
+    with open(paths[0], 'w') as f:
+        json.dump(metrics.to_dict(), f, indent=2)
+    with open(paths[1], 'w') as f:
+        f.write(registry.to_prometheus())
+    if metrics.profiler is not None:
+        paths.append(f'{prefix}.prof')
+        metrics.profiler.dump_stats(paths[2])
+    return paths
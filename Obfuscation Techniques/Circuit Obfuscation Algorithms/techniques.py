@@ -0,0 +1,27 @@
+import InverseGates
+import CompositeGates
+import DelayedGates
+import CloakedGates
+
+# Every circuit obfuscation technique behind one calling convention:
+# TECHNIQUES[name](circuit, **params) returns a new, obfuscated circuit.
+TECHNIQUES = {
+    'InverseGates': lambda circuit, **params: InverseGates.obfuscate_circuit(circuit.copy(), obfuscate=True, **params),
+    'CompositeGates': lambda circuit, **params: CompositeGates.insert_obfuscation(circuit, **params),
+    'DelayedGates': lambda circuit, **params: DelayedGates.insert_obfuscation(circuit, **params),
+    'CloakedGates': lambda circuit, **params: CloakedGates.insert_dynamic_obfuscation(circuit, **params),
+}
+
+# Knobs exposed by each technique and the values they take when left alone
+DEFAULT_PARAMETERS = {
+    'InverseGates': {'num_segments': 3},
+    'CompositeGates': {'encapsulate_probability': 0.5},
+    'DelayedGates': {'num_sequences': len(DelayedGates.identity_sequences)},
+    'CloakedGates': {},
+}
+
+
+def obfuscate(name, circuit, **params):
+    if name not in TECHNIQUES:
+        raise ValueError(f"Unknown technique '{name}'. Choose from: {', '.join(TECHNIQUES)}")
+    return TECHNIQUES[name](circuit, **{**DEFAULT_PARAMETERS[name], **params})
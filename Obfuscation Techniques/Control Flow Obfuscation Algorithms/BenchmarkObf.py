@@ -0,0 +1,227 @@
+import os
+import ast
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from functions import RUNTIMES, parse_source, write_output
+from techniques import obfuscate, TECHNIQUES
+
+DEFAULT_TECHNIQUES = ['SuperPosShroud', 'SupObf', 'SimpleEntanglement', 'EntangleObf']
+
+# Runs in a fresh interpreter per trial, so every import is cold and RSS belongs to one module only
+CHILD_CODE = """
+import io, sys, json, time, timeit, asyncio, inspect, resource, contextlib, importlib
+directory, module_name, calls = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+sys.path.insert(0, directory)
+result = {'functions': {}}
+# One loop for every awaited call, so the timings hold the coroutine's work rather than loop setup
+loop = asyncio.new_event_loop()
+
+def call(function, args):
+    value = function(*args)
+    if inspect.iscoroutine(value):
+        loop.run_until_complete(value)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    start_time = time.perf_counter()
+    module = importlib.import_module(module_name)
+    result['import_time'] = time.perf_counter() - start_time
+    result['import_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for name, arguments in calls.items():
+        try:
+            owner = module
+            for part in name.split('.')[:-1]:
+                owner = getattr(owner, part)
+            # Methods are called bound to an instance made without arguments
+            function = getattr(owner() if inspect.isclass(owner) else owner, name.split('.')[-1])
+            start_time = time.perf_counter()
+            for args in arguments:
+                call(function, args)
+            first_call = (time.perf_counter() - start_time) / len(arguments)
+            timer = timeit.Timer(lambda: [call(function, args) for args in arguments])
+            number, _ = timer.autorange()
+            per_call = min(timer.repeat(repeat=5, number=number)) / number / len(arguments)
+            result['functions'][name] = {'first_call': first_call, 'per_call': per_call}
+        except Exception as e:
+            result['functions'][name] = {'error': f"{type(e).__name__}: {e}"}
+result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(result))
+"""
+
+
+def build_outputs(sample_path, techniques, runtime, lazy, seed, directory):
+    """ Write the original and every technique's output as the same module name into its own directory """
+    module_name = os.path.splitext(os.path.basename(sample_path))[0]
+    outputs = {}
+    errors = {}
+    original_directory = os.path.join(directory, 'original')
+    os.makedirs(original_directory)
+    shutil.copyfile(sample_path, os.path.join(original_directory, module_name + '.py'))
+    outputs['original'] = original_directory
+    for technique in techniques:
+        random.seed(seed)
+        technique_directory = os.path.join(directory, technique)
+        os.makedirs(technique_directory)
+        try:
+            tree = obfuscate(technique, parse_source(sample_path), lazy)
+            write_output(tree, os.path.join(technique_directory, module_name + '.py'), 'py', runtime)
+            outputs[technique] = technique_directory
+        except Exception as e:
+            errors[technique] = f"{type(e).__name__}: {e}"
+    return module_name, outputs, errors
+
+
+def default_calls(tree):
+    """ A call without arguments for every protected function, method and coroutine that takes none, and the
+    qualified names of those that need arguments from --bench-args """
+    calls = {}
+    skipped = []
+
+    def visit(body, prefix, in_class):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if node.name.startswith('__'):
+                    continue
+                arguments = node.args
+                parameters = arguments.posonlyargs + arguments.args
+                static = any(isinstance(decorator, ast.Name) and decorator.id == 'staticmethod'
+                             for decorator in node.decorator_list)
+                if in_class and not static:
+                    parameters = parameters[1:]
+                if len(parameters) > len(arguments.defaults) or any(default is None for default in arguments.kw_defaults):
+                    skipped.append(prefix + node.name)
+                else:
+                    calls[prefix + node.name] = [[]]
+            elif isinstance(node, ast.ClassDef):
+                visit(node.body, f"{prefix}{node.name}.", True)
+
+    visit(tree.body, '', False)
+    return calls, skipped
+
+
+def run_trial(directory, module_name, calls):
+    process = subprocess.run([sys.executable, '-c', CHILD_CODE, directory, module_name, json.dumps(calls)],
+                             cwd=directory, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit code {process.returncode}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def summarize(trials):
+    summary = {
+        'import_time': {'median': statistics.median(trial['import_time'] for trial in trials),
+                        'min': min(trial['import_time'] for trial in trials)},
+        'import_rss_kb': statistics.median(trial['import_rss_kb'] for trial in trials),
+        'peak_rss_kb': statistics.median(trial['peak_rss_kb'] for trial in trials),
+        'functions': {},
+    }
+    for name, first in trials[0]['functions'].items():
+        if 'error' in first:
+            summary['functions'][name] = first
+            continue
+        summary['functions'][name] = {
+            'first_call': statistics.median(trial['functions'][name]['first_call'] for trial in trials),
+            'per_call': statistics.median(trial['functions'][name]['per_call'] for trial in trials),
+        }
+    return summary
+
+
+def benchmark(sample_path, techniques, calls, runtime='qiskit', lazy=False, trials=5, warmup=1, seed=0):
+    """ Cold import time, RSS and per-call latency of each technique's output next to the original """
+    with tempfile.TemporaryDirectory() as directory:
+        module_name, outputs, errors = build_outputs(sample_path, techniques, runtime, lazy, seed, directory)
+        results = {technique: {'error': error} for technique, error in errors.items()}
+        for technique, output_directory in outputs.items():
+            try:
+                # Warm-up runs fill the bytecode cache and the OS file cache before anything is recorded
+                for _ in range(warmup):
+                    run_trial(output_directory, module_name, calls)
+                results[technique] = summarize([run_trial(output_directory, module_name, calls) for _ in range(trials)])
+            except RuntimeError as e:
+                results[technique] = {'error': str(e)}
+
+    original = results.get('original', {})
+    for technique, result in results.items():
+        if technique == 'original' or 'error' in result or 'import_time' not in original:
+            continue
+        result['import_time']['ratio'] = result['import_time']['median'] / original['import_time']['median']
+        for name, timings in result['functions'].items():
+            if 'error' not in timings and 'error' not in original['functions'].get(name, {'error': True}):
+                timings['ratio'] = timings['per_call'] / original['functions'][name]['per_call']
+    return results
+
+
+def print_results(results):
+    print(f"{'Technique':<20}{'Import (ms)':>12}{'Ratio':>8}{'Peak RSS (MB)':>15}")
+    for technique, result in results.items():
+        if 'error' in result:
+            print(f"{technique:<20}  failed: {result['error']}")
+            continue
+        ratio = result['import_time'].get('ratio')
+        print(f"{technique:<20}{result['import_time']['median'] * 1000:>12.2f}{f'{ratio:.2f}' if ratio else '-':>8}"
+              f"{result['peak_rss_kb'] / 1024:>15.1f}")
+        for name, timings in result['functions'].items():
+            if 'error' in timings:
+                print(f"    {name:<24}{timings['error']}")
+            else:
+                ratio = timings.get('ratio')
+                print(f"    {name:<24}{timings['per_call'] * 1e6:>10.3f} us/call"
+                      f"{f'  x{ratio:.2f}' if ratio else ''}  (first call {timings['first_call'] * 1e6:.1f} us)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the runtime cost of the control flow obfuscators on a module")
+    parser.add_argument("sample_code_path")
+    parser.add_argument("--techniques", nargs='+', default=DEFAULT_TECHNIQUES, choices=list(TECHNIQUES))
+    parser.add_argument("--bench-args", default=None,
+                        help="JSON file of {function name: [argument list, ...]}; only these functions are called. "
+                             "By default every function and method that takes no arguments is called once per run")
+    parser.add_argument("--runtime", default='qiskit', choices=RUNTIMES)
+    parser.add_argument("--lazy", action="store_true")
+    parser.add_argument("--trials", type=int, default=5, help="Measured runs per output, each in a fresh interpreter")
+    parser.add_argument("--warmup", type=int, default=1, help="Unrecorded runs per output before the trials")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the techniques' random choices")
+    parser.add_argument("--label", default=None, help="Release or build the results belong to")
+    parser.add_argument("--output", default='benchmark.json')
+    args = parser.parse_args()
+
+    skipped = []
+    if args.bench_args:
+        with open(args.bench_args, 'r') as file:
+            calls = json.load(file)
+    else:
+        with open(args.sample_code_path, 'r') as file:
+            calls, skipped = default_calls(ast.parse(file.read()))
+
+    results = benchmark(args.sample_code_path, args.techniques, calls, args.runtime, args.lazy, args.trials,
+                        args.warmup, args.seed)
+    print_results(results)
+    if skipped:
+        print(f"Not timed, they need arguments (list them in --bench-args): {', '.join(skipped)}")
+
+    report = {
+        'label': args.label,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'sample': os.path.abspath(args.sample_code_path),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runtime': args.runtime,
+        'lazy': args.lazy,
+        'trials': args.trials,
+        'results': results,
+        'skipped': skipped,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import io
+import os
+import sys
+import ast
+import json
+import time
+import random
+import signal
+import asyncio
+import inspect
+import argparse
+import tempfile
+import contextlib
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from functions import RUNTIMES
+from techniques import TECHNIQUES
+from BenchmarkObf import build_outputs
+
+# Inputs tried for parameters without a default; annotated parameters only get values of their type
+SAMPLE_VALUES = {
+    'int': [0, 1, -7, 42],
+    'float': [0.0, 2.5, -1.25],
+    'str': ['', 'abc', 'Hello World'],
+    'bool': [True, False],
+    'list': [[], [1, 2, 3]],
+    'dict': [{}, {'a': 1}],
+    None: [0, 3, 2.5, 'abc', [1, 2, 3], None],
+}
+
+_loads = 0
+
+
+def guard_exec(*args, **kwargs):
+    raise RuntimeError("the module tried to replace the process with os.exec*")
+
+
+def time_out(signum, frame):
+    raise TimeoutError("the case ran past its time limit")
+
+
+def init_worker(seed):
+    # A module that re-executes itself would take the worker down with it
+    for name in ('execl', 'execle', 'execlp', 'execlpe', 'execv', 'execve', 'execvp', 'execvpe'):
+        setattr(os, name, guard_exec)
+    # Generated inputs can send a function into an endless loop; the alarm turns that into a TimeoutError outcome
+    signal.signal(signal.SIGALRM, time_out)
+    random.seed(seed)
+
+
+@contextlib.contextmanager
+def time_limit(seconds):
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def normalize(value, depth=0):
+    """ Plain data that compares equal for equal results, whichever module (original or obfuscated) produced them """
+    if depth > 20:
+        return 'repr', repr(value)
+    if isinstance(value, float):
+        return 'float', repr(value)
+    if value is None or isinstance(value, (bool, int, complex, str, bytes)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, [normalize(item, depth + 1) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return type(value).__name__, sorted(repr(normalize(item, depth + 1)) for item in value)
+    if isinstance(value, dict):
+        return 'dict', [(normalize(key, depth + 1), normalize(item, depth + 1)) for key, item in value.items()]
+    if inspect.isgenerator(value):
+        return 'generator', normalize(list(value), depth + 1)
+    if inspect.isfunction(value) or inspect.isclass(value):
+        return type(value).__name__, value.__qualname__
+    if hasattr(value, '__dict__'):
+        return 'object', type(value).__qualname__, normalize(vars(value), depth + 1)
+    return 'repr', type(value).__qualname__, repr(value)
+
+
+def outcome_of(error):
+    return {'exception': [type(error).__name__, str(error)]}
+
+
+def load_module(path, timeout, seed):
+    """ Import a fresh copy of a module file, together with the stdout and exception of its import. Every case gets
+    its own copy, so module globals a case changes cannot leak into the next one on the same worker """
+    global _loads
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(f"_difftest_{_loads}", path)
+    _loads += 1
+    module = importlib.util.module_from_spec(spec)
+    output = io.StringIO()
+    error = None
+    random.seed(seed)
+    with contextlib.redirect_stdout(output):
+        try:
+            with time_limit(timeout):
+                spec.loader.exec_module(module)
+        except (Exception, SystemExit) as e:
+            error = outcome_of(e)
+    return module, output.getvalue(), error
+
+
+def run_case(task):
+    """ Call one function or method of one module with one argument list and describe everything it did """
+    path, name, args, seed, timeout, repeat = task
+    module, import_output, import_error = load_module(path, timeout, seed)
+    if name is None:
+        return {'stdout': import_output, **(import_error or {})}
+    owner = module
+    for part in name.split('.'):
+        function = getattr(owner, part, None)
+        if function is None:
+            return {'missing': True}
+        owner = function
+
+    random.seed(seed)
+    output = io.StringIO()
+    result = {}
+    with contextlib.redirect_stdout(output):
+        start_time = time.perf_counter()
+        try:
+            with time_limit(timeout):
+                if '.' in name:
+                    # Methods are called on a fresh instance made without arguments
+                    owner = module
+                    for part in name.split('.')[:-1]:
+                        owner = getattr(owner, part)
+                    function = getattr(owner(), name.split('.')[-1])
+                value = function(*args)
+                if inspect.iscoroutine(value):
+                    value = asyncio.run(value)
+                result['time'] = time.perf_counter() - start_time
+                result['value'] = normalize(value)
+                # Only the first call is compared; the repeats just steady the timing
+                for _ in range(repeat - 1):
+                    start_time = time.perf_counter()
+                    value = function(*args)
+                    if inspect.iscoroutine(value):
+                        asyncio.run(value)
+                    result['time'] = min(result['time'], time.perf_counter() - start_time)
+        except (Exception, SystemExit) as e:
+            result['time'] = time.perf_counter() - start_time
+            result.update(outcome_of(e))
+    result['stdout'] = output.getvalue()
+    return result
+
+
+def public_functions(tree):
+    """ (qualified name, node, bound) of the public functions and coroutines of a module and the public methods of its
+    (nested) classes; bound methods take their first parameter from the instance """
+    found = []
+
+    def visit(body, prefix, in_class):
+        for node in body:
+            if getattr(node, 'name', '').startswith('_'):
+                continue
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                static = any(isinstance(decorator, ast.Name) and decorator.id == 'staticmethod'
+                             for decorator in node.decorator_list)
+                found.append((prefix + node.name, node, in_class and not static))
+            elif isinstance(node, ast.ClassDef):
+                visit(node.body, f"{prefix}{node.name}.", True)
+
+    visit(tree.body, '', False)
+    return found
+
+
+def generate_cases(function, count, rng, bound=False):
+    """ Argument lists for a function, drawn from SAMPLE_VALUES by parameter annotation """
+    arguments = function.args
+    if any(default is None for default in arguments.kw_defaults):
+        return []
+    parameters = (arguments.posonlyargs + arguments.args)[1 if bound else 0:]
+    required = parameters[:len(parameters) - len(arguments.defaults)]
+    if not required:
+        return [[]]
+    pools = []
+    for parameter in required:
+        annotation = parameter.annotation.id if isinstance(parameter.annotation, ast.Name) else None
+        pools.append(SAMPLE_VALUES.get(annotation, SAMPLE_VALUES[None]))
+    cases = []
+    for _ in range(count):
+        case = [rng.choice(pool) for pool in pools]
+        if case not in cases:
+            cases.append(case)
+    return cases
+
+
+def compare(expected, actual):
+    if actual.get('missing'):
+        return "not defined in the obfuscated module"
+    for key, label in (('exception', 'exception'), ('value', 'return value'), ('stdout', 'stdout')):
+        if expected.get(key) != actual.get(key):
+            return f"{label} differs: {expected.get(key)!r} != {actual.get(key)!r}"
+    return None
+
+
+def run(original_path, obfuscated_paths, cases, seed=0, workers=None, timeout=5.0, repeat=3):
+    """ Run every case against the original and each obfuscated module on a process pool and compare the outcomes """
+    tasks = []
+    for path in [original_path] + list(obfuscated_paths.values()):
+        tasks.append((path, None, [], seed, timeout, 1))
+        for name, argument_lists in cases.items():
+            tasks += [(path, name, args, seed, timeout, repeat) for args in argument_lists]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(seed,)) as executor:
+        outcomes = dict(zip(((path, name, json.dumps(args)) for path, name, args, _, _, _ in tasks),
+                            executor.map(run_case, tasks)))
+
+    report = {}
+    for label, path in obfuscated_paths.items():
+        functions = {}
+        import_outcome = outcomes[(path, None, '[]')]
+        mismatch = compare(outcomes[(original_path, None, '[]')], import_outcome)
+        report[label] = {'import': mismatch, 'functions': functions}
+        for name, argument_lists in cases.items():
+            mismatches = []
+            original_time = obfuscated_time = 0.0
+            for args in argument_lists:
+                expected = outcomes[(original_path, name, json.dumps(args))]
+                actual = outcomes[(path, name, json.dumps(args))]
+                mismatch = compare(expected, actual)
+                if mismatch:
+                    mismatches.append({'args': args, 'mismatch': mismatch})
+                original_time += expected.get('time', 0.0)
+                obfuscated_time += actual.get('time', 0.0)
+            functions[name] = {
+                'cases': len(argument_lists),
+                'mismatches': mismatches,
+                'original_time': original_time,
+                'obfuscated_time': obfuscated_time,
+                'slowdown': obfuscated_time / original_time if original_time else None,
+            }
+    return report
+
+
+def print_report(report):
+    for label, result in report.items():
+        print(f"== {label}" + (f"  (import: {result['import']})" if result['import'] else ''))
+        for name, function in result['functions'].items():
+            status = 'ok' if not function['mismatches'] else f"{len(function['mismatches'])} mismatches"
+            slowdown = f"x{function['slowdown']:.2f}" if function['slowdown'] else '-'
+            print(f"    {name:<28}{function['cases']:>4} cases  {status:<16}{slowdown:>8}")
+            for mismatch in function['mismatches'][:3]:
+                print(f"        args {mismatch['args']!r}: {mismatch['mismatch'][:200]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the behaviour of obfuscated modules with the original")
+    parser.add_argument("sample_code_path")
+    parser.add_argument("--obfuscated", action="append", default=[],
+                        help="Existing obfuscated module to test (repeatable); by default every technique's output is built")
+    parser.add_argument("--techniques", nargs='+', default=list(TECHNIQUES), choices=list(TECHNIQUES))
+    parser.add_argument("--cases", default=None, help="JSON file of recorded inputs, {function name: [argument list, ...]}")
+    parser.add_argument("--generated", type=int, default=8, help="Generated argument lists per function without recorded inputs")
+    parser.add_argument("--runtime", default='qiskit', choices=RUNTIMES)
+    parser.add_argument("--lazy", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=5.0, help="Seconds a single call (or import) may take")
+    parser.add_argument("--repeat", type=int, default=3, help="Calls per case; the fastest one is reported")
+    parser.add_argument("--output", default='difftest.json')
+    args = parser.parse_args()
+
+    with open(args.sample_code_path, 'r') as file:
+        tree = ast.parse(file.read())
+    recorded = {}
+    if args.cases:
+        with open(args.cases, 'r') as file:
+            recorded = json.load(file)
+    rng = random.Random(args.seed)
+    cases = {name: recorded.get(name) or generate_cases(function, args.generated, rng, bound)
+             for name, function, bound in public_functions(tree)}
+
+    start_time = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        if args.obfuscated:
+            original_path = os.path.abspath(args.sample_code_path)
+            obfuscated_paths = {path: os.path.abspath(path) for path in args.obfuscated}
+        else:
+            module_name, outputs, errors = build_outputs(args.sample_code_path, args.techniques, args.runtime,
+                                                         args.lazy, args.seed, directory)
+            for technique, error in errors.items():
+                print(f"{technique}: not built ({error})")
+            original_path = os.path.join(outputs.pop('original'), module_name + '.py')
+            obfuscated_paths = {technique: os.path.join(output, module_name + '.py') for technique, output in outputs.items()}
+        report = run(original_path, obfuscated_paths, cases, args.seed, args.workers, args.timeout, args.repeat)
+
+    print_report(report)
+    total_cases = sum(function['cases'] for result in report.values() for function in result['functions'].values())
+    failures = sum(len(function['mismatches']) for result in report.values() for function in result['functions'].values())
+    failures += sum(1 for result in report.values() if result['import'])
+    print(f"{total_cases} cases, {failures} mismatches in {time.perf_counter() - start_time:.2f} s")
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,27 @@
 import ast
+import copy
 import random
-import sys
+from functions import generator_parser, write_output, make_lazy, render_template, parse_source, \
+    protectable_functions, place_branches
+from decoys import build_decoys, decoy_report, print_decoy_report
 
 
 # This Obfuscation is meant to work on code that contains only one function definition
-def extract_random_function_and_imports(file_path):
-    with open(file_path, 'r') as file:
-        tree = ast.parse(file.read())
+def extract_random_function_and_imports(file_path, tree=None):
+    if tree is None:
+        tree = parse_source(file_path)
 
-    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+    # Functions, coroutines and methods all qualify; each comes with the body (module or class) it sits in
+    functions = protectable_functions(tree)
     imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
-    return random.choice(functions) if functions else None, imports, tree.body
+    random_function, body = random.choice(functions) if functions else (None, None)
+    return random_function, body, imports, tree.body
 
 
-def indent_function_body(function_code):
-    lines = function_code.split('\n')
-    indented_lines = [lines[0]] + ['    ' + line if line else line for line in lines[1:]]
-    return '\n'.join(indented_lines)
-
-
-def modularize_opaque_pred(sample_code_path, opaque_pred_code):
-    random_function, imports, sample_code_body = extract_random_function_and_imports(sample_code_path)
+def modularize_opaque_pred(sample_code_path, opaque_pred_code, num_pairs=8, tree=None, max_bytes=None, max_bytecode=None):
+    random_function, function_body, imports, sample_code_body = extract_random_function_and_imports(sample_code_path, tree)
+    # The decoy branch gets a mutated copy of one of the module's own functions
+    decoys = build_decoys(ast.Module(body=sample_code_body, type_ignores=[]), 1, max_bytes, max_bytecode)
     if random_function is None:
         wrapper = ast.FunctionDef(
             name="__wrapped_main__",
@@ -38,72 +39,48 @@ def modularize_opaque_pred(sample_code_path, opaque_pred_code):
         for alias in node.names:
             unique_imports[alias.name] = node
 
-    # Convert the selected function and imports back to code
-    random_function_code = indent_function_body(ast.unparse(random_function))
-    imports_code = "\n".join(ast.unparse(node) for node in unique_imports.values())
     try:
         sample_code_body.remove(random_function)
     except ValueError:
         pass
-    sample_code = "\n".join(
-        ast.unparse(node) for node in sample_code_body if not isinstance(node, (ast.Import, ast.ImportFrom)))
+    sample_code = [node for node in sample_code_body if not isinstance(node, (ast.Import, ast.ImportFrom))]
+
+    # Integrate everything into the new obfuscated module
+    return place_branches(render_template(
+        ENTANGLE_TEMPLATE,
+        __IMPORTS__=list(dict.fromkeys(unique_imports.values())),
+        __OPAQUE_PREDICATE__=ast.parse(opaque_pred_code).body,
+        __NUM_PAIRS__=ast.Constant(num_pairs),
+        __FUNCTION__=[random_function],
+        # Each branch gets its own copy of the function's nodes
+        __FUNCTION_COPY__=[copy.deepcopy(random_function)],
+        __DECOY__=decoys[0],
+        __SAMPLE_CODE__=sample_code,
+    ), [(random_function, function_body)])
 
-    # Integrate everything into the new obfuscated code
-    new_code = f"""
-{imports_code}
 
-{opaque_pred_code}
+ENTANGLE_TEMPLATE = """
+__IMPORTS__
 
-num_pairs = 8
+__OPAQUE_PREDICATE__
+
+num_pairs = __NUM_PAIRS__
 counts = entangler(num_pairs)
 
 if sum(int(bit) for bit in max(counts, key=counts.get)) == num_pairs * 2:
-    def run_bell_state():
-        # You may change this function to do something else entirely
-        qr = QuantumRegister(2)
-        cr = ClassicalRegister(2)
-        qc = QuantumCircuit(qr, cr)
-        qc.h(qr[0])
-        qc.cx(qr[0], qr[1])
-        measure_all(qc, qr, cr)
-        print("Bell State Algorithm result")
-        print(qc.draw(output='text'))
-        circuit_drawer(qc, output='mpl', style='clifford')
-    os.execv(sys.executable, ['python'] + sys.argv)
+    __DECOY__
+    # The unlikely outcome still defines the function, so the module never has to restart the process
+    __FUNCTION_COPY__
 else:
-    {random_function_code}
+    __FUNCTION__
 
-{sample_code}    
+__SAMPLE_CODE__
 """
-    return new_code
 
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python EntangleObf.py <sample_code_path>")
-        sys.exit(1)
-
-    sample_code_path = sys.argv[1]
-    opaque_pred_code = """
-from qiskit import QuantumCircuit, ClassicalRegister, QuantumRegister, transpile
-from qiskit_aer import AerSimulator
-from qiskit.visualization import circuit_drawer
-import os, sys
-
-def create_entangled_pairs(qc, qr):
-    for i in range(0, qr.size, 2):
-        qc.h(qr[i])
-        qc.cx(qr[i], qr[i + 1])
-
-def measure_all(qc, qr, cr):
-    qc.measure(qr, cr)
-
-def execute_circuit(qc, backend_name=AerSimulator(), shots=1024):
-    backend = backend_name
-    # Transpile the circuit for the backend
-    transpiled_circuit = transpile(qc, backend)
-    result = backend.run(transpiled_circuit, shots=shots).result()
-    return result.get_counts()
+OPAQUE_PRED_CODE = """
+from predicate_runtime import QuantumCircuit, ClassicalRegister, QuantumRegister, execute_circuit, measure_all, create_entangled_pairs
+
 
 def entangler(num_pairs):
     qr = QuantumRegister(num_pairs * 2)
@@ -111,22 +88,27 @@ def entangler(num_pairs):
     qc = QuantumCircuit(qr, cr)
     create_entangled_pairs(qc, qr)
     measure_all(qc, qr, cr)
-    counts = execute_circuit(qc)
-    return counts
+    # The Bell-pair circuit is Clifford, so the stabilizer method keeps wide predicates cheap
+    return execute_circuit(qc, method='stabilizer')
+"""
 
-    print("Simulator result")
-    for outcome, count in counts.items():
-        print(f"{outcome} is observed {count} times")
 
-    print(qc.draw(output='text'))
-"""
+def main():
+    parser = generator_parser('EntangleObf.py', decoys=True)
+    # The predicate is Clifford, so both runtimes evaluate it on a stabilizer tableau and wide registers stay cheap
+    parser.add_argument("--pairs", type=int, default=8, help="Number of Bell pairs in the predicate circuit")
+    args = parser.parse_args()
+
+    new_tree = modularize_opaque_pred(args.sample_code_path, OPAQUE_PRED_CODE, args.pairs, max_bytes=args.decoy_bytes,
+                                      max_bytecode=args.decoy_bytecode)
 
-    new_code = modularize_opaque_pred(sample_code_path, opaque_pred_code)
+    if args.lazy:
+        new_tree = make_lazy(new_tree)
 
-    output_file = 'ObfuscatedEntangleObf.py'
-    with open(output_file, 'w') as file:
-        file.write(new_code)
+    output_file = write_output(new_tree, 'ObfuscatedEntangleObf.py', args.format, args.runtime,
+                               args.sample_code_path)
 
+    print_decoy_report(decoy_report(new_tree))
     print(f"Modularized code written to {output_file}")
 
 
@@ -0,0 +1,312 @@
+import io
+import ast
+import copy
+import json
+import random
+import timeit
+import inspect
+import contextlib
+from functions import generator_parser, write_output, load_runtime, parse_source
+from ModuleShroud import PREDICATE_TEMPLATE, build_predicate, collect_functions, insertion_point
+
+# Names the dispatcher adds to a flattened function; functions that already use one of them are left alone
+RESERVED_NAMES = {'_state', '_jump', '_block'}
+
+SEED_QUBITS = 16
+
+FLOW_TEMPLATE = """
+_flow_seed = sum(bit << index for index, bit in enumerate(_bits))
+
+
+def _flow_table(states):
+    # The jump tables are stored XOR-ed with the predicate's outcome and only decode once it has run
+    return {encoded ^ _flow_seed: label for encoded, label in states}
+"""
+
+
+class JumpRewriter(ast.NodeTransformer):
+    """ Turn break and continue of a flattened loop into state changes followed by a jump back to the dispatcher """
+
+    def __init__(self, flattener, continue_state, break_state):
+        self.flattener = flattener
+        self.continue_state = continue_state
+        self.break_state = break_state
+
+    def visit_Break(self, node):
+        return [self.flattener.goto(self.break_state), ast.Continue()]
+
+    def visit_Continue(self, node):
+        return [self.flattener.goto(self.continue_state), ast.Continue()]
+
+    def visit_loop(self, node):
+        # Jumps in the body of an inner loop belong to that loop; its else clause still belongs to ours
+        orelse = []
+        for statement in node.orelse:
+            result = self.visit(statement)
+            orelse += result if isinstance(result, list) else [result]
+        node.orelse = orelse
+        return node
+
+    visit_For = visit_AsyncFor = visit_While = visit_loop
+
+    def visit_scope(self, node):
+        return node
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = visit_Lambda = visit_scope
+
+
+class FunctionFlattener:
+    """ Lay out a function body as basic blocks run by a dispatcher loop over opaque state values """
+
+    def __init__(self, depth, block_size):
+        self.depth = depth
+        self.block_size = block_size
+        self.blocks = []
+        self.values = []
+        self.loops = 0
+
+    def new_state(self):
+        value = random.getrandbits(32)
+        while value in self.values:
+            value = random.getrandbits(32)
+        self.values.append(value)
+        self.blocks.append(None)
+        return len(self.blocks) - 1
+
+    def goto(self, state):
+        return ast.Assign(targets=[ast.Name('_state', ast.Store())], value=ast.Constant(self.values[state]))
+
+    def rewrite_jumps(self, statements, loop):
+        if loop is None:
+            return statements
+        rewriter = JumpRewriter(self, *loop)
+        rewritten = []
+        for statement in statements:
+            result = rewriter.visit(statement)
+            rewritten += result if isinstance(result, list) else [result]
+        return rewritten
+
+    def segments(self, statements, depth):
+        """ Split a body into runs of plain statements and the control flow statements that get their own states """
+        segments = []
+        run = []
+        for statement in statements:
+            if depth > 0 and isinstance(statement, (ast.If, ast.While, ast.For)):
+                segments += [run[index:index + self.block_size] for index in range(0, len(run), self.block_size)]
+                segments.append(statement)
+                run = []
+            else:
+                run.append(statement)
+        if depth > 0:
+            segments += [run[index:index + self.block_size] for index in range(0, len(run), self.block_size)]
+        elif run:
+            segments.append(run)
+        return segments
+
+    def emit(self, statements, depth, exit_state, loop):
+        """ Add the states of a body that continues at exit_state; returns the state it starts in """
+        segments = self.segments(statements, depth)
+        if not segments:
+            return exit_state
+        entries = [self.new_state() for _ in segments]
+        for index, segment in enumerate(segments):
+            state = entries[index]
+            next_state = entries[index + 1] if index + 1 < len(segments) else exit_state
+            if isinstance(segment, list):
+                block = self.rewrite_jumps(segment, loop)
+                if not isinstance(block[-1], (ast.Return, ast.Raise, ast.Continue, ast.Break)):
+                    block.append(self.goto(next_state))
+                self.blocks[state] = block
+            elif isinstance(segment, ast.If):
+                then_state = self.emit(segment.body, depth - 1, next_state, loop)
+                else_state = self.emit(segment.orelse, depth - 1, next_state, loop)
+                self.blocks[state] = [ast.If(test=segment.test, body=[self.goto(then_state)], orelse=[self.goto(else_state)])]
+            elif isinstance(segment, ast.While):
+                else_state = self.emit(segment.orelse, depth - 1, next_state, loop)
+                body_state = self.emit(segment.body, depth - 1, state, (state, next_state))
+                self.blocks[state] = [ast.If(test=segment.test, body=[self.goto(body_state)], orelse=[self.goto(else_state)])]
+            else:
+                # A for loop steps its iterator in a state of its own: a one-iteration for assigns the target
+                # exactly like the original loop and falls into its else clause when the iterator is exhausted
+                iterator = f"_iter_{self.loops}"
+                self.loops += 1
+                head = self.new_state()
+                else_state = self.emit(segment.orelse, depth - 1, next_state, loop)
+                body_state = self.emit(segment.body, depth - 1, head, (head, next_state))
+                self.blocks[state] = [
+                    ast.Assign(targets=[ast.Name(iterator, ast.Store())],
+                               value=ast.Call(func=ast.Name('iter', ast.Load()), args=[segment.iter], keywords=[])),
+                    self.goto(head),
+                ]
+                self.blocks[head] = [ast.For(target=segment.target, iter=ast.Name(iterator, ast.Load()),
+                                             body=[self.goto(body_state), ast.Break()],
+                                             orelse=[self.goto(else_state)])]
+        return entries[0]
+
+    def dispatch(self, states, labels):
+        """ Binary search over the shuffled labels, so finding a block costs log2(states) comparisons """
+        if len(states) == 1:
+            return self.blocks[states[0]]
+        middle = len(states) // 2
+        test = ast.Compare(left=ast.Name('_block', ast.Load()), ops=[ast.Lt()], comparators=[ast.Constant(labels[states[middle]])])
+        return [ast.If(test=test, body=self.dispatch(states[:middle], labels), orelse=self.dispatch(states[middle:], labels))]
+
+    def flatten(self, function, table_name):
+        """ Replace the function's body by the dispatcher; returns the (encoded value, label) pairs of its jump table """
+        body = function.body
+        head = []
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+            head.append(body.pop(0))
+        # Declarations have to come before any use, so they stay in front of the dispatcher
+        while body and isinstance(body[0], (ast.Global, ast.Nonlocal)):
+            head.append(body.pop(0))
+
+        exit_state = self.new_state()
+        self.blocks[exit_state] = [ast.Break()]
+        entry_state = self.emit(body, self.depth, exit_state, None)
+
+        labels = list(range(len(self.blocks)))
+        random.shuffle(labels)
+        by_label = sorted(range(len(self.blocks)), key=lambda state: labels[state])
+        dispatch = self.dispatch(by_label, labels)
+
+        function.body = head + [
+            ast.Assign(targets=[ast.Name('_jump', ast.Store())], value=ast.Name(table_name, ast.Load())),
+            self.goto(entry_state),
+            ast.While(test=ast.Constant(True), body=[
+                ast.Assign(targets=[ast.Name('_block', ast.Store())],
+                           value=ast.Subscript(value=ast.Name('_jump', ast.Load()), slice=ast.Name('_state', ast.Load()), ctx=ast.Load())),
+            ] + dispatch, orelse=[]),
+        ]
+        return [(value, labels[state]) for state, value in enumerate(self.values)]
+
+
+def can_flatten(function):
+    names = {node.id for node in ast.walk(function) if isinstance(node, ast.Name)}
+    names |= {node.arg for node in ast.walk(function) if isinstance(node, ast.arg)}
+    if names & RESERVED_NAMES or any(name.startswith('_iter_') for name in names):
+        return False
+    # Declarations nested in the body could end up after a use once the blocks are reordered
+    top_level = [statement for statement in function.body if isinstance(statement, (ast.Global, ast.Nonlocal))]
+    declarations = [node for node in ast.walk(function) if isinstance(node, (ast.Global, ast.Nonlocal))]
+    return len(top_level) == len(declarations)
+
+
+def flatten_tree(tree, depths=None, depth=2, block_size=2, num_qubits=SEED_QUBITS):
+    """ Flatten every function of a module; depths maps a function's qualified name to its own depth """
+    depths = depths or {}
+    functions, qualnames = collect_functions(tree)
+    gates, bits = build_predicate(num_qubits)
+    seed = sum(bit << index for index, bit in enumerate(bits))
+
+    tables = []
+    report = []
+    for function in functions:
+        qualname = qualnames[id(function)]
+        function_depth = depths.get(qualname, depth)
+        if function_depth < 1 or not can_flatten(function):
+            report.append((qualname, 0, 0))
+            continue
+        table_name = f"_jump_{len(tables)}"
+        flattener = FunctionFlattener(function_depth, block_size)
+        states = flattener.flatten(function, table_name)
+        encoded = ast.Tuple(elts=[ast.Tuple(elts=[ast.Constant(value ^ seed), ast.Constant(label)], ctx=ast.Load())
+                                  for value, label in states], ctx=ast.Load())
+        tables.append(ast.Assign(targets=[ast.Name(table_name, ast.Store())],
+                                 value=ast.Call(func=ast.Name('_flow_table', ast.Load()), args=[encoded], keywords=[])))
+        report.append((qualname, function_depth, len(states)))
+
+    if tables:
+        index = insertion_point(tree.body)
+        predicate = ast.parse(PREDICATE_TEMPLATE.format(num_qubits=num_qubits, gates=gates)).body
+        tree.body[index:index] = predicate + ast.parse(FLOW_TEMPLATE).body + tables
+    return ast.fix_missing_locations(tree), report
+
+
+def load_module(tree, filename):
+    namespace = {'__name__': '__flatten_bench__'}
+    # The sample's own top-level output is not part of the measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        exec(compile(ast.fix_missing_locations(tree), filename, 'exec'), namespace)
+    return namespace
+
+
+def call_all(function, calls):
+    results = []
+    for args in calls:
+        result = function(*args)
+        results.append(list(result) if inspect.isgenerator(result) else result)
+    return results
+
+
+def time_calls(function, calls):
+    timer = timeit.Timer(lambda: call_all(function, calls))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+
+def tune_depths(tree, filename, bench_args, budget, max_depth, block_size, runtime):
+    """ Deepest flattening of each benchmarked function whose per-call time stays within budget times the original """
+    load_runtime(runtime)
+    original = load_module(copy.deepcopy(tree), filename)
+    functions, qualnames = collect_functions(tree)
+    depths = {}
+    print(f"{'Function':<30}{'Depth':>6}{'States':>8}{'Original (us)':>15}{'Flattened (us)':>16}{'Ratio':>8}")
+    for position, function in enumerate(functions):
+        qualname = qualnames[id(function)]
+        if qualname not in bench_args:
+            continue
+        calls = [args if isinstance(args, list) else [args] for args in bench_args[qualname]]
+        if '.' in qualname or isinstance(function, ast.AsyncFunctionDef):
+            print(f"{qualname:<30}  not measured (only module-level sync functions can be called directly)")
+            continue
+        expected = call_all(original[qualname], calls)
+        original_time = time_calls(original[qualname], calls)
+        depths[qualname] = 0
+        for depth in range(max_depth, 0, -1):
+            flattened_tree, report = flatten_tree(copy.deepcopy(tree), {qualname: depth}, 0, block_size)
+            states = report[position][2]
+            if not states:
+                break
+            flattened = load_module(flattened_tree, filename)[qualname]
+            if call_all(flattened, calls) != expected:
+                print(f"{qualname:<30}  depth {depth} changed the results; not flattened")
+                break
+            flattened_time = time_calls(flattened, calls)
+            ratio = flattened_time / original_time
+            print(f"{qualname:<30}{depth:>6}{states:>8}{original_time * 1e6:>15.2f}{flattened_time * 1e6:>16.2f}{ratio:>8.2f}")
+            if ratio <= budget:
+                depths[qualname] = depth
+                break
+    return depths
+
+
+def main():
+    parser = generator_parser('FlattenObf.py', lazy=False)
+    parser.add_argument("--depth", type=int, default=2, help="Levels of nested if/while/for turned into dispatcher states")
+    parser.add_argument("--block-size", type=int, default=2, help="Plain statements per basic block")
+    parser.add_argument("--bench-args", default=None,
+                        help="JSON file of {function name: [argument list, ...]} used to measure each function's overhead")
+    parser.add_argument("--budget", type=float, default=2.0,
+                        help="With --bench-args, largest allowed flattened/original per-call time ratio")
+    args = parser.parse_args()
+
+    tree = parse_source(args.sample_code_path)
+
+    depths = {}
+    if args.bench_args:
+        with open(args.bench_args, 'r') as file:
+            bench_args = json.load(file)
+        # Benchmarked functions get the deepest flattening within the budget, the others --depth
+        depths = tune_depths(tree, args.sample_code_path, bench_args, args.budget, args.depth, args.block_size, args.runtime)
+
+    new_tree, report = flatten_tree(tree, depths, args.depth, args.block_size)
+    output_file = write_output(new_tree, 'ObfuscatedFlattenObf.py', args.format, args.runtime, args.sample_code_path)
+
+    for qualname, depth, states in report:
+        print(f"{qualname}: " + (f"depth {depth}, {states} states" if states else "not flattened"))
+    print(f"Obfuscated code written to {output_file}")
+
+
+if __name__ == "__main__":
+    main()
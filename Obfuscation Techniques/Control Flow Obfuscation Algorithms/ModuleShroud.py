@@ -0,0 +1,309 @@
+import ast
+import copy
+import json
+import time
+import pstats
+import random
+import timeit
+import itertools
+from functions import generator_parser, write_output, load_runtime, mark_source
+
+# Gate sequences that leave a computational basis state in the computational basis, so the predicate
+# has a single deterministic outcome and one shot is enough
+FLIP_SEQUENCES = [['x'], ['y'], ['h', 'z', 'h'], ['h', 's', 's', 'h'], ['s', 'x', 'sdg']]
+KEEP_SEQUENCES = [['z'], ['s'], ['h', 'h'], ['x', 'x'], ['sdg', 'z', 's'], ['y', 'x']]
+
+PREDICATE_TEMPLATE = """
+from predicate_runtime import QuantumCircuit, execute_circuit
+
+
+def _predicate_bits():
+    qc = QuantumCircuit({num_qubits}, {num_qubits})
+{gates}
+    qc.measure(range({num_qubits}), range({num_qubits}))
+    counts = execute_circuit(qc, shots=1, method="stabilizer")
+    return [int(bit) for bit in reversed(next(iter(counts)))]
+
+
+_bits = _predicate_bits()
+"""
+
+
+def build_predicate(num_qubits):
+    """ Random Clifford circuit over num_qubits together with the bit values it always measures """
+    lines = []
+    bits = []
+    for qubit in range(num_qubits):
+        flip = random.random() < 0.5
+        for gate in random.choice(FLIP_SEQUENCES if flip else KEEP_SEQUENCES):
+            lines.append(f"    qc.{gate}({qubit})")
+        bits.append(int(flip))
+    # CX on basis states just XORs the control into the target, which ties the bits together
+    for _ in range(num_qubits):
+        control, target = random.sample(range(num_qubits), 2)
+        lines.append(f"    qc.cx({control}, {target})")
+        bits[target] ^= bits[control]
+    return "\n".join(lines), bits
+
+
+def selectors_needed(num_functions):
+    # Smallest register whose single bits and bit pairs give every function its own selector
+    num_qubits = 3
+    while num_qubits + num_qubits * (num_qubits - 1) // 2 < num_functions:
+        num_qubits += 1
+    return num_qubits
+
+
+def collect_functions(tree):
+    """ Module-level functions and the methods of (nested) classes, in source order, with their qualified names """
+    functions = []
+    qualnames = {}
+
+    def visit(body, prefix):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                functions.append(node)
+                qualnames[id(node)] = prefix + node.name
+            elif isinstance(node, ast.ClassDef):
+                visit(node.body, f"{prefix}{node.name}.")
+
+    visit(tree.body, '')
+    return functions, qualnames
+
+
+def load_workload(functions, qualnames, profile_path=None, call_counts_path=None):
+    """ (calls, seconds) per function from a pstats dump and/or a JSON file of {qualname: calls} """
+    workload = {id(function): (0, 0.0) for function in functions}
+    if profile_path:
+        # pstats keys are (filename, first line, name); decorated functions start at their first decorator
+        by_location = {}
+        for function in functions:
+            for line in {function.lineno, min([function.lineno] + [d.lineno for d in function.decorator_list])}:
+                by_location[(line, function.name)] = id(function)
+        for (_, line, name), (_, calls, own_time, _, _) in pstats.Stats(profile_path).stats.items():
+            if (line, name) in by_location:
+                key = by_location[(line, name)]
+                workload[key] = (workload[key][0] + calls, workload[key][1] + own_time)
+    if call_counts_path:
+        with open(call_counts_path, 'r') as file:
+            call_counts = json.load(file)
+        for function in functions:
+            qualname = qualnames[id(function)]
+            if qualname in call_counts:
+                workload[id(function)] = (max(workload[id(function)][0], int(call_counts[qualname])), workload[id(function)][1])
+    return workload
+
+
+def bound_names(statements):
+    """ Names a block would make local to the function it is placed in, or None if it would also change the
+    function's kind (yield, await) or scoping (global, nonlocal) """
+    names = set()
+    pending = list(statements)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            # A nested definition only binds its own name here; its body is a separate scope
+            names.add(node.name)
+            pending.extend(node.decorator_list)
+            continue
+        if isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            continue
+        if isinstance(node, (ast.Global, ast.Nonlocal, ast.Yield, ast.YieldFrom, ast.Await)):
+            return None
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        pending.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def local_names(function):
+    arguments = function.args
+    parameters = arguments.posonlyargs + arguments.args + arguments.kwonlyargs + [arguments.vararg, arguments.kwarg]
+    return {parameter.arg for parameter in parameters if parameter is not None} | (bound_names(function.body) or set())
+
+
+def declares_scope(statements):
+    """ Whether a block has a global or nonlocal declaration of its own, outside nested scopes """
+    pending = list(statements)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (ast.Global, ast.Nonlocal)):
+            return True
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            pending.extend(ast.iter_child_nodes(node))
+    return False
+
+
+def in_body_decoy(function, functions):
+    # The decoy block must not turn globals of the real body into locals, nor make it a generator or coroutine,
+    # so only sync bodies binding a subset of the function's own locals qualify. It runs ahead of the body, so in a
+    # function with global or nonlocal declarations any use of a declared name would precede its declaration;
+    # those functions, and those without a fitting decoy, get a bare return
+    candidates = []
+    if isinstance(function, ast.FunctionDef) and not declares_scope(function.body):
+        own_names = local_names(function)
+        candidates = [other.body for other in functions if other is not function
+                      and (names := bound_names(other.body)) is not None and names <= own_names]
+    return copy.deepcopy(random.choice(candidates)) if candidates else [ast.Return(value=None)]
+
+
+def decoy_for(function, functions):
+    # A decoy keeps the signature and decorators but borrows the body of another function of the same kind
+    candidates = [other for other in functions if other is not function and type(other) is type(function)]
+    decoy = type(function)(**{field: getattr(function, field) for field in function._fields})
+    decoy.body = copy.deepcopy(random.choice(candidates).body) if candidates else [ast.Pass()]
+    return decoy
+
+
+def selector_expression(selector, bits):
+    """ Source of the selector and the value the predicate always gives it """
+    if len(selector) == 1:
+        return f"_bits[{selector[0]}]", bits[selector[0]]
+    return f"_bits[{selector[0]}] ^ _bits[{selector[1]}]", bits[selector[0]] ^ bits[selector[1]]
+
+
+def selector_condition(selector, bits):
+    # Compare with the value the predicate always produces so the real definition is always taken
+    expression, expected = selector_expression(selector, bits)
+    if random.random() < 0.5:
+        return ast.parse(f"{expression} == {expected}", mode='eval').body, True
+    return ast.parse(f"{expression} == {1 - expected}", mode='eval').body, False
+
+
+def add_body_check(function, selector, bits, functions):
+    """ Guard the body itself with the selector as well, so the predicate is consulted on every call """
+    expression, expected = selector_expression(selector, bits)
+    check = ast.If(test=ast.parse(f"{expression} != {expected}", mode='eval').body,
+                   body=in_body_decoy(function, functions), orelse=[])
+    has_docstring = isinstance(function.body[0], ast.Expr) and isinstance(function.body[0].value, ast.Constant) \
+        and isinstance(function.body[0].value.value, str)
+    function.body.insert(1 if has_docstring else 0, check)
+
+
+class ModuleShroud(ast.NodeTransformer):
+    """ Wraps every protected definition in an if on its own bit (or bit pair) of the shared predicate """
+
+    def __init__(self, functions, selectors, bits, cold=()):
+        self.functions = functions
+        self.selectors = selectors
+        self.bits = bits
+        self.cold = set(cold)
+
+    def protect(self, node):
+        if id(node) not in self.selectors:
+            return node
+        if id(node) in self.cold:
+            add_body_check(node, self.selectors[id(node)], self.bits, self.functions)
+        condition, real_first = selector_condition(self.selectors[id(node)], self.bits)
+        decoy = decoy_for(node, self.functions)
+        branch = ast.If(test=condition, body=[node] if real_first else [decoy], orelse=[decoy] if real_first else [node])
+        return ast.copy_location(branch, node)
+
+    def visit_FunctionDef(self, node):
+        # Nested functions are left alone; only the definition itself is wrapped
+        return self.protect(node)
+
+    def visit_AsyncFunctionDef(self, node):
+        return self.protect(node)
+
+
+def insertion_point(body):
+    # The predicate goes after the module docstring and any __future__ imports
+    index = 0
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+        index = 1
+    while index < len(body) and isinstance(body[index], ast.ImportFrom) and body[index].module == '__future__':
+        index += 1
+    return index
+
+
+def rank_workload(functions, workload, hot_calls):
+    """ Functions ordered by calls then time; those called at least hot_calls times only get the hoisted predicate """
+    ranked = sorted(functions, key=lambda function: workload[id(function)], reverse=True)
+    cold = [function for function in functions if workload[id(function)][0] < hot_calls]
+    return ranked, cold
+
+
+def overhead_report(ranked, cold, qualnames, workload, predicate_code, selectors, bits, profile_path, runtime):
+    """ Print the expected cost of the obfuscation for the profiled workload """
+    # The one-time cost is the predicate itself, run here with the same runtime the output will use
+    load_runtime(runtime)
+    start_time = time.perf_counter()
+    exec(compile(predicate_code, '<predicate>', 'exec'), {})
+    predicate_time = time.perf_counter() - start_time
+
+    cold_ids = {id(function) for function in cold}
+    per_call = 0.0
+    print(f"{'Function':<40}{'Calls':>12}{'Time (s)':>12}  Protection")
+    for function in ranked:
+        calls, seconds = workload[id(function)]
+        if id(function) in cold_ids:
+            expression, expected = selector_expression(selectors[id(function)], bits)
+            check_time = timeit.timeit(f"{expression} != {expected}", globals={'_bits': bits}, number=100000) / 100000
+            per_call += calls * check_time
+        print(f"{qualnames[id(function)]:<40}{calls:>12}{seconds:>12.4f}  "
+              f"{'hoisted + per-call check' if id(function) in cold_ids else 'hoisted only'}")
+
+    print(f"\nOne-time predicate cost: {predicate_time * 1000:.2f} ms")
+    print(f"Per-call checks over the workload: {per_call * 1000:.3f} ms", end='')
+    if profile_path:
+        total_time = pstats.Stats(profile_path).total_tt
+        print(f" ({100 * per_call / total_time:.3f}% of the profiled {total_time:.3f} s)" if total_time else '')
+    else:
+        print()
+
+
+def shroud_module(code, runtime='qiskit', num_qubits=None, profile_path=None, call_counts_path=None, hot_calls=1000):
+    return shroud_tree(mark_source(ast.parse(code)), runtime, num_qubits, profile_path, call_counts_path, hot_calls)
+
+
+def shroud_tree(tree, runtime='qiskit', num_qubits=None, profile_path=None, call_counts_path=None, hot_calls=1000):
+    functions, qualnames = collect_functions(tree)
+    if not functions:
+        raise ValueError("No function found in the sample code")
+
+    num_qubits = num_qubits or selectors_needed(len(functions))
+    gates, bits = build_predicate(num_qubits)
+    selectors = [(qubit,) for qubit in range(num_qubits)] + list(itertools.combinations(range(num_qubits), 2))
+    random.shuffle(selectors)
+    selectors = {id(function): selectors[index % len(selectors)] for index, function in enumerate(functions)}
+    predicate_code = PREDICATE_TEMPLATE.format(num_qubits=num_qubits, gates=gates)
+
+    # Without workload data every function is treated as hot and keeps the zero-cost hoisted predicate
+    cold = []
+    if profile_path or call_counts_path:
+        workload = load_workload(functions, qualnames, profile_path, call_counts_path)
+        ranked, cold = rank_workload(functions, workload, hot_calls)
+        overhead_report(ranked, cold, qualnames, workload, predicate_code, selectors, bits, profile_path, runtime)
+
+    tree = ModuleShroud(functions, selectors, bits, [id(function) for function in cold]).visit(tree)
+    index = insertion_point(tree.body)
+    tree.body[index:index] = ast.parse(predicate_code).body
+    return ast.fix_missing_locations(tree), len(functions), num_qubits
+
+
+def main():
+    parser = generator_parser('ModuleShroud.py', lazy=False)
+    parser.add_argument("--qubits", type=int, default=None, help="Predicate width (default: just enough for one selector per function)")
+    parser.add_argument("--profile", default=None, help="cProfile/pstats dump of the real workload")
+    parser.add_argument("--call-counts", default=None, help="JSON file of {qualified function name: calls} from the real workload")
+    parser.add_argument("--hot-calls", type=int, default=1000, help="Functions called at least this often only get the hoisted predicate")
+    args = parser.parse_args()
+
+    with open(args.sample_code_path, 'r') as file:
+        code = file.read()
+    new_tree, num_functions, num_qubits = shroud_module(code, args.runtime, args.qubits, args.profile,
+                                                       args.call_counts, args.hot_calls)
+
+    output_file = write_output(new_tree, 'ObfuscatedModuleShroud.py', args.format, args.runtime, args.sample_code_path)
+
+    print(f"Protected {num_functions} functions with one {num_qubits}-qubit predicate")
+    print(f"Obfuscated code written to {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import os
+import sys
+import ast
+import json
+import time
+import random
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functions import RUNTIMES, ship_runtime, save_module, mark_source
+from techniques import obfuscate, TECHNIQUES
+
+CACHE_FILE = '.obfusqate-cache.json'
+TOOL_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def tool_fingerprint():
+    # A change to any obfuscator invalidates the cache just like a change to the options does
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(TOOL_DIRECTORY)):
+        if name.endswith('.py'):
+            with open(os.path.join(TOOL_DIRECTORY, name), 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def walk_sources(source_root, output_root):
+    """ Relative paths of every file under source_root, skipping hidden directories, caches and the output tree """
+    output_root = os.path.abspath(output_root)
+    for directory, subdirectories, files in os.walk(source_root):
+        subdirectories[:] = sorted(
+            name for name in subdirectories
+            if not name.startswith('.') and name != '__pycache__' and os.path.abspath(os.path.join(directory, name)) != output_root
+        )
+        for name in sorted(files):
+            yield os.path.relpath(os.path.join(directory, name), source_root)
+
+
+def content_key(content, options):
+    return hashlib.sha256(content + json.dumps(options, sort_keys=True).encode()).hexdigest()
+
+
+def in_package(source_root, relative_path):
+    return os.path.exists(os.path.join(source_root, os.path.dirname(relative_path), '__init__.py'))
+
+
+def import_runtime_relatively(tree):
+    # Inside a package, the runtime shipped next to the module is only reachable relative to the package
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module == 'predicate_runtime' and node.level == 0:
+            node.level = 1
+    return tree
+
+
+def obfuscate_file(job):
+    """ Obfuscate one module into the output tree. Modules without functions are copied unchanged, as are modules
+    the technique cannot handle with --allow-unprotected; otherwise those are left out of the output """
+    relative_path, output_path, content, options, key, source_path, package = job
+    start_time = time.perf_counter()
+    # Seeding from the content hash makes a rebuild of an unchanged file produce the same output
+    random.seed(f"{options['seed']}:{key}")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    try:
+        tree = mark_source(ast.parse(content, filename=relative_path))
+        if not any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) for node in ast.walk(tree)):
+            # Nothing to protect, e.g. an empty __init__.py
+            with open(output_path, 'wb') as file:
+                file.write(content)
+            return relative_path, 'copied (no functions)', time.perf_counter() - start_time, output_path
+        tree = obfuscate(options['technique'], tree, options['lazy'])
+        if package:
+            tree = import_runtime_relatively(tree)
+        map_file = None
+        if options['source_maps']:
+            # Maps live outside the output tree, so they are not shipped with the build
+            map_file = os.path.join(options['source_maps'], os.path.splitext(relative_path)[0] + '.map.json')
+        output_path = save_module(tree, output_path, options['format'], source_path if map_file else None, map_file,
+                                  relative_path.replace(os.sep, '/'))
+        status = 'obfuscated'
+    except Exception as e:
+        if options['allow_unprotected']:
+            status = f"copied unprotected ({type(e).__name__}: {e})"
+            with open(output_path, 'wb') as file:
+                file.write(content)
+        else:
+            status = f"failed ({type(e).__name__}: {e})"
+            if os.path.exists(output_path):
+                os.remove(output_path)
+    return relative_path, status, time.perf_counter() - start_time, output_path
+
+
+def load_cache(output_root):
+    try:
+        with open(os.path.join(output_root, CACHE_FILE), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def build(source_root, output_root, options, workers=None):
+    # The cache maps each source to its content key and the output it produced (a .pyc output has another name)
+    cache = load_cache(output_root)
+    new_cache = {}
+    jobs = []
+    copied = cached = 0
+    for relative_path in walk_sources(source_root, output_root):
+        output_path = os.path.join(output_root, relative_path)
+        with open(os.path.join(source_root, relative_path), 'rb') as file:
+            content = file.read()
+        key = content_key(content, options)
+        entry = cache.get(relative_path)
+        if isinstance(entry, dict) and entry['key'] == key and os.path.exists(os.path.join(output_root, entry['output'])):
+            new_cache[relative_path] = entry
+            cached += 1
+        elif relative_path.endswith('.py'):
+            jobs.append((relative_path, output_path, content, options, key, os.path.join(source_root, relative_path),
+                         in_package(source_root, relative_path)))
+        else:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, 'wb') as file:
+                file.write(content)
+            new_cache[relative_path] = {'key': key, 'output': relative_path}
+            copied += 1
+
+    results = []
+    if jobs:
+        # Only pay for the pool when something changed, so a no-op rebuild stays in milliseconds
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(obfuscate_file, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))))
+    for (relative_path, _, _, _, key, _, _), result in zip(jobs, results):
+        # Failed modules stay out of the cache, so the next run tries them again
+        if not result[1].startswith('failed'):
+            new_cache[relative_path] = {'key': key, 'output': os.path.relpath(result[3], output_root),
+                                        'obfuscated': result[1] == 'obfuscated'}
+
+    # Outputs of sources that were deleted since the last run, or that now build to another file
+    outputs = {entry['output'] for entry in new_cache.values()}
+    for entry in cache.values():
+        if isinstance(entry, dict) and entry['output'] not in outputs:
+            stale_path = os.path.join(output_root, entry['output'])
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+    os.makedirs(output_root, exist_ok=True)
+    with open(os.path.join(output_root, CACHE_FILE), 'w') as file:
+        json.dump(new_cache, file, indent=2, sort_keys=True)
+    # Every directory holding an obfuscated module gets its own runtime, so modules of nested packages import it
+    # whether or not the output root is on sys.path. ship_runtime places it next to the path it is given
+    directories = {os.path.dirname(relative_path) for relative_path, entry in new_cache.items() if entry.get('obfuscated')}
+    for directory in sorted(directories | {''}):
+        ship_runtime(os.path.join(output_root, directory, CACHE_FILE), options['runtime'],
+                     in_package(source_root, os.path.join(directory, CACHE_FILE)))
+    return results, copied, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Obfuscate every module of a source tree into a mirrored output tree")
+    parser.add_argument("source_root")
+    parser.add_argument("output_root")
+    parser.add_argument("--technique", default='ModuleShroud', choices=list(TECHNIQUES))
+    parser.add_argument("--runtime", default='qiskit', choices=RUNTIMES)
+    parser.add_argument("--lazy", action="store_true", help="Resolve predicates on first call (not used by ModuleShroud)")
+    parser.add_argument("--format", default='py', choices=['py', 'pyc'],
+                        help="'pyc' writes each module as precompiled bytecode instead of source")
+    parser.add_argument("--source-maps", default=None, help="Directory that receives a source map per obfuscated module")
+    parser.add_argument("--seed", type=int, default=0, help="Seed mixed with each file's hash for reproducible output")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per core)")
+    parser.add_argument("--allow-unprotected", action="store_true",
+                        help="Copy modules the technique cannot handle unchanged instead of failing the build")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    options = {'technique': args.technique, 'runtime': args.runtime, 'lazy': args.lazy, 'format': args.format,
+               'source_maps': args.source_maps and os.path.abspath(args.source_maps), 'seed': args.seed,
+               'allow_unprotected': args.allow_unprotected, 'tool': tool_fingerprint()}
+    results, copied, cached = build(args.source_root, args.output_root, options, args.workers)
+
+    obfuscated = [result for result in results if result[1] == 'obfuscated']
+    failed = [result for result in results if result[1].startswith('failed')]
+    for relative_path, status, _, _ in results:
+        if status != 'obfuscated':
+            print(f"{relative_path}: {status}")
+    print(f"{len(obfuscated)} modules obfuscated, {len(results) - len(obfuscated) - len(failed) + copied} files copied, "
+          f"{cached} unchanged files skipped in {time.perf_counter() - start_time:.3f} s")
+    print(f"Output written to {args.output_root}")
+    if failed:
+        print(f"{len(failed)} modules could not be obfuscated and were left out of the output; "
+              f"rerun with --allow-unprotected to ship them unchanged")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
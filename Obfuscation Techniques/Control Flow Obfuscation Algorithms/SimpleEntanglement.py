@@ -1,26 +1,26 @@
 import ast
+import copy
 import random
-import sys
+from functions import generator_parser, write_output, make_lazy, render_template, parse_source, \
+    protectable_functions, place_branches, commit_predicate
+from decoys import build_decoys, decoy_report, print_decoy_report
 
 
 # This Obfuscation is meant to work on code that contains only one function definition
-def extract_random_function_and_imports(file_path):
-    with open(file_path, 'r') as file:
-        tree = ast.parse(file.read())
+def extract_random_function_and_imports(file_path, tree=None):
+    if tree is None:
+        tree = parse_source(file_path)
 
-    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+    # Functions, coroutines and methods all qualify; each comes with the body (module or class) it sits in
+    functions = protectable_functions(tree)
     imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
-    return random.choice(functions) if functions else None, imports, tree.body
+    random_function, body = random.choice(functions) if functions else (None, None)
+    return random_function, body, imports, tree.body
 
 
-def indent_function_body(function_code):
-    lines = function_code.split('\n')
-    indented_lines = [lines[0]] + ['    ' + line if line else line for line in lines[1:]]
-    return '\n'.join(indented_lines)
-
-
-def modularize_simple_entanglement(sample_code_path, simple_entanglement_code):
-    random_function, imports, sample_code_body = extract_random_function_and_imports(sample_code_path)
+def modularize_simple_entanglement(sample_code_path, simple_entanglement_code, tree=None, commit=False, runtime='qiskit',
+                                   max_bytes=None, max_bytecode=None):
+    random_function, function_body, imports, sample_code_body = extract_random_function_and_imports(sample_code_path, tree)
     if random_function is None:
         raise ValueError("No function found in the sample code")
 
@@ -30,99 +30,91 @@ def modularize_simple_entanglement(sample_code_path, simple_entanglement_code):
         for alias in node.names:
             unique_imports[alias.name] = node
 
-    # Convert the selected function and imports back to code
-    random_function_code = indent_function_body(ast.unparse(random_function))
-    imports_code = "\n".join(ast.unparse(node) for node in unique_imports.values())
-    sample_code_body.remove(random_function)
-    sample_code = "\n".join(
-        ast.unparse(node) for node in sample_code_body if not isinstance(node, (ast.Import, ast.ImportFrom)))
+    # The decoy branches get mutated copies of the module's own functions
+    decoys = build_decoys(ast.Module(body=sample_code_body, type_ignores=[]), 2, max_bytes, max_bytecode)
 
-    # Integrate the obfuscated functions with the code, ensuring they are not adjacent
-    new_code = f"""
-{imports_code}
+    if function_body is sample_code_body:
+        sample_code_body.remove(random_function)
+    sample_code = [node for node in sample_code_body if not isinstance(node, (ast.Import, ast.ImportFrom))]
 
-{simple_entanglement_code}
+    # With commit, the pair is measured here and the output only checks the outcome against the circuit
+    if commit:
+        counts = commit_predicate(simple_entanglement_code + CIRCUIT_CODE, 'qc', 'counts', runtime)
+    else:
+        counts = ast.parse("counts = execute_circuit(qc)").body
 
-# Obfuscated quantum execution
-qr = QuantumRegister(2)
-cr = ClassicalRegister(2)
-qc = QuantumCircuit(qr, cr)
+    # Integrate the obfuscated functions with the code, ensuring they are not adjacent
+    return place_branches(render_template(
+        SIMPLE_ENTANGLEMENT_TEMPLATE,
+        __IMPORTS__=list(dict.fromkeys(unique_imports.values())),
+        __SIMPLE_ENTANGLEMENT__=ast.parse(simple_entanglement_code).body,
+        __CIRCUIT__=ast.parse(CIRCUIT_CODE).body,
+        __COUNTS__=counts,
+        # Each branch gets its own copy of the function's nodes
+        __FUNCTION__=[random_function],
+        __FUNCTION_COPY__=[copy.deepcopy(random_function)],
+        __DECOY_1__=decoys[0],
+        __DECOY_2__=decoys[1],
+        __SAMPLE_CODE__=sample_code,
+    ), [(random_function, function_body)])
+
+
+SIMPLE_ENTANGLEMENT_TEMPLATE = """
+__IMPORTS__
+
+__SIMPLE_ENTANGLEMENT__
 
-create_entangled_pair(qc, qr)
-measure_all(qc, qr, cr)
-result = execute_circuit(qc)
+# Obfuscated quantum execution
+__CIRCUIT__
+__COUNTS__
+result = first_outcome(counts)
 
 
 if result == [0, 0]:
-    {random_function_code}
+    __FUNCTION__
 
 elif result == [1, 1]:
-    {random_function_code}
+    __FUNCTION_COPY__
 
 elif result == [0, 1]:
-    def run_bell_state():
-        # You may change this function to do something else entirely
-        qr = QuantumRegister(2)
-        cr = ClassicalRegister(2)
-        qc = QuantumCircuit(qr, cr)
-        qc.h(qr[0])
-        qc.cx(qr[0], qr[1])
-        measure_all(qc, qr, cr)
-        print("Bell State Algorithm result")
-        print(qc.draw(output='text'))
-        circuit_drawer(qc, output='mpl', style='clifford')
+    __DECOY_1__
 
 elif result == [1, 0]:
-    # You may add another function here        
-    def fibonacci_sequence(n=20):
-        print(f"Fibonacci Sequence up to {{n}} terms:")
-        fib = [0, 1]
-        while len(fib) < n:
-            fib.append(fib[-1] + fib[-2])
-        print(fib)
-{sample_code} 
+    __DECOY_2__
+
+__SAMPLE_CODE__
+"""
 
 
+SIMPLE_ENTANGLEMENT_CODE = """
+from predicate_runtime import QuantumCircuit, ClassicalRegister, QuantumRegister
+from predicate_runtime import create_entangled_pair, measure_all, execute_circuit, first_outcome
 """
 
-    return new_code
+CIRCUIT_CODE = """
+qr = QuantumRegister(2)
+cr = ClassicalRegister(2)
+qc = QuantumCircuit(qr, cr)
+
+create_entangled_pair(qc, qr)
+measure_all(qc, qr, cr)
+"""
 
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python SimpleEntanglement.py <sample_code_path>")
-        sys.exit(1)
-
-    sample_code_path = sys.argv[1]
-    simple_entanglement_code = """
-from qiskit import QuantumCircuit, ClassicalRegister, QuantumRegister, transpile
-from qiskit_aer import AerSimulator
-from qiskit.visualization import circuit_drawer
-
-def create_entangled_pair(qc, qr):
-    qc.h(qr[0])
-    qc.cx(qr[0], qr[1])
-
-def measure_all(qc, qr, cr):
-    qc.measure(qr, cr)
-
-def execute_circuit(qc, backend_name=AerSimulator(), shots=1024):
-    backend = backend_name
-    # Transpile the circuit for the backend
-    transpiled_circuit = transpile(qc, backend)
-    result = backend.run(transpiled_circuit, shots=shots).result()
-    counts = result.get_counts(qc)
-    # Directly read the result from the counts
-    measured_result = list(counts.keys())[0]
-    return [int(bit) for bit in measured_result]
-"""
+    args = generator_parser('SimpleEntanglement.py', commit=True, decoys=True).parse_args()
+
+    new_tree = modularize_simple_entanglement(args.sample_code_path, SIMPLE_ENTANGLEMENT_CODE, commit=args.commit,
+                                              runtime=args.runtime, max_bytes=args.decoy_bytes,
+                                              max_bytecode=args.decoy_bytecode)
 
-    new_code = modularize_simple_entanglement(sample_code_path, simple_entanglement_code)
+    if args.lazy:
+        new_tree = make_lazy(new_tree)
 
-    output_file = 'ObfuscatedSimpleEntanglement.py'
-    with open(output_file, 'w') as file:
-        file.write(new_code)
+    output_file = write_output(new_tree, 'ObfuscatedSimpleEntanglement.py', args.format, args.runtime,
+                               args.sample_code_path)
 
+    print_decoy_report(decoy_report(new_tree))
     print(f"Obfuscated code written to {output_file}")
 
 
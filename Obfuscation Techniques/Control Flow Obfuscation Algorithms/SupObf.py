@@ -1,26 +1,25 @@
 import ast
 import random
-import sys
+from functions import generator_parser, write_output, make_lazy, render_template, parse_source, \
+    protectable_functions, place_branches, commit_predicate
+from decoys import build_decoys, decoy_report, print_decoy_report
 
 
 # This Obfuscation is meant to work on code that contains only one function definition
-def extract_random_function_and_imports(file_path):
-    with open(file_path, 'r') as file:
-        tree = ast.parse(file.read())
+def extract_random_function_and_imports(file_path, tree=None):
+    if tree is None:
+        tree = parse_source(file_path)
 
-    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+    # Functions, coroutines and methods all qualify; each comes with the body (module or class) it sits in
+    functions = protectable_functions(tree)
     imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
-    return random.choice(functions) if functions else None, imports, tree.body
+    random_function, body = random.choice(functions) if functions else (None, None)
+    return random_function, body, imports, tree.body
 
 
-def indent_function_body(function_code):
-    lines = function_code.split('\n')
-    indented_lines = [lines[0]] + ['    ' + line if line else line for line in lines[1:]]
-    return '\n'.join(indented_lines)
-
-
-def modularize_opaque_pred(sample_code_path, opaque_pred_code):
-    random_function, imports, sample_code_body = extract_random_function_and_imports(sample_code_path)
+def modularize_opaque_pred(sample_code_path, opaque_pred_code, tree=None, commit=False, runtime='qiskit', max_bytes=None,
+                           max_bytecode=None):
+    random_function, function_body, imports, sample_code_body = extract_random_function_and_imports(sample_code_path, tree)
     if random_function is None:
         raise ValueError("No function found in the sample code")
 
@@ -30,69 +29,58 @@ def modularize_opaque_pred(sample_code_path, opaque_pred_code):
         for alias in node.names:
             unique_imports[alias.name] = node
 
-    # Convert the selected function and imports back to code
-    random_function_code = indent_function_body(ast.unparse(random_function))
-    imports_code = "\n".join(ast.unparse(node) for node in unique_imports.values())
-    sample_code_body.remove(random_function)
-    sample_code = "\n".join(
-        ast.unparse(node) for node in sample_code_body if not isinstance(node, (ast.Import, ast.ImportFrom)))
+    # The decoy branches get mutated copies of the module's own functions
+    decoys = build_decoys(ast.Module(body=sample_code_body, type_ignores=[]), 3, max_bytes, max_bytecode)
+
+    if function_body is sample_code_body:
+        sample_code_body.remove(random_function)
+    sample_code = [node for node in sample_code_body if not isinstance(node, (ast.Import, ast.ImportFrom))]
+
+    # With commit, the histogram is worked out here and the output only checks the outcome against the circuit
+    if commit:
+        counts = commit_predicate(opaque_pred_code + CIRCUIT_CODE, 'initial_circuit', 'counts', runtime)
+    else:
+        counts = ast.parse("counts = execute_circuit(initial_circuit)").body
+
+    # Integrate everything into the new obfuscated module
+    return place_branches(render_template(
+        SUPOBF_TEMPLATE,
+        __IMPORTS__=list(dict.fromkeys(unique_imports.values())),
+        __OPAQUE_PREDICATE__=ast.parse(opaque_pred_code).body,
+        __COUNTS__=counts,
+        __FUNCTION__=[random_function],
+        __DECOY_1__=decoys[0],
+        __DECOY_2__=decoys[1],
+        __DECOY_3__=decoys[2],
+        __SAMPLE_CODE__=sample_code,
+    ), [(random_function, function_body)])
 
-    # Integrate everything into the new obfuscated code
-    new_code = f"""
-{imports_code}
 
-{opaque_pred_code}
+SUPOBF_TEMPLATE = """
+__IMPORTS__
+
+__OPAQUE_PREDICATE__
 
 
 initial_circuit, qr, cr = create_initial_circuit()
-counts = execute_circuit(initial_circuit)
+__COUNTS__
 selected_path = pather(counts)
 
 if selected_path == '01':
-    def prime_numbers(limit=25):
-        print(f"Prime Numbers up to {{limit}}:")
-        primes = []
-        for num in range(2, limit + 1):
-            is_prime = True
-            for i in range(2, int(num ** 0.5) + 1):
-                if num % i == 0:
-                    is_prime = False
-                    break
-            if is_prime:
-                primes.append(num)
-        print(primes)
+    __DECOY_1__
 elif selected_path == '11':
-    {random_function_code}
+    __FUNCTION__
 elif selected_path == '10':
-    def fibonacci_sequence(n=20):
-        print(f"Fibonacci Sequence up to {{n}} terms:")
-        fib = [0, 1]
-        while len(fib) < n:
-            fib.append(fib[-1] + fib[-2])
-        print(fib)
+    __DECOY_2__
 elif selected_path == '00':
-    def factorial_calculator(n=10):
-        print(f"Factorials up to {{n}}:")
-        factorials = {{}}
-        for i in range(1, n + 1):
-            factorials[i] = 1 if i == 1 else i * factorials[i - 1]
-        for key, value in factorials.items():
-            print(f"{{key}}! = {{value}}")
-
-{sample_code}            
-"""
-    return new_code
+    __DECOY_3__
 
+__SAMPLE_CODE__
+"""
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python SupObf.py <sample_code_path>")
-        sys.exit(1)
 
-    sample_code_path = sys.argv[1]
-    opaque_pred_code = """
-from qiskit import QuantumCircuit, ClassicalRegister, QuantumRegister, transpile
-from qiskit_aer import AerSimulator
+OPAQUE_PRED_CODE = """
+from predicate_runtime import QuantumCircuit, ClassicalRegister, QuantumRegister, execute_circuit, most_frequent
 
 def create_initial_circuit():
     qr = QuantumRegister(5, 'q')
@@ -123,25 +111,29 @@ def create_initial_circuit():
     circuit.measure(qr[:4], cr[:4])
     return circuit, qr, cr
 
-def execute_circuit(circuit):
-    backend = AerSimulator()
-    # Transpile the circuit for the backend
-    transpiled_circuit = transpile(circuit, backend)
-    result = backend.run(transpiled_circuit, shots=1024).result()
-    counts = result.get_counts()
-    return counts
-
 def pather(counts):
-    selection = max(counts.items(), key=lambda item: item[1])[0][::-1]
+    selection = most_frequent(counts)[::-1]
     return selection[2:4]
 """
 
-    new_code = modularize_opaque_pred(sample_code_path, opaque_pred_code)
+CIRCUIT_CODE = """
+initial_circuit, qr, cr = create_initial_circuit()
+"""
+
+
+def main():
+    args = generator_parser('SupObf.py', commit=True, decoys=True).parse_args()
+
+    new_tree = modularize_opaque_pred(args.sample_code_path, OPAQUE_PRED_CODE, commit=args.commit, runtime=args.runtime,
+                                      max_bytes=args.decoy_bytes, max_bytecode=args.decoy_bytecode)
+
+    if args.lazy:
+        new_tree = make_lazy(new_tree)
 
-    output_file = 'ObfuscatedSuperPosBranch.py'
-    with open(output_file, 'w') as file:
-        file.write(new_code)
+    output_file = write_output(new_tree, 'ObfuscatedSuperPosBranch.py', args.format, args.runtime,
+                               args.sample_code_path)
 
+    print_decoy_report(decoy_report(new_tree))
     print(f"Modularized code written to {output_file}")
 
 
@@ -1,17 +1,45 @@
 import ast
-import sys
 import random
+from functions import parse_generator_args, write_output, make_lazy, render_template, parse_source, \
+    protectable_functions, place_branches
+
+SHROUD_TEMPLATE = """
+__IMPORTS__
+from predicate_runtime import QuantumCircuit, run_statevector
+
+# Create a quantum circuit with one qubit
+qc = QuantumCircuit(1)
+qc.h(0)  # Put the qubit in superposition using a Hadamard gate
+qc.save_statevector()
+
+# Execute the circuit on the shared runtime's statevector simulator
+statevector = run_statevector(qc)
+
+# Decision based on quantum statevector measurement
+if abs(statevector[0]) > 0:
+    # This branch shall always execute
+    __FUNCTION_1__
+if abs(statevector[1]) > 0:
+    # This branch shall never execute
+    # The statevector for [1] is always 0
+    __FUNCTION_2__
+
+__OTHER_FUNCTIONS__
+__OTHER_CODE__
+"""
 
 
 # This Obfuscation is meant to work on code that contains at least 2 function declarations.
-def obfuscate_code(input_file, output_file):
-    # Read the input file
-    with open(input_file, 'r') as file:
-        code = file.read()
+def obfuscate_code(input_file, output_file, runtime='qiskit', lazy=False, output_format='py'):
+    # Parse the input file, remembering the original line numbers for the source map
+    parsed_code = parse_source(input_file)
+    obfuscated_tree = obfuscate_tree(parsed_code, lazy)
 
-    # Parse the code into an AST
-    parsed_code = ast.parse(code)
+    # Write the obfuscated module to the output file
+    return write_output(obfuscated_tree, output_file, output_format, runtime, input_file)
 
+
+def obfuscate_tree(parsed_code, lazy=False):
     # Extract import statements and functions
     imports = []
     other_nodes = []
@@ -20,80 +48,42 @@ def obfuscate_code(input_file, output_file):
     for node in parsed_code.body:
         if isinstance(node, ast.Import) or isinstance(node, ast.ImportFrom):
             imports.append(node)
-        elif isinstance(node, ast.FunctionDef):
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
             function_defs.append(node)
         else:
             other_nodes.append(node)
 
-    # Select two random functions from the parsed code
-    if len(function_defs) < 2:
+    # Select two random functions, coroutines or methods from the parsed code
+    candidates = protectable_functions(parsed_code)
+    if len(candidates) < 2:
         raise ValueError("The input code must contain at least two functions.")
 
-    selected_functions = random.sample(function_defs, 2)
+    selected = random.sample(candidates, 2)
+    selected_functions = [function for function, _ in selected]
 
     # Remove the selected functions from other_nodes
     other_functions = [node for node in function_defs if node not in selected_functions]
 
-    # Convert AST nodes back to code
-    def ast_to_code(nodes):
-        return "\n".join([ast.unparse(node) for node in nodes])
-
-    # Create the code for the selected functions
-    function_1_code = ast_to_code([selected_functions[0]])
-    function_2_code = ast_to_code([selected_functions[1]])
-    other_functions_code = ast_to_code(other_functions)
-    other_code = ast_to_code(other_nodes)
-    imports_code = ast_to_code(imports)
-
-    # Ensure the function codes are properly formatted
-    function_1_code = "\n    ".join(function_1_code.split("\n"))
-    function_2_code = "\n    ".join(function_2_code.split("\n"))
-    other_functions_code = "\n".join(other_functions_code.split("\n"))
-    other_code = "\n".join(other_code.split("\n"))
-
-    # Create the obfuscated code
-    obfuscated_code = f"""
-{imports_code}
-from qiskit import QuantumCircuit, transpile
-from qiskit_aer import AerSimulator
-
-# Create a quantum circuit with one qubit
-qc = QuantumCircuit(1)
-qc.h(0)  # Put the qubit in superposition using a Hadamard gate
-qc.save_statevector()
-
-# Use Aer's statevector_simulator
-simulator = AerSimulator(method="statevector")
-
-# Transpile the circuit for the simulator
-transpiled_qc = transpile(qc, simulator)
-
-# Execute the transpiled circuit on the statevector simulator
-result = simulator.run(transpiled_qc).result()
-
-# Grab results from the job
-statevector = result.get_statevector()
-
-# Decision based on quantum statevector measurement
-if abs(statevector[0]) > 0:
-    # This branch shall always execute
-    {function_1_code}
-if abs(statevector[1]) > 0:
-    # This branch shall never execute
-    # The statevector for [1] is always 0
-    {function_2_code}
-
-{other_functions_code}
-{other_code}
-"""
+    # Splice the nodes into the template, so the output is a module AST rather than re-indented text
+    obfuscated_tree = render_template(
+        SHROUD_TEMPLATE,
+        __IMPORTS__=imports,
+        __FUNCTION_1__=[selected_functions[0]],
+        __FUNCTION_2__=[selected_functions[1]],
+        __OTHER_FUNCTIONS__=other_functions,
+        __OTHER_CODE__=other_nodes,
+    )
+    # Selected methods go back into their classes inside their branches
+    obfuscated_tree = place_branches(obfuscated_tree, [(function, body) for function, body in selected
+                                                        if body is not parsed_code.body])
 
-    # Write the obfuscated code to the output file
-    with open(output_file, 'w') as file:
-        file.write(obfuscated_code)
+    if lazy:
+        obfuscated_tree = make_lazy(obfuscated_tree)
+    return obfuscated_tree
 
 
 # Accept the input and output file names as arguments
 if __name__ == "__main__":
-    input_file = sys.argv[1]
-    output_file = 'ObfuscatedSuperPosShroud.py'
-    obfuscate_code(input_file, output_file)
\ No newline at end of file
+    args = parse_generator_args('SuperPosShroud.py')
+    output_file = obfuscate_code(args.sample_code_path, 'ObfuscatedSuperPosShroud.py', args.runtime, args.lazy, args.format)
+    print(f"Obfuscated code written to {output_file}")
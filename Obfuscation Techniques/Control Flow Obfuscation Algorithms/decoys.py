@@ -0,0 +1,151 @@
+import re
+import ast
+import copy
+import time
+import random
+import marshal
+
+# Decoy functions for the branches a predicate never takes. Each one is a mutated copy of a function of the
+# module being obfuscated, so decoys look like the code around them and differ from one output to the next.
+
+# Operators swapped for one of the same kind, so a decoy still reads like working code
+SWAPS = {
+    ast.Add: [ast.Sub, ast.Mult], ast.Sub: [ast.Add], ast.Mult: [ast.Add, ast.FloorDiv], ast.FloorDiv: [ast.Mult],
+    ast.Div: [ast.Mult], ast.Mod: [ast.FloorDiv], ast.Lt: [ast.LtE, ast.Gt], ast.LtE: [ast.Lt], ast.Gt: [ast.GtE, ast.Lt],
+    ast.GtE: [ast.Gt], ast.Eq: [ast.NotEq], ast.NotEq: [ast.Eq], ast.And: [ast.Or], ast.Or: [ast.And],
+}
+
+
+class DecoyMutator(ast.NodeTransformer):
+    """ Perturb the constants and operators of a copied function, and point its self-references at the new name """
+
+    def __init__(self, old_name, new_name, strings):
+        self.old_name = old_name
+        self.new_name = new_name
+        self.strings = strings
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float, str)):
+            return node
+        if isinstance(node.value, str):
+            if self.strings and random.random() < 0.5:
+                node.value = random.choice(self.strings)
+        elif random.random() < 0.7:
+            node.value = node.value + random.choice([-2, -1, 1, 2, 3]) if node.value else random.randint(1, 9)
+        return node
+
+    def visit_operator(self, node):
+        swaps = SWAPS.get(type(node))
+        return random.choice(swaps)() if swaps and random.random() < 0.5 else node
+
+    visit_Add = visit_Sub = visit_Mult = visit_FloorDiv = visit_Div = visit_Mod = visit_operator
+    visit_Lt = visit_LtE = visit_Gt = visit_GtE = visit_Eq = visit_NotEq = visit_And = visit_Or = visit_operator
+
+    def visit_Name(self, node):
+        if node.id == self.old_name:
+            node.id = self.new_name
+        return node
+
+
+def function_shapes(tree):
+    """ The module-level sync functions and methods decoys are copied from; a module without any lends its
+    top-level code. Nested functions are left out, since their free and nonlocal names only bind inside their
+    enclosing function """
+    shapes = []
+    pending = list(tree.body)
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, ast.FunctionDef):
+            shapes.append(node)
+        elif isinstance(node, ast.ClassDef):
+            pending.extend(node.body)
+    if not shapes:
+        body = [node for node in tree.body if not isinstance(node, (ast.Import, ast.ImportFrom))]
+        if body:
+            shapes.append(ast.FunctionDef(name='run', args=ast.arguments(posonlyargs=[], args=[], vararg=None,
+                                          kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[]),
+                                          body=body, decorator_list=[]))
+    return shapes
+
+
+def decoy_name(tree, taken):
+    # Two words of the module's own identifiers, so the name fits the naming of the code around it
+    words = sorted({word for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.Name))
+                    for word in re.findall(r'[a-z]+', (node.name if isinstance(node, ast.FunctionDef) else node.id).lower())
+                    if len(word) > 2})
+    words = words or ['value', 'result', 'update', 'compute']
+    name = '_'.join(random.sample(words, 2) if len(words) > 1 else words)
+    suffix = 2
+    while name in taken:
+        name = f"{name.rstrip('0123456789_')}_{suffix}"
+        suffix += 1
+    taken.add(name)
+    return name
+
+
+def make_decoy(shape, name, strings):
+    decoy = DecoyMutator(shape.name, name, strings).visit(copy.deepcopy(shape))
+    decoy.name = name
+    decoy.decorator_list = []
+    # Dropping a statement keeps decoys of the same shape from being line-for-line alike
+    if len(decoy.body) > 2 and random.random() < 0.5:
+        del decoy.body[random.randrange(len(decoy.body) - 1)]
+    decoy.decoy = True
+    return ast.fix_missing_locations(decoy)
+
+
+def code_size(nodes):
+    """ Source and marshalled bytecode size of a list of statements """
+    module = ast.fix_missing_locations(ast.Module(body=list(nodes), type_ignores=[]))
+    return len(ast.unparse(module).encode()), len(marshal.dumps(compile(module, '<decoy>', 'exec')))
+
+
+def build_decoys(tree, slots, max_bytes=None, max_bytecode=None, attempts=8):
+    """ One decoy function per slot, within the module's source and bytecode budget; slots that do not fit
+    get a bare pass """
+    shapes = function_shapes(tree)
+    strings = sorted({node.value for node in ast.walk(tree) if isinstance(node, ast.Constant)
+                      and isinstance(node.value, str) and 0 < len(node.value) < 80})
+    taken = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    taken |= {node.name for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))}
+    used_bytes = used_bytecode = 0
+    decoys = []
+    for _ in range(slots):
+        decoy = None
+        for _ in range(attempts if shapes else 0):
+            candidate = make_decoy(random.choice(shapes), decoy_name(tree, taken), strings)
+            try:
+                source_bytes, bytecode = code_size([candidate])
+            except SyntaxError:
+                # A mutation or a copied construct that only compiles in its original place
+                continue
+            if (max_bytes is None or used_bytes + source_bytes <= max_bytes) and \
+                    (max_bytecode is None or used_bytecode + bytecode <= max_bytecode):
+                decoy = candidate
+                used_bytes += source_bytes
+                used_bytecode += bytecode
+                break
+        decoys.append([decoy] if decoy else [ast.Pass()])
+    return decoys
+
+
+def decoy_report(tree, repeat=200):
+    """ Count, size and import cost of the decoys in a generated module. A decoy never runs, so its import cost is
+    the unmarshalling of its code objects, timed here """
+    decoys = [node for node in ast.walk(tree) if getattr(node, 'decoy', False)]
+    if not decoys:
+        return {'decoys': 0, 'bytes': 0, 'bytecode': 0, 'import_ms': 0.0}
+    source_bytes, bytecode = code_size(copy.deepcopy(decoys))
+    data = marshal.dumps(compile(ast.fix_missing_locations(ast.Module(body=copy.deepcopy(decoys), type_ignores=[])),
+                                 '<decoy>', 'exec'))
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        marshal.loads(data)
+        best = min(best, time.perf_counter() - start_time)
+    return {'decoys': len(decoys), 'bytes': source_bytes, 'bytecode': bytecode, 'import_ms': best * 1000}
+
+
+def print_decoy_report(report):
+    print(f"Decoys: {report['decoys']}, +{report['bytes']} B source, +{report['bytecode']} B bytecode, "
+          f"+{report['import_ms']:.3f} ms import")
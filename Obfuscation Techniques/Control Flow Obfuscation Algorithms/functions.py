@@ -0,0 +1,345 @@
+import os
+import re
+import ast
+import sys
+import json
+import random
+import types
+import shutil
+import marshal
+import zipapp
+import zipfile
+import argparse
+import importlib.util
+from io import BytesIO
+
+MICROSIM_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'microsim.py')
+RUNTIME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'predicate_runtime.py')
+
+# 'qiskit' runs the predicates on qiskit_aer; 'numpy' swaps in the bundled microsim.py module
+RUNTIMES = ['qiskit', 'numpy']
+
+# 'py' writes source; 'pyc' and 'zipapp' write bytecode compiled straight from the generated AST
+OUTPUT_FORMATS = ['py', 'pyc', 'zipapp']
+
+QISKIT_IMPORT = re.compile(r'^from (?:qiskit|qiskit_aer|qiskit\.visualization) import ', re.MULTILINE)
+
+
+def generator_parser(script_name, lazy=True, commit=False, decoys=False):
+    """ Shared command line of the control flow obfuscators; scripts may add their own options """
+    parser = argparse.ArgumentParser(description=f"{script_name} control flow obfuscation")
+    parser.add_argument("sample_code_path")
+    parser.add_argument("--runtime", default='qiskit', choices=RUNTIMES,
+                        help="'numpy' evaluates the predicate with microsim.py instead of qiskit_aer")
+    if lazy:
+        parser.add_argument("--lazy", action="store_true",
+                            help="Evaluate the predicate on the first call of a protected function instead of at import")
+    parser.add_argument("--format", default='py', choices=OUTPUT_FORMATS,
+                        help="'pyc' and 'zipapp' ship precompiled bytecode, so the output starts without being parsed")
+    if commit:
+        parser.add_argument("--commit", action="store_true",
+                            help="Resolve the predicate now and only check a commitment to its outcome at run time")
+    if decoys:
+        parser.add_argument("--decoy-bytes", type=int, default=None, help="Source size budget of the module's decoys")
+        parser.add_argument("--decoy-bytecode", type=int, default=None, help="Marshalled bytecode budget of the module's decoys")
+    return parser
+
+
+def parse_generator_args(script_name):
+    return generator_parser(script_name).parse_args()
+
+
+def use_runtime(predicate_code, runtime):
+    """ Point the predicate's qiskit imports at the selected runtime """
+    if runtime == 'numpy':
+        return QISKIT_IMPORT.sub('from microsim import ', predicate_code)
+    return predicate_code
+
+
+def runtime_source(runtime):
+    with open(RUNTIME_PATH, 'r') as file:
+        return use_runtime(file.read(), runtime)
+
+
+def ship_runtime(output_file, runtime, package=False):
+    # Generated code imports its helpers from predicate_runtime.py, which has to sit next to the obfuscated program
+    # (with microsim.py for the NumPy runtime). A copy shipped inside a package imports microsim relative to itself
+    directory = os.path.dirname(os.path.abspath(output_file))
+    if directory == os.path.dirname(RUNTIME_PATH):
+        # The tool directory already holds the qiskit runtime; rewriting it in place would break the tools
+        if runtime == 'numpy':
+            raise ValueError("Write NumPy runtime outputs outside the tool directory")
+        return
+    source = runtime_source(runtime)
+    if package:
+        source = source.replace('from microsim import ', 'from .microsim import ')
+    with open(os.path.join(directory, 'predicate_runtime.py'), 'w') as file:
+        file.write(source)
+    if runtime == 'numpy':
+        shutil.copyfile(MICROSIM_PATH, os.path.join(directory, 'microsim.py'))
+
+
+def load_runtime(runtime):
+    """ Import predicate_runtime for the given runtime, so generated predicates can be evaluated by the tools """
+    module = types.ModuleType('predicate_runtime')
+    module.__file__ = RUNTIME_PATH
+    exec(compile(runtime_source(runtime), RUNTIME_PATH, 'exec'), module.__dict__)
+    sys.modules['predicate_runtime'] = module
+    return module
+
+
+# Stands in for the shot histogram of a predicate resolved at build time: one key, checked against the circuit
+COMMIT_TEMPLATE = """
+from predicate_runtime import committed_outcome
+{counts} = {{committed_outcome({circuit}, {sealed!r}, {commitment!r}): 1}}
+"""
+
+
+def commit_predicate(setup_code, circuit, counts, runtime):
+    """ Evaluate a predicate circuit exactly and return the statements that replace its execution """
+    runtime_module = load_runtime(runtime)
+    namespace = {}
+    exec(compile(setup_code, '<predicate>', 'exec'), namespace)
+    outcome = runtime_module.resolve_outcome(eval(circuit, namespace))
+    sealed, commitment = runtime_module.seal_outcome(outcome, random.getrandbits(128).to_bytes(16, 'big'))
+    return ast.parse(COMMIT_TEMPLATE.format(counts=counts, circuit=circuit, sealed=sealed, commitment=commitment)).body
+
+
+class TemplateSplicer(ast.NodeTransformer):
+    """ Fill a parsed template: a placeholder statement (a bare __NAME__) becomes a list of statements,
+    a placeholder name inside an expression becomes an expression """
+
+    def __init__(self, replacements):
+        self.replacements = replacements
+
+    def visit_Expr(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id in self.replacements:
+            return self.replacements[node.value.id]
+        return self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id in self.replacements:
+            return ast.copy_location(self.replacements[node.id], node)
+        return node
+
+
+def render_template(template, **replacements):
+    """ Parse a generator template and splice AST nodes into its placeholders, giving the output module's AST """
+    return ast.fix_missing_locations(TemplateSplicer(replacements).visit(ast.parse(template)))
+
+
+def pyc_bytes(code):
+    # A sourceless .pyc: the header has no source timestamp to check, so the interpreter loads the bytecode as is
+    return importlib.util.MAGIC_NUMBER + bytes(12) + marshal.dumps(code)
+
+
+def mark_source(tree):
+    """ Remember each node's line in the original file, so it can be found again however the tree is rearranged """
+    for node in ast.walk(tree):
+        if hasattr(node, 'lineno'):
+            node.source_lineno = node.lineno
+    return tree
+
+
+def parse_source(file_path):
+    with open(file_path, 'r') as file:
+        return mark_source(ast.parse(file.read(), filename=file_path))
+
+
+def source_map(tree, text, source_file, code_name):
+    """ Map each line of the laid-out output (and each function) to the original line its nodes came from """
+    lines = {}
+    functions = []
+    # Unparsing keeps the structure, so both walks visit the same nodes in the same order
+    for node, output_node in zip(ast.walk(tree), ast.walk(ast.parse(text))):
+        if type(node) is not type(output_node):
+            break
+        line = getattr(node, 'source_lineno', None)
+        if line is None or not hasattr(output_node, 'lineno'):
+            continue
+        lines.setdefault(str(output_node.lineno), line)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.append({'name': node.name, 'line': output_node.lineno, 'original_line': line})
+    return {'version': 1, 'file': code_name, 'source': os.path.abspath(source_file), 'lines': lines, 'functions': functions}
+
+
+def write_source_map(tree, text, source_file, map_file, code_name):
+    os.makedirs(os.path.dirname(os.path.abspath(map_file)), exist_ok=True)
+    with open(map_file, 'w') as file:
+        json.dump(source_map(tree, text, source_file, code_name), file, indent=1)
+
+
+def save_module(tree, output_file, output_format='py', source_file=None, map_file=None, code_name=None):
+    """ Write a generated module as source or as a .pyc next to output_file; returns the path written.
+    With source_file, a source map goes to map_file (default: next to the output) """
+    text = ast.unparse(ast.fix_missing_locations(tree)) + "\n"
+    code_name = code_name or os.path.basename(output_file)
+    if output_format == 'pyc':
+        output_file = os.path.splitext(output_file)[0] + '.pyc'
+        # Compiled from the laid-out text's tree, so the bytecode's line numbers are the ones the source map uses
+        with open(output_file, 'wb') as file:
+            file.write(pyc_bytes(compile(ast.parse(text), code_name, 'exec')))
+    elif output_format == 'py':
+        with open(output_file, 'w') as file:
+            file.write(text)
+    else:
+        raise ValueError(f"Unknown output format '{output_format}'. Choose from: py, pyc")
+    if source_file:
+        write_source_map(tree, text, source_file, map_file or os.path.splitext(output_file)[0] + '.map.json', code_name)
+    return output_file
+
+
+def write_zipapp(tree, output_file, runtime, source_file=None):
+    """ Bundle the compiled module with a compiled predicate runtime into one runnable archive """
+    text = ast.unparse(ast.fix_missing_locations(tree)) + "\n"
+    modules = {'__main__': compile(ast.parse(text), '__main__.py', 'exec'),
+               'predicate_runtime': compile(runtime_source(runtime), 'predicate_runtime.py', 'exec')}
+    if runtime == 'numpy':
+        with open(MICROSIM_PATH, 'r') as file:
+            modules['microsim'] = compile(file.read(), 'microsim.py', 'exec')
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for name, code in modules.items():
+            bundle.writestr(name + '.pyc', pyc_bytes(code))
+    archive.seek(0)
+    output_file = os.path.splitext(output_file)[0] + '.pyz'
+    zipapp.create_archive(archive, output_file, interpreter='/usr/bin/env python3')
+    if source_file:
+        write_source_map(tree, text, source_file, os.path.splitext(output_file)[0] + '.map.json', '__main__.py')
+    return output_file
+
+
+def write_output(tree, output_file, output_format='py', runtime='qiskit', source_file=None):
+    """ Write a generated module in the requested format together with the runtime it imports; returns the path written """
+    if output_format == 'zipapp':
+        # The archive carries its own runtime
+        return write_zipapp(tree, output_file, runtime, source_file)
+    output_file = save_module(tree, output_file, output_format, source_file)
+    ship_runtime(output_file, runtime)
+    return output_file
+
+
+LAZY_RESOLVER = """
+import asyncio as _asyncio
+import threading as _threading
+
+_resolved = {}
+_resolve_lock = _threading.Lock()
+
+
+def _resolve_predicate():
+    if not _resolved:
+        with _resolve_lock:
+            # Threads that lost the race find the functions already resolved
+            if not _resolved:
+                functions = _evaluate_predicate()
+                # Later calls by name go straight to the selected functions
+                globals().update(functions)
+                _resolved.update(functions)
+    return _resolved
+
+
+async def _aresolve_predicate():
+    # Event loops keep running while the predicate is simulated in the default executor
+    if not _resolved:
+        await _asyncio.get_running_loop().run_in_executor(None, _resolve_predicate)
+    return _resolved
+"""
+
+LAZY_STUB = """
+{keyword}def {name}(*args, **kwargs):
+    functions = {resolve}
+    if '{name}' not in functions:
+        raise NameError("name '{name}' is not defined")
+    return {call}functions['{name}'](*args, **kwargs)
+"""
+
+
+def is_branch(node):
+    """ A top-level if whose branches define the protected (or decoy) functions """
+    while isinstance(node, ast.If):
+        if any(isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) for child in node.body + node.orelse):
+            return True
+        node = node.orelse[0] if len(node.orelse) == 1 else None
+    return False
+
+
+def protectable_functions(tree):
+    """ Module-level functions and coroutines and the methods of (nested) classes, each with the body it sits in """
+    found = []
+
+    def visit(body):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                found.append((node, body))
+            elif isinstance(node, ast.ClassDef):
+                visit(node.body)
+
+    visit(tree.body)
+    return found
+
+
+def place_branches(tree, placements):
+    """ Move the template branches holding protected methods from module level into their classes. The predicate
+    stays hoisted at module level, so the class body picks a branch once and instances and awaits pay nothing """
+    for function, body in placements:
+        index = next((index for index, node in enumerate(body or []) if node is function), None)
+        if index is None:
+            # A module-level function was already taken out of the module and sits in its branch
+            continue
+        branch = next(node for node in tree.body if is_branch(node) and any(child is function for child in ast.walk(node)))
+        tree.body.remove(branch)
+        body[index] = branch
+    return tree
+
+
+def branch_functions(node):
+    functions = {}
+    for child in ast.walk(node):
+        if isinstance(child, ast.If):
+            for statement in child.body + child.orelse:
+                if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    functions.setdefault(statement.name, statement)
+    return functions
+
+
+def is_runtime_import(node):
+    return isinstance(node, ast.ImportFrom) and node.module and node.module.split('.')[0] in ('qiskit', 'qiskit_aer', 'microsim', 'predicate_runtime')
+
+
+def make_lazy(tree):
+    """ Move the predicate and its branches into a resolver that only runs on the first call of a protected function """
+    body = tree.body
+    first = next((index for index, node in enumerate(body) if is_branch(node)), None)
+    if first is None:
+        return tree
+    last = first
+    while last < len(body) and is_branch(body[last]):
+        last += 1
+
+    # Everything the predicate needs (its runtime imports, helpers and statements) runs inside the resolver;
+    # the sample's own imports stay at module level
+    head = body[:first]
+    module_imports = [node for node in head if isinstance(node, (ast.Import, ast.ImportFrom)) and not is_runtime_import(node)]
+    predicate = [node for node in head if node not in module_imports]
+    # Branches moved into classes read the predicate when the class is created, so it has to stay at module level
+    predicate_names = {node.id for statement in predicate for node in ast.walk(statement)
+                       if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+    if any(isinstance(node, ast.Name) and node.id in predicate_names for statement in body[last:] for node in ast.walk(statement)):
+        return tree
+    branches = body[first:last]
+    functions = {}
+    for branch in branches:
+        for name, node in branch_functions(branch).items():
+            functions.setdefault(name, node)
+
+    evaluate = ast.parse(f"def _evaluate_predicate():\n    return {{name: value for name, value in locals().items() if name in {tuple(functions)!r}}}").body[0]
+    evaluate.body = predicate + branches + evaluate.body
+    stubs = []
+    for name, node in functions.items():
+        is_async = isinstance(node, ast.AsyncFunctionDef)
+        stubs += ast.parse(LAZY_STUB.format(name=name, keyword='async ' if is_async else '', call='await ' if is_async else '',
+                                            resolve='await _aresolve_predicate()' if is_async else '_resolve_predicate()')).body
+
+    tree.body = module_imports + [evaluate] + ast.parse(LAZY_RESOLVER).body + stubs + body[last:]
+    return ast.fix_missing_locations(tree)
@@ -0,0 +1,359 @@
+import numpy as np
+
+# A NumPy stand-in for the small part of qiskit/qiskit_aer the opaque predicates use. Generated programs
+# import it in place of qiskit, so the circuit is still built gate by gate but evaluates in microseconds.
+# Bit ordering matches qiskit: qubit 0 is the least significant bit of a basis index and the rightmost
+# character of a counts key.
+
+SQRT_HALF = np.sqrt(0.5)
+
+GATES = {
+    'x': np.array([[0, 1], [1, 0]], dtype=complex),
+    'y': np.array([[0, -1j], [1j, 0]], dtype=complex),
+    'z': np.array([[1, 0], [0, -1]], dtype=complex),
+    'h': np.array([[SQRT_HALF, SQRT_HALF], [SQRT_HALF, -SQRT_HALF]], dtype=complex),
+    's': np.array([[1, 0], [0, 1j]], dtype=complex),
+    'sdg': np.array([[1, 0], [0, -1j]], dtype=complex),
+    't': np.array([[1, 0], [0, np.exp(1j * np.pi / 4)]], dtype=complex),
+    'tdg': np.array([[1, 0], [0, np.exp(-1j * np.pi / 4)]], dtype=complex),
+    # Two-qubit gates are indexed [out_a, out_b, in_a, in_b] for gate(a, b)
+    'cx': np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 1], [0, 0, 1, 0]], dtype=complex).reshape(2, 2, 2, 2),
+    'cz': np.diag([1, 1, 1, -1]).astype(complex).reshape(2, 2, 2, 2),
+    'swap': np.array([[1, 0, 0, 0], [0, 0, 1, 0], [0, 1, 0, 0], [0, 0, 0, 1]], dtype=complex).reshape(2, 2, 2, 2),
+}
+
+
+class Bit:
+    def __init__(self, register, index):
+        self.register = register
+        self.index = index
+
+
+class Register:
+    prefix = 'r'
+    count = 0
+
+    def __init__(self, size, name=None):
+        if name is None:
+            name = f"{self.prefix}{type(self).count}"
+            type(self).count += 1
+        self.size = size
+        self.name = name
+        self.bits = [Bit(self, index) for index in range(size)]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.bits)
+
+    def __getitem__(self, key):
+        return self.bits[key]
+
+
+class QuantumRegister(Register):
+    prefix = 'q'
+
+
+class ClassicalRegister(Register):
+    prefix = 'c'
+
+
+class QuantumCircuit:
+    def __init__(self, *registers):
+        self.qregs = []
+        self.cregs = []
+        self.qubits = []
+        self.clbits = []
+        self.data = []
+        # qiskit also accepts plain sizes: QuantumCircuit(num_qubits[, num_clbits])
+        if registers and all(isinstance(register, int) for register in registers):
+            registers = [QuantumRegister(registers[0], 'q')] + ([ClassicalRegister(registers[1], 'c')] if len(registers) > 1 else [])
+        for register in registers:
+            if isinstance(register, QuantumRegister):
+                self.qregs.append(register)
+                self.qubits.extend(register)
+            else:
+                self.cregs.append(register)
+                self.clbits.extend(register)
+
+    @property
+    def num_qubits(self):
+        return len(self.qubits)
+
+    @property
+    def num_clbits(self):
+        return len(self.clbits)
+
+    def _indices(self, arg, bits):
+        # Resolve ints, bits, registers and lists/slices of them to flat bit indices
+        if isinstance(arg, int):
+            return [arg]
+        if isinstance(arg, Bit):
+            return [bits.index(arg)]
+        return [index for item in arg for index in self._indices(item, bits)]
+
+    def _append(self, name, *args):
+        targets = [self._indices(arg, self.qubits) for arg in args]
+        width = max(len(indices) for indices in targets)
+        # Broadcast like qiskit: h(qr) applies h to every qubit, cx(a_list, b_list) pairs them up
+        for position in range(width):
+            self.data.append((name, tuple(indices[position if len(indices) > 1 else 0] for indices in targets)))
+        return self
+
+    def h(self, qubit): return self._append('h', qubit)
+    def x(self, qubit): return self._append('x', qubit)
+    def y(self, qubit): return self._append('y', qubit)
+    def z(self, qubit): return self._append('z', qubit)
+    def s(self, qubit): return self._append('s', qubit)
+    def sdg(self, qubit): return self._append('sdg', qubit)
+    def t(self, qubit): return self._append('t', qubit)
+    def tdg(self, qubit): return self._append('tdg', qubit)
+    def cx(self, control, target): return self._append('cx', control, target)
+    def cz(self, control, target): return self._append('cz', control, target)
+    def swap(self, qubit1, qubit2): return self._append('swap', qubit1, qubit2)
+
+    def measure(self, qubit, clbit):
+        qubits = self._indices(qubit, self.qubits)
+        clbits = self._indices(clbit, self.clbits)
+        if len(qubits) != len(clbits):
+            raise ValueError("measure needs as many classical bits as qubits")
+        self.data.extend(('measure', (q,), c) for q, c in zip(qubits, clbits))
+        return self
+
+    def measure_all(self):
+        register = ClassicalRegister(self.num_qubits, 'meas')
+        self.cregs.append(register)
+        self.clbits.extend(register)
+        return self.measure(list(range(self.num_qubits)), list(register))
+
+    def save_statevector(self):
+        self.data.append(('save_statevector', ()))
+        return self
+
+    def draw(self, output='text', **kwargs):
+        lines = []
+        for instruction in self.data:
+            name, qubits = instruction[0], instruction[1]
+            target = f" -> c[{instruction[2]}]" if name == 'measure' else ''
+            lines.append(f"{name:<18}{', '.join(f'q[{qubit}]' for qubit in qubits)}{target}")
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.draw()
+
+
+def apply_gate(state, name, qubits):
+    """ Apply a named gate to a state tensor of shape (2,) * n in place of a full 2^n x 2^n matrix """
+    num_qubits = state.ndim
+    axes = [num_qubits - 1 - qubit for qubit in qubits]
+    matrix = GATES[name]
+    if len(axes) == 1:
+        return np.moveaxis(np.tensordot(matrix, state, axes=(1, axes[0])), 0, axes[0])
+    return np.moveaxis(np.tensordot(matrix, state, axes=([2, 3], axes)), [0, 1], axes)
+
+
+class Result:
+    def __init__(self, circuit, counts, statevector):
+        self.circuit = circuit
+        self._counts = counts
+        self._statevector = statevector
+
+    def get_counts(self, circuit=None):
+        if self._counts is None:
+            raise ValueError("The circuit has no measurements")
+        return self._counts
+
+    def get_statevector(self, circuit=None):
+        if self._statevector is None:
+            raise ValueError("The circuit has no save_statevector instruction")
+        return self._statevector
+
+
+class Job:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+CLIFFORD_GATES = {'h', 's', 'sdg', 'x', 'y', 'z', 'cx', 'cz', 'swap'}
+
+
+class StabilizerTableau:
+    """ Aaronson-Gottesman tableau of the n stabilizer generators; each gate costs O(n) instead of O(2^n) """
+
+    def __init__(self, num_qubits):
+        self.num_qubits = num_qubits
+        self.x = np.zeros((num_qubits, num_qubits), dtype=np.uint8)
+        self.z = np.eye(num_qubits, dtype=np.uint8)
+        self.r = np.zeros(num_qubits, dtype=np.uint8)
+
+    def apply(self, name, qubits):
+        x, z, r = self.x, self.z, self.r
+        a = qubits[0]
+        if name == 'h':
+            r ^= x[:, a] & z[:, a]
+            x[:, a], z[:, a] = z[:, a].copy(), x[:, a].copy()
+        elif name == 's':
+            r ^= x[:, a] & z[:, a]
+            z[:, a] ^= x[:, a]
+        elif name == 'sdg':
+            r ^= x[:, a] & (z[:, a] ^ 1)
+            z[:, a] ^= x[:, a]
+        elif name == 'x':
+            r ^= z[:, a]
+        elif name == 'z':
+            r ^= x[:, a]
+        elif name == 'y':
+            r ^= x[:, a] ^ z[:, a]
+        elif name == 'cx':
+            b = qubits[1]
+            r ^= x[:, a] & z[:, b] & (x[:, b] ^ z[:, a] ^ 1)
+            x[:, b] ^= x[:, a]
+            z[:, a] ^= z[:, b]
+        elif name == 'cz':
+            for gate, targets in (('h', (qubits[1],)), ('cx', qubits), ('h', (qubits[1],))):
+                self.apply(gate, targets)
+        elif name == 'swap':
+            b = qubits[1]
+            x[:, [a, b]] = x[:, [b, a]]
+            z[:, [a, b]] = z[:, [b, a]]
+
+    def rowsum(self, target, source):
+        """ Replace generator `target` by the product of `target` and `source`, tracking the sign """
+        x1, z1 = self.x[source].astype(np.int8), self.z[source].astype(np.int8)
+        x2, z2 = self.x[target].astype(np.int8), self.z[target].astype(np.int8)
+        # Power of i picked up on every qubit when multiplying the two Pauli operators
+        g = x1 * z1 * (z2 - x2) + x1 * (1 - z1) * z2 * (2 * x2 - 1) + (1 - x1) * z1 * x2 * (1 - 2 * z2)
+        phase = (2 * int(self.r[target]) + 2 * int(self.r[source]) + int(g.sum())) % 4
+        self.r[target] = phase // 2
+        self.x[target] ^= self.x[source]
+        self.z[target] ^= self.z[source]
+
+    def sample(self, shots, rng):
+        """ Z-basis outcomes of every qubit: uniform over the bitstrings allowed by the Z-type stabilizers """
+        n = self.num_qubits
+        # Row-reduce the X block; the generators left without X part are products of Z with a fixed sign
+        row = 0
+        for column in range(n):
+            pivots = [candidate for candidate in range(row, n) if self.x[candidate, column]]
+            if not pivots:
+                continue
+            self._swap_rows(row, pivots[0])
+            for other in range(n):
+                if other != row and self.x[other, column]:
+                    self.rowsum(other, row)
+            row += 1
+        constraints = np.concatenate([self.z[row:], self.r[row:, None]], axis=1)
+
+        # Solve Z b = r over GF(2) for one particular outcome plus a basis of the free directions
+        pivot_columns = []
+        rank = 0
+        for column in range(n):
+            pivots = [candidate for candidate in range(rank, len(constraints)) if constraints[candidate, column]]
+            if not pivots:
+                continue
+            constraints[[rank, pivots[0]]] = constraints[[pivots[0], rank]]
+            for other in range(len(constraints)):
+                if other != rank and constraints[other, column]:
+                    constraints[other] ^= constraints[rank]
+            pivot_columns.append(column)
+            rank += 1
+        particular = np.zeros(n, dtype=np.uint8)
+        for index, column in enumerate(pivot_columns):
+            particular[column] = constraints[index, n]
+        free_columns = [column for column in range(n) if column not in pivot_columns]
+        basis = np.zeros((len(free_columns), n), dtype=np.uint8)
+        for index, free in enumerate(free_columns):
+            basis[index, free] = 1
+            for pivot_index, column in enumerate(pivot_columns):
+                basis[index, column] = constraints[pivot_index, free]
+
+        coefficients = rng.integers(0, 2, size=(shots, len(free_columns)), dtype=np.uint8)
+        return (particular + coefficients.astype(np.int64) @ basis) % 2
+
+    def _swap_rows(self, first, second):
+        for table in (self.x, self.z, self.r):
+            table[[first, second]] = table[[second, first]]
+
+
+class AerSimulator:
+    def __init__(self, method='automatic', seed_simulator=None, **options):
+        self.method = method
+        self.rng = np.random.default_rng(seed_simulator)
+
+    def select_method(self, circuit):
+        # Like Aer, use the tableau whenever the circuit is Clifford and no amplitudes are requested
+        if self.method != 'automatic':
+            return self.method
+        names = {instruction[0] for instruction in circuit.data} - {'measure'}
+        return 'stabilizer' if names <= CLIFFORD_GATES else 'statevector'
+
+    def run(self, circuit, shots=1024, **options):
+        method = self.select_method(circuit)
+        if method == 'stabilizer':
+            state = StabilizerTableau(circuit.num_qubits)
+        else:
+            state = np.zeros((2,) * circuit.num_qubits, dtype=complex)
+            state[(0,) * circuit.num_qubits] = 1
+        measured = {}
+        saved = None
+        for instruction in circuit.data:
+            name, qubits = instruction[0], instruction[1]
+            if name == 'measure':
+                measured[instruction[2]] = qubits[0]
+            elif name == 'save_statevector':
+                if method == 'stabilizer':
+                    raise ValueError("save_statevector needs the statevector method")
+                saved = state.reshape(-1).copy()
+            elif any(qubit in measured.values() for qubit in qubits):
+                # Predicates only measure at the end; collapsing mid-circuit is not needed
+                raise NotImplementedError("Gates after a measurement are not supported")
+            elif method == 'stabilizer':
+                if name not in CLIFFORD_GATES:
+                    raise ValueError(f"'{name}' is not a Clifford gate")
+                state.apply(name, qubits)
+            else:
+                state = apply_gate(state, name, qubits)
+        counts = None
+        if measured:
+            if method == 'stabilizer':
+                outcomes = state.sample(shots, self.rng)
+            else:
+                outcomes = self.sample_statevector(state.reshape(-1), shots)
+            counts = self.count(circuit, outcomes, measured)
+        return Job(Result(circuit, counts, saved))
+
+    def sample_statevector(self, statevector, shots):
+        probabilities = np.abs(statevector) ** 2
+        indices = self.rng.choice(len(probabilities), size=shots, p=probabilities / probabilities.sum())
+        num_qubits = len(statevector).bit_length() - 1
+        return (indices[:, None] >> np.arange(num_qubits)) & 1
+
+    def count(self, circuit, outcomes, measured):
+        """ Counts dictionary from a (shots, num_qubits) array of outcomes, keyed in order of first occurrence """
+        clbits = np.zeros((len(outcomes), circuit.num_clbits), dtype=np.uint8)
+        for clbit, qubit in measured.items():
+            clbits[:, clbit] = outcomes[:, qubit]
+        values, first_seen, frequencies = np.unique(clbits, axis=0, return_index=True, return_counts=True)
+        return {self.format_key(circuit, values[position]): int(frequencies[position]) for position in np.argsort(first_seen)}
+
+    @staticmethod
+    def format_key(circuit, clbits):
+        # Highest classical bit first, registers separated by spaces with the last register leftmost
+        words, offset = [], 0
+        for register in circuit.cregs:
+            words.append(''.join(str(bit) for bit in reversed(clbits[offset:offset + register.size])))
+            offset += register.size
+        return ' '.join(reversed(words))
+
+
+def transpile(circuit, backend=None, **options):
+    # Every gate is already native to the simulator
+    return circuit
+
+
+def circuit_drawer(circuit, output='text', **kwargs):
+    return circuit.draw(output='text')
@@ -0,0 +1,152 @@
+import hashlib
+import threading
+from qiskit import QuantumCircuit, ClassicalRegister, QuantumRegister, transpile
+from qiskit_aer import AerSimulator
+
+# Helpers shared by every obfuscated module. Generated code imports them from here instead of carrying its own
+# copies, and every module of a process shares one simulator per method and one result per distinct predicate.
+# When the NumPy runtime is selected, the imports above are pointed at microsim.py as this file is shipped.
+
+_backends = {}
+_results = {}
+# Threads asking for the same predicate at once wait for one simulation instead of each running their own
+_lock = threading.RLock()
+
+
+def backend(method='automatic'):
+    with _lock:
+        if method not in _backends:
+            _backends[method] = AerSimulator(method=method)
+        return _backends[method]
+
+
+def circuit_key(qc):
+    """ Hashable description of a circuit's gates, so identical predicates built by different modules share a result """
+    if hasattr(qc, 'find_bit'):
+        return qc.num_qubits, qc.num_clbits, tuple(
+            (instruction.operation.name,
+             tuple(qc.find_bit(qubit).index for qubit in instruction.qubits),
+             tuple(qc.find_bit(clbit).index for clbit in instruction.clbits))
+            for instruction in qc.data)
+    return qc.num_qubits, qc.num_clbits, tuple(qc.data)
+
+
+def execute_circuit(qc, shots=1024, method='automatic'):
+    key = (circuit_key(qc), shots, method)
+    with _lock:
+        if key not in _results:
+            simulator = backend(method)
+            _results[key] = simulator.run(transpile(qc, simulator), shots=shots).result().get_counts()
+        return _results[key]
+
+
+def run_statevector(qc):
+    key = (circuit_key(qc), 'statevector')
+    with _lock:
+        if key not in _results:
+            simulator = backend('statevector')
+            _results[key] = simulator.run(transpile(qc, simulator)).result().get_statevector()
+        return _results[key]
+
+
+def measure_all(qc, qr, cr):
+    qc.measure(qr, cr)
+
+
+def create_entangled_pair(qc, qr):
+    qc.h(qr[0])
+    qc.cx(qr[0], qr[1])
+
+
+def create_entangled_pairs(qc, qr):
+    for i in range(0, qr.size, 2):
+        qc.h(qr[i])
+        qc.cx(qr[i], qr[i + 1])
+
+
+def first_outcome(counts):
+    return [int(bit) for bit in next(iter(counts))]
+
+
+def most_frequent(counts):
+    return max(counts.items(), key=lambda item: item[1])[0]
+
+
+def circuit_gates(qc):
+    """ The gates of a qiskit or microsim circuit and its measurements as {clbit: qubit} """
+    gates = []
+    measured = {}
+    if hasattr(qc, 'find_bit'):
+        for instruction in qc.data:
+            qubits = tuple(qc.find_bit(qubit).index for qubit in instruction.qubits)
+            if instruction.operation.name == 'measure':
+                measured[qc.find_bit(instruction.clbits[0]).index] = qubits[0]
+            elif instruction.operation.name not in ('barrier', 'save_statevector'):
+                gates.append((instruction.operation.name, qubits))
+    else:
+        for instruction in qc.data:
+            if instruction[0] == 'measure':
+                measured[instruction[2]] = instruction[1][0]
+            elif instruction[0] != 'save_statevector':
+                gates.append(instruction[:2])
+    return gates, measured
+
+
+def outcome_probabilities(qc):
+    """ Exact probability of every measurement outcome of a predicate, keyed like get_counts """
+    gates, measured = circuit_gates(qc)
+    circuit = QuantumCircuit(qc.num_qubits)
+    for name, qubits in gates:
+        getattr(circuit, name)(*qubits)
+    circuit.save_statevector()
+    statevector = run_statevector(circuit)
+    sizes = [len(register) for register in qc.cregs]
+    probabilities = {}
+    for index in range(2 ** qc.num_qubits):
+        probability = abs(statevector[index]) ** 2
+        if probability < 1e-12:
+            continue
+        bits = [0] * qc.num_clbits
+        for clbit, qubit in measured.items():
+            bits[clbit] = (index >> qubit) & 1
+        # Highest classical bit first, registers separated by spaces with the last register leftmost
+        words, offset = [], 0
+        for size in sizes:
+            words.append(''.join(str(bit) for bit in reversed(bits[offset:offset + size])))
+            offset += size
+        key = ' '.join(reversed(words))
+        probabilities[key] = probabilities.get(key, 0.0) + probability
+    return probabilities
+
+
+def resolve_outcome(qc):
+    # The most likely outcome, with ties going to the smallest key so every build resolves the same way
+    probabilities = outcome_probabilities(qc)
+    best = max(probabilities.values())
+    return min(key for key, probability in probabilities.items() if probability >= best - 1e-9)
+
+
+def _keystream(salt, length):
+    return hashlib.shake_256(salt).digest(length)
+
+
+def seal_outcome(outcome, salt):
+    """ Build-time half of committed_outcome: the outcome encrypted under the salt, and a hash commitment to it """
+    data = outcome.encode()
+    sealed = salt + bytes(a ^ b for a, b in zip(data, _keystream(salt, len(data))))
+    return sealed.hex(), hashlib.sha256(salt + data).hexdigest()
+
+
+def committed_outcome(qc, sealed, commitment):
+    """ The outcome a predicate was resolved to at build time, checked against the commitment and against
+    one exact evaluation of the circuit instead of a full shot histogram """
+    sealed = bytes.fromhex(sealed)
+    salt, encrypted = sealed[:16], sealed[16:]
+    data = bytes(a ^ b for a, b in zip(encrypted, _keystream(salt, len(encrypted))))
+    if hashlib.sha256(salt + data).hexdigest() != commitment:
+        raise RuntimeError("Predicate integrity check failed")
+    outcome = data.decode()
+    probabilities = outcome_probabilities(qc)
+    if probabilities.get(outcome, 0.0) < max(probabilities.values()) - 1e-9:
+        raise RuntimeError("Predicate integrity check failed")
+    return outcome
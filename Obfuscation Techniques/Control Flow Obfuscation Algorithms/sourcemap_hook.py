@@ -0,0 +1,148 @@
+import os
+import re
+import sys
+import json
+import runpy
+import pstats
+import argparse
+import traceback
+
+# Rewrites locations in obfuscated code back to the original sources, using the .map.json files the generators
+# write next to their outputs (or ProjectObf writes to --source-maps). Keep the maps out of shipped builds.
+
+_maps = {}
+_adjacent = {}
+
+# file.py:123 as printed by py-spy and most profilers, and the frames of tracebacks copied from logs
+LOCATION = re.compile(r'([^\s()"\']+\.py):(\d+)')
+TRACEBACK_LOCATION = re.compile(r'File "([^"]+)", line (\d+)')
+
+
+def load_maps(*paths):
+    """ Register source maps from .map.json files or directories searched recursively """
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in os.walk(path):
+                load_maps(*(os.path.join(directory, name) for name in files if name.endswith('.map.json')))
+        elif os.path.isfile(path):
+            with open(path, 'r') as file:
+                source_map = json.load(file)
+            _maps[source_map['file'].replace('\\', '/')] = source_map
+
+
+def find_map(filename):
+    # A map sitting next to the module wins; otherwise match the name the code was compiled under
+    if filename not in _adjacent:
+        map_file = os.path.splitext(filename)[0] + '.map.json'
+        _adjacent[filename] = None
+        if os.path.isfile(map_file):
+            with open(map_file, 'r') as file:
+                _adjacent[filename] = json.load(file)
+    if _adjacent[filename]:
+        return _adjacent[filename]
+    filename = filename.replace('\\', '/')
+    for name, source_map in _maps.items():
+        if filename == name or filename.endswith('/' + name):
+            return source_map
+    return None
+
+
+def map_location(filename, lineno):
+    """ (original file, original line) of a line of obfuscated code, or None for generated lines """
+    source_map = find_map(filename)
+    if source_map is None or str(lineno) not in source_map['lines']:
+        return None
+    return source_map['source'], source_map['lines'][str(lineno)]
+
+
+def map_stack(stack):
+    for frame in stack:
+        location = map_location(frame.filename, frame.lineno)
+        if location:
+            # Setting the line to None makes the traceback read it from the original file
+            frame.filename, frame.lineno = location
+            frame._line = None
+            frame.colno = frame.end_colno = frame.end_lineno = None
+
+
+def map_exception(exception, seen=None):
+    """ Rewrite a TracebackException, including chained and grouped exceptions, in place """
+    seen = set() if seen is None else seen
+    if exception is None or id(exception) in seen:
+        return
+    seen.add(id(exception))
+    map_stack(exception.stack)
+    for chained in (exception.__cause__, exception.__context__, *(getattr(exception, 'exceptions', None) or ())):
+        map_exception(chained, seen)
+
+
+def format_exception(exc_type, value, tb):
+    exception = traceback.TracebackException(exc_type, value, tb)
+    map_exception(exception)
+    return ''.join(exception.format())
+
+
+def excepthook(exc_type, value, tb):
+    sys.stderr.write(format_exception(exc_type, value, tb))
+
+
+def install(*paths):
+    """ Print uncaught exceptions with original locations from now on """
+    load_maps(*paths)
+    sys.excepthook = excepthook
+
+
+def map_stats(stats):
+    """ Point a pstats.Stats object's function entries at the original files and lines """
+    def remap(key):
+        filename, lineno, name = key
+        location = map_location(filename, lineno)
+        return (location[0], location[1], name) if location else key
+
+    mapped = {}
+    for key, (calls, primitive, total, cumulative, callers) in stats.stats.items():
+        entry = (calls, primitive, total, cumulative, {remap(caller): value for caller, value in callers.items()})
+        key = remap(key)
+        # Several generated functions can come from one original (decoys, duplicated branches)
+        mapped[key] = pstats.add_func_stats(mapped[key], entry) if key in mapped else entry
+    stats.stats = mapped
+    return stats
+
+
+def map_text(text):
+    """ Rewrite the file.py:line locations of profiler output such as py-spy's, and the frames of tracebacks """
+    def replace(match, template):
+        location = map_location(match.group(1), int(match.group(2)))
+        return template.format(*location) if location else match.group(0)
+    text = TRACEBACK_LOCATION.sub(lambda match: replace(match, 'File "{}", line {}'), text)
+    return LOCATION.sub(lambda match: replace(match, '{}:{}'), text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Map tracebacks and profiles of obfuscated code back to the original sources")
+    parser.add_argument("--maps", action="append", default=[], help="Source map file or directory (repeatable)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run an obfuscated program with tracebacks mapped to the original")
+    run_parser.add_argument("program")
+    run_parser.add_argument("arguments", nargs=argparse.REMAINDER)
+    profile_parser = subparsers.add_parser("profile", help="Print a cProfile dump with original locations")
+    profile_parser.add_argument("profile")
+    profile_parser.add_argument("--sort", default="cumulative")
+    profile_parser.add_argument("--limit", type=int, default=30)
+    subparsers.add_parser("text", help="Rewrite file.py:line locations of text on stdin (e.g. py-spy dump output)")
+    args = parser.parse_args()
+
+    load_maps(*args.maps)
+    if args.command == "run":
+        install(os.path.dirname(os.path.abspath(args.program)))
+        sys.argv = [args.program] + args.arguments
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.program)))
+        runpy.run_path(args.program, run_name="__main__")
+    elif args.command == "profile":
+        map_stats(pstats.Stats(args.profile)).sort_stats(args.sort).print_stats(args.limit)
+    else:
+        sys.stdout.write(map_text(sys.stdin.read()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import SuperPosShroud
+import SupObf
+import SimpleEntanglement
+import EntangleObf
+import ModuleShroud
+import FlattenObf
+from functions import make_lazy
+
+# Every control flow obfuscation technique behind one calling convention:
+# TECHNIQUES[name](tree, lazy) returns the obfuscated AST of a parsed module. The module only imports
+# predicate_runtime; which simulator that uses is decided when the runtime is shipped (see functions.ship_runtime).
+TECHNIQUES = {
+    'SuperPosShroud': lambda tree, lazy: SuperPosShroud.obfuscate_tree(tree, lazy),
+    'SupObf': lambda tree, lazy: _lazy(SupObf.modularize_opaque_pred(None, SupObf.OPAQUE_PRED_CODE, tree=tree), lazy),
+    'SimpleEntanglement': lambda tree, lazy: _lazy(SimpleEntanglement.modularize_simple_entanglement(
+        None, SimpleEntanglement.SIMPLE_ENTANGLEMENT_CODE, tree=tree), lazy),
+    'EntangleObf': lambda tree, lazy: _lazy(EntangleObf.modularize_opaque_pred(None, EntangleObf.OPAQUE_PRED_CODE, tree=tree), lazy),
+    # ModuleShroud already shares one predicate per module and has no lazy mode
+    'ModuleShroud': lambda tree, lazy: ModuleShroud.shroud_tree(tree)[0],
+    # FlattenObf seeds its state encoding once per process and has no lazy mode either
+    'FlattenObf': lambda tree, lazy: FlattenObf.flatten_tree(tree)[0],
+}
+
+
+def _lazy(tree, lazy):
+    return make_lazy(tree) if lazy else tree
+
+
+def obfuscate(name, tree, lazy=False):
+    if name not in TECHNIQUES:
+        raise ValueError(f"Unknown technique '{name}'. Choose from: {', '.join(TECHNIQUES)}")
+    return TECHNIQUES[name](tree, lazy)
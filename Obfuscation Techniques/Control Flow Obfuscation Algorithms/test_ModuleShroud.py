@@ -0,0 +1,39 @@
+import ast
+import json
+import random
+from ModuleShroud import shroud_module
+
+SAMPLE = """
+counter = 0
+
+
+def bump(n):
+    global counter
+    counter += n
+    return counter
+
+
+def make_total():
+    total = 0
+
+    def add(n):
+        nonlocal total
+        total += n
+        return total
+    return add
+
+
+def scale(value, factor):
+    result = value * factor
+    return result
+"""
+
+
+def test_body_checks_compile_with_global_and_nonlocal(tmp_path):
+    # Every function is cold, so each one gets a per-call check with an in-body decoy ahead of its body
+    call_counts = tmp_path / 'calls.json'
+    call_counts.write_text(json.dumps({'bump': 1, 'make_total': 1, 'scale': 1}))
+    for seed in range(10):
+        random.seed(seed)
+        tree, _, _ = shroud_module(SAMPLE, 'numpy', call_counts_path=str(call_counts))
+        compile(ast.unparse(tree), '<ModuleShroud>', 'exec')
@@ -1,13 +1,17 @@
 import argparse
 import logging
 import os
+import mmap
 import hashlib
 import base64
-from typing import Tuple
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple
 from Crypto.Cipher import AES
 from Crypto.Protocol.KDF import HKDF
 from Crypto.Hash import SHA256
-from pqcrypto.kem.kyber512 import generate_keypair, encrypt, decrypt
+from pqcrypto.kem.kyber512 import generate_keypair, encrypt, decrypt, CIPHERTEXT_SIZE
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -15,9 +19,30 @@ logger = logging.getLogger(__name__)
 # ====================
 # Constants
 # ====================
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
 AES_KEY_SIZE = 32  # 256 bits
 NONCE_SIZE = 12  # 96 bits for GCM
+TAG_SIZE = 16  # 128-bit GCM authentication tag
+SALT_SIZE = 16  # HKDF salt
+
+# Streaming format: a header, then length-prefixed AES-GCM frames. Frame 0 holds the original filename,
+# the following frames hold up to chunk_size bytes of the file each, and the last frame is flagged final.
+# Version 2 containers carry the Kyber ciphertext in the header; version 1 streams kept it in a separate .enc.key file.
+STREAM_MAGIC = b'KYBS'
+STREAM_VERSION = 2
+SPLIT_KEY_VERSION = 1
+CHUNK_SIZE = 1024 * 1024  # 1 MB of plaintext per frame
+NONCE_PREFIX_SIZE = 7  # Random part of every frame nonce; a 4-byte counter and a 1-byte final flag follow
+STREAM_HEADER_SIZE = len(STREAM_MAGIC) + 1 + 4 + SALT_SIZE + NONCE_PREFIX_SIZE
+KEM_LENGTH_SIZE = 2
+CONTAINER_HEADER_SIZE = STREAM_HEADER_SIZE + KEM_LENGTH_SIZE + CIPHERTEXT_SIZE
+FRAME_LENGTH_SIZE = 4
+FINAL_FRAME = 0x80000000  # Top bit of a frame's length field
+MAX_FILENAME_SIZE = 0xFFFF
+
+# Frames are encrypted and verified on a thread pool (AES-GCM releases the GIL). At most IN_FLIGHT frames per worker
+# are pending at a time, which bounds memory to roughly workers * IN_FLIGHT * chunk size.
+DEFAULT_WORKERS = os.cpu_count() or 1
+IN_FLIGHT = 2
 
 # ====================
 # Kyber KEM Functions
@@ -139,6 +164,566 @@ def decrypt_data(encrypted_data: bytes, key: bytes) -> Tuple[bytes, str]:
     logger.debug(f"Original filename extracted: {original_filename}")
     return file_data, original_filename
 
+# ====================
+# Streaming Encryption Functions
+# ====================
+
+def stream_nonce(nonce_prefix: bytes, counter: int, final: bool) -> bytes:
+    """
+    Derives the nonce of one frame from the stream's random prefix, the frame counter and the final flag.
+
+    Args:
+        nonce_prefix (bytes): The random nonce prefix stored in the stream header.
+        counter (int): The index of the frame in the stream.
+        final (bool): Whether the frame is the last one of the stream.
+
+    Returns:
+        bytes: The 12-byte GCM nonce.
+    """
+    if counter >= 2 ** 32:
+        raise ValueError("Too many frames for one stream.")
+    return nonce_prefix + counter.to_bytes(4, 'big') + (b'\x01' if final else b'\x00')
+
+def build_stream_header(chunk_size: int, salt: bytes, nonce_prefix: bytes, kem_ciphertext: bytes) -> bytes:
+    """
+    Builds the header of a container: the stream parameters followed by the Kyber ciphertext. It is authenticated
+    as part of every frame.
+
+    Args:
+        chunk_size (int): The plaintext size of every frame except the last.
+        salt (bytes): The salt used in HKDF.
+        nonce_prefix (bytes): The random nonce prefix of the stream.
+        kem_ciphertext (bytes): The Kyber ciphertext encapsulating the shared secret.
+
+    Returns:
+        bytes: The stream header.
+    """
+    if not 0 < chunk_size < FINAL_FRAME:
+        raise ValueError(f"Chunk size must be between 1 and {FINAL_FRAME - 1} bytes.")
+    if len(kem_ciphertext) != CIPHERTEXT_SIZE:
+        raise ValueError(f"Kyber ciphertext must be {CIPHERTEXT_SIZE} bytes.")
+    return (STREAM_MAGIC + bytes([STREAM_VERSION]) + chunk_size.to_bytes(4, 'big') + salt + nonce_prefix +
+            len(kem_ciphertext).to_bytes(KEM_LENGTH_SIZE, 'big') + kem_ciphertext)
+
+def read_stream_header(file: BinaryIO) -> Optional[Tuple[bytes, int, bytes, bytes, Optional[bytes]]]:
+    """
+    Reads the header of a streaming encrypted file with a single read, leaving the file positioned after it.
+
+    Args:
+        file (BinaryIO): The encrypted file, positioned at its start.
+
+    Returns:
+        Optional[Tuple[bytes, int, bytes, bytes, Optional[bytes]]]: The raw header, chunk size, salt, nonce prefix
+        and Kyber ciphertext (None for version 1 streams, whose ciphertext is in a separate file), or None if the
+        file does not start with a stream header (a file written by an older version of this tool).
+    """
+    data = file.read(CONTAINER_HEADER_SIZE)
+    if len(data) < STREAM_HEADER_SIZE or not data.startswith(STREAM_MAGIC):
+        return None
+    offset = len(STREAM_MAGIC)
+    version = data[offset]
+    chunk_size = int.from_bytes(data[offset + 1:offset + 5], 'big')
+    salt = data[offset + 5:offset + 5 + SALT_SIZE]
+    nonce_prefix = data[offset + 5 + SALT_SIZE:STREAM_HEADER_SIZE]
+    if version == SPLIT_KEY_VERSION:
+        # The header read overshot into the first frame
+        file.seek(STREAM_HEADER_SIZE - len(data), os.SEEK_CUR)
+        return data[:STREAM_HEADER_SIZE], chunk_size, salt, nonce_prefix, None
+    if version != STREAM_VERSION:
+        raise ValueError(f"Unsupported stream version {version}.")
+    if len(data) < CONTAINER_HEADER_SIZE:
+        raise ValueError("Encrypted file is truncated.")
+    kem_length = int.from_bytes(data[STREAM_HEADER_SIZE:STREAM_HEADER_SIZE + KEM_LENGTH_SIZE], 'big')
+    if kem_length != CIPHERTEXT_SIZE:
+        raise ValueError(f"Kyber ciphertext is {kem_length} bytes, expected {CIPHERTEXT_SIZE}.")
+    return data, chunk_size, salt, nonce_prefix, data[STREAM_HEADER_SIZE + KEM_LENGTH_SIZE:]
+
+def describe_encrypted_file(filename: str) -> str:
+    """
+    Describes an encrypted file from its header alone, without any key.
+
+    Args:
+        filename (str): The path of the file.
+
+    Returns:
+        str: The format and parameters of the file.
+    """
+    with open(filename, 'rb') as file:
+        try:
+            stream = read_stream_header(file)
+        except ValueError as e:
+            return f"invalid stream header ({e})"
+    size = os.path.getsize(filename)
+    if stream is None:
+        return f"no stream header (legacy single-message file, or not encrypted), {size} bytes"
+    header, chunk_size, _, _, kem_ciphertext = stream
+    if kem_ciphertext is None:
+        return f"stream version {SPLIT_KEY_VERSION} (key in a separate .enc.key file), chunk size {chunk_size}, {size} bytes"
+    return (f"container version {STREAM_VERSION}, Kyber ciphertext {len(kem_ciphertext)} bytes, chunk size {chunk_size}, "
+            f"{size} bytes")
+
+def encrypt_frame(key: bytes, header: bytes, nonce_prefix: bytes, counter: int, data: bytes, final: bool) -> bytes:
+    """
+    Encrypts one frame of a stream. The stream header and the frame's length field are authenticated with it.
+
+    Args:
+        key (bytes): The AES-256 key (32 bytes).
+        header (bytes): The stream header.
+        nonce_prefix (bytes): The random nonce prefix of the stream.
+        counter (int): The index of the frame in the stream.
+        data (bytes): The plaintext of the frame.
+        final (bool): Whether the frame is the last one of the stream.
+
+    Returns:
+        bytes: The length field, ciphertext and tag of the frame.
+    """
+    length_bytes = (len(data) | (FINAL_FRAME if final else 0)).to_bytes(FRAME_LENGTH_SIZE, 'big')
+    cipher = AES.new(key, AES.MODE_GCM, nonce=stream_nonce(nonce_prefix, counter, final))
+    cipher.update(header + length_bytes)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    return length_bytes + ciphertext + tag
+
+def read_frame(file: BinaryIO, max_size: int) -> Tuple[bytes, bytes, bool]:
+    """
+    Reads the next frame of a stream without decrypting it.
+
+    Args:
+        file (BinaryIO): The encrypted file, positioned at the frame.
+        max_size (int): The largest plaintext size the frame may have.
+
+    Returns:
+        Tuple[bytes, bytes, bool]: The length field, the ciphertext and tag, and whether the frame claims to be the
+        last one of the stream (the claim is verified when the frame is decrypted).
+    """
+    length_bytes = file.read(FRAME_LENGTH_SIZE)
+    if len(length_bytes) < FRAME_LENGTH_SIZE:
+        raise ValueError("Encrypted file is truncated.")
+    length = int.from_bytes(length_bytes, 'big')
+    final = bool(length & FINAL_FRAME)
+    length &= ~FINAL_FRAME
+    if length > max_size:
+        raise ValueError("Frame is larger than the stream's chunk size.")
+    body = file.read(length + TAG_SIZE)
+    if len(body) < length + TAG_SIZE:
+        raise ValueError("Encrypted file is truncated.")
+    return length_bytes, body, final
+
+def open_frame(key: bytes, header: bytes, nonce_prefix: bytes, counter: int, length_bytes: bytes, body: bytes,
+               final: bool) -> bytes:
+    """
+    Verifies and decrypts one frame read by read_frame. Frames do not depend on each other, so they can be
+    opened in any order or in parallel.
+
+    Args:
+        key (bytes): The AES-256 key (32 bytes).
+        header (bytes): The stream header.
+        nonce_prefix (bytes): The random nonce prefix of the stream.
+        counter (int): The index of the frame in the stream.
+        length_bytes (bytes): The length field of the frame.
+        body (bytes): The ciphertext and tag of the frame.
+        final (bool): Whether the frame is flagged as the last one of the stream.
+
+    Returns:
+        bytes: The plaintext of the frame.
+    """
+    cipher = AES.new(key, AES.MODE_GCM, nonce=stream_nonce(nonce_prefix, counter, final))
+    cipher.update(header + length_bytes)
+    return cipher.decrypt_and_verify(body[:-TAG_SIZE], body[-TAG_SIZE:])
+
+def decrypt_frame(file: BinaryIO, key: bytes, header: bytes, nonce_prefix: bytes, counter: int,
+                  max_size: int) -> Tuple[bytes, bool]:
+    """
+    Reads, verifies and decrypts the next frame of a stream.
+
+    Args:
+        file (BinaryIO): The encrypted file, positioned at the frame.
+        key (bytes): The AES-256 key (32 bytes).
+        header (bytes): The stream header.
+        nonce_prefix (bytes): The random nonce prefix of the stream.
+        counter (int): The index of the frame in the stream.
+        max_size (int): The largest plaintext size the frame may have.
+
+    Returns:
+        Tuple[bytes, bool]: The plaintext of the frame and whether it is the last one of the stream.
+    """
+    length_bytes, body, final = read_frame(file, max_size)
+    return open_frame(key, header, nonce_prefix, counter, length_bytes, body, final), final
+
+def write_ordered(jobs: Iterable[Tuple[Callable[..., bytes], tuple]], destination: BinaryIO, workers: int,
+                  in_flight: int) -> None:
+    """
+    Runs frame jobs on a thread pool and writes their results in stream order. Reading stops while in_flight jobs
+    are pending, so memory stays bounded however large the file is.
+
+    Args:
+        jobs (Iterable[Tuple[Callable[..., bytes], tuple]]): A function and its arguments per frame, in stream order.
+        destination (BinaryIO): The file the results are written to.
+        workers (int): The number of threads; 1 runs every job in the calling thread.
+        in_flight (int): The largest number of frames pending at a time.
+    """
+    if workers <= 1:
+        for function, args in jobs:
+            destination.write(function(*args))
+        return
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for function, args in jobs:
+            if len(pending) >= in_flight:
+                destination.write(pending.popleft().result())
+            pending.append(executor.submit(function, *args))
+        while pending:
+            destination.write(pending.popleft().result())
+
+def read_chunks(source: BinaryIO, chunk_size: int) -> Iterator[Tuple[int, bytes, bool]]:
+    """
+    Splits a file into numbered chunks, starting at frame 1, and flags the last one.
+
+    Args:
+        source (BinaryIO): The plaintext file.
+        chunk_size (int): The size of every chunk except the last.
+
+    Returns:
+        Iterator[Tuple[int, bytes, bool]]: The frame counter, data and final flag of each chunk.
+    """
+    # One chunk of lookahead tells whether the current chunk is the last, so the final flag needs no seeking
+    counter = 1
+    chunk = source.read(chunk_size)
+    while True:
+        next_chunk = source.read(chunk_size) if len(chunk) == chunk_size else b''
+        yield counter, chunk, not next_chunk
+        if not next_chunk:
+            return
+        chunk = next_chunk
+        counter += 1
+
+def encrypt_stream(source: BinaryIO, destination: BinaryIO, key: bytes, salt: bytes, kem_ciphertext: bytes,
+                   original_filename: str,
+                   chunk_size: int = CHUNK_SIZE, workers: int = DEFAULT_WORKERS, in_flight: Optional[int] = None) -> int:
+    """
+    Encrypts a file chunk by chunk into the streaming format, with frames encrypted in parallel.
+
+    Args:
+        source (BinaryIO): The plaintext file.
+        destination (BinaryIO): The file the encrypted stream is written to.
+        key (bytes): The AES-256 key (32 bytes).
+        salt (bytes): The salt used in HKDF.
+        kem_ciphertext (bytes): The Kyber ciphertext, stored in the header.
+        original_filename (str): The original filename to include in the encrypted stream.
+        chunk_size (int): The plaintext size of every frame except the last.
+        workers (int): The number of encryption threads.
+        in_flight (Optional[int]): The largest number of frames held in memory; IN_FLIGHT per worker by default.
+
+    Returns:
+        int: The number of plaintext bytes encrypted.
+    """
+    filename_bytes = original_filename.encode('utf-8')
+    if len(filename_bytes) > MAX_FILENAME_SIZE:
+        raise ValueError("Original filename is too long.")
+    nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+    header = build_stream_header(chunk_size, salt, nonce_prefix, kem_ciphertext)
+    destination.write(header)
+    destination.write(encrypt_frame(key, header, nonce_prefix, 0, filename_bytes, False))
+
+    total = 0
+    frames = 0
+
+    def jobs():
+        nonlocal total, frames
+        for counter, chunk, final in read_chunks(source, chunk_size):
+            total += len(chunk)
+            frames = counter
+            yield encrypt_frame, (key, header, nonce_prefix, counter, chunk, final)
+
+    write_ordered(jobs(), destination, workers, in_flight or IN_FLIGHT * workers)
+    logger.debug(f"Encrypted {total} bytes in {frames} frames of up to {chunk_size} bytes with {workers} workers.")
+    return total
+
+def read_stream_filename(file: BinaryIO, key: bytes, header: bytes, nonce_prefix: bytes) -> str:
+    """
+    Decrypts the original filename stored in the first frame of a stream.
+
+    Args:
+        file (BinaryIO): The encrypted file, positioned right after the header.
+        key (bytes): The AES-256 key (32 bytes).
+        header (bytes): The stream header.
+        nonce_prefix (bytes): The random nonce prefix of the stream.
+
+    Returns:
+        str: The original filename.
+    """
+    filename_bytes, final = decrypt_frame(file, key, header, nonce_prefix, 0, MAX_FILENAME_SIZE)
+    if final:
+        raise ValueError("Encrypted file is truncated.")
+    return filename_bytes.decode('utf-8')
+
+def decrypt_stream(source: BinaryIO, destination: BinaryIO, key: bytes, header: bytes, nonce_prefix: bytes,
+                   chunk_size: int, workers: int = DEFAULT_WORKERS, in_flight: Optional[int] = None) -> int:
+    """
+    Decrypts the data frames of a stream, verifying frames in parallel. Fails if frames are missing, reordered,
+    modified, or if the stream stops before its final frame.
+
+    Args:
+        source (BinaryIO): The encrypted file, positioned right after the filename frame.
+        destination (BinaryIO): The file the plaintext is written to.
+        key (bytes): The AES-256 key (32 bytes).
+        header (bytes): The stream header.
+        nonce_prefix (bytes): The random nonce prefix of the stream.
+        chunk_size (int): The chunk size from the stream header.
+        workers (int): The number of decryption threads.
+        in_flight (Optional[int]): The largest number of frames held in memory; IN_FLIGHT per worker by default.
+
+    Returns:
+        int: The number of plaintext bytes written.
+    """
+    total = 0
+    frames = 0
+
+    def jobs():
+        nonlocal total, frames
+        counter = 1
+        while True:
+            length_bytes, body, final = read_frame(source, chunk_size)
+            total += len(body) - TAG_SIZE
+            frames = counter
+            yield open_frame, (key, header, nonce_prefix, counter, length_bytes, body, final)
+            if final:
+                return
+            counter += 1
+
+    write_ordered(jobs(), destination, workers, in_flight or IN_FLIGHT * workers)
+    if source.read(1):
+        raise ValueError("Unexpected data after the final frame.")
+    logger.debug(f"Decrypted {total} bytes from {frames} frames with {workers} workers.")
+    return total
+
+# ====================
+# Memory-Mapped Stream Functions
+# ====================
+
+def release_pages(mapping: mmap.mmap, start: int, end: int) -> None:
+    """
+    Drops a processed range of a shared file mapping from the process's resident memory. The data stays in the
+    file and the page cache, so peak RSS does not grow with the file size.
+
+    Args:
+        mapping (mmap.mmap): The file mapping.
+        start (int): The first byte of the range.
+        end (int): The end of the range.
+    """
+    if hasattr(mmap, 'MADV_DONTNEED'):
+        start -= start % mmap.PAGESIZE
+        mapping.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+def seal_frame_into(key: bytes, header: bytes, nonce_prefix: bytes, counter: int, data: memoryview, final: bool,
+                    output: memoryview) -> None:
+    """
+    Encrypts one frame straight into its place in the output, like encrypt_frame but without building the frame
+    as a new bytes object.
+
+    Args:
+        key (bytes): The AES-256 key (32 bytes).
+        header (bytes): The stream header.
+        nonce_prefix (bytes): The random nonce prefix of the stream.
+        counter (int): The index of the frame in the stream.
+        data (memoryview): The plaintext of the frame.
+        final (bool): Whether the frame is the last one of the stream.
+        output (memoryview): The length field, ciphertext and tag of the frame are written here.
+    """
+    length_bytes = (len(data) | (FINAL_FRAME if final else 0)).to_bytes(FRAME_LENGTH_SIZE, 'big')
+    output[:FRAME_LENGTH_SIZE] = length_bytes
+    cipher = AES.new(key, AES.MODE_GCM, nonce=stream_nonce(nonce_prefix, counter, final))
+    cipher.update(header + length_bytes)
+    cipher.encrypt(data, output=output[FRAME_LENGTH_SIZE:FRAME_LENGTH_SIZE + len(data)])
+    output[FRAME_LENGTH_SIZE + len(data):] = cipher.digest()
+
+def open_frame_into(key: bytes, header: bytes, nonce_prefix: bytes, counter: int, frame: memoryview, final: bool,
+                    output: memoryview) -> None:
+    """
+    Verifies and decrypts one frame straight into its place in the output, like open_frame but without copies.
+    The output holds unverified plaintext if verification fails.
+
+    Args:
+        key (bytes): The AES-256 key (32 bytes).
+        header (bytes): The stream header.
+        nonce_prefix (bytes): The random nonce prefix of the stream.
+        counter (int): The index of the frame in the stream.
+        frame (memoryview): The length field, ciphertext and tag of the frame.
+        final (bool): Whether the frame is flagged as the last one of the stream.
+        output (memoryview): The plaintext of the frame is written here.
+    """
+    cipher = AES.new(key, AES.MODE_GCM, nonce=stream_nonce(nonce_prefix, counter, final))
+    cipher.update(header + bytes(frame[:FRAME_LENGTH_SIZE]))
+    cipher.decrypt(frame[FRAME_LENGTH_SIZE:-TAG_SIZE], output=output)
+    cipher.verify(bytes(frame[-TAG_SIZE:]))
+
+def run_frame(function: Callable[..., None], args: tuple) -> None:
+    """
+    Runs one frame job. A failure is raised without its traceback, whose frames would keep memoryview slices of
+    the mappings alive and stop them from being closed.
+
+    Args:
+        function (Callable[..., None]): The frame function.
+        args (tuple): Its arguments.
+    """
+    try:
+        function(*args)
+    except Exception as error:
+        error.__context__ = None
+        raise error.with_traceback(None)
+
+def run_frames(jobs: List[Tuple[Callable[..., None], tuple]], workers: int, in_flight: int) -> None:
+    """
+    Runs frame jobs that write into disjoint parts of a mapping, so they need no ordering.
+
+    Args:
+        jobs (List[Tuple[Callable[..., None], tuple]]): A function and its arguments per frame.
+        workers (int): The number of threads; 1 runs every job in the calling thread.
+        in_flight (int): The largest number of frames submitted and not yet done.
+    """
+    if workers <= 1:
+        for function, args in jobs:
+            run_frame(function, args)
+        return
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for function, args in jobs:
+            if len(pending) >= in_flight:
+                pending.popleft().result()
+            pending.append(executor.submit(run_frame, function, args))
+        while pending:
+            pending.popleft().result()
+
+def encrypt_mapped(source: BinaryIO, destination: BinaryIO, key: bytes, salt: bytes, kem_ciphertext: bytes,
+                   original_filename: str, chunk_size: int = CHUNK_SIZE, workers: int = DEFAULT_WORKERS,
+                   in_flight: Optional[int] = None) -> int:
+    """
+    Encrypts a non-empty file into the streaming format through memory mappings: chunks are memoryview slices of
+    the input, and every frame is encrypted into its place in a preallocated output.
+
+    Args:
+        source (BinaryIO): The plaintext file.
+        destination (BinaryIO): The output file, opened for reading and writing.
+        key (bytes): The AES-256 key (32 bytes).
+        salt (bytes): The salt used in HKDF.
+        kem_ciphertext (bytes): The Kyber ciphertext, stored in the header.
+        original_filename (str): The original filename to include in the encrypted stream.
+        chunk_size (int): The plaintext size of every frame except the last.
+        workers (int): The number of encryption threads.
+        in_flight (Optional[int]): The largest number of frames pending at once; IN_FLIGHT per worker by default.
+
+    Returns:
+        int: The number of plaintext bytes encrypted.
+    """
+    filename_bytes = original_filename.encode('utf-8')
+    if len(filename_bytes) > MAX_FILENAME_SIZE:
+        raise ValueError("Original filename is too long.")
+    size = os.fstat(source.fileno()).st_size
+    nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+    header = build_stream_header(chunk_size, salt, nonce_prefix, kem_ciphertext)
+    frames = -(-size // chunk_size)
+    data_start = len(header) + FRAME_LENGTH_SIZE + len(filename_bytes) + TAG_SIZE
+    destination.truncate(data_start + frames * (FRAME_LENGTH_SIZE + TAG_SIZE) + size)
+
+    with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as input_map, \
+            mmap.mmap(destination.fileno(), 0) as output_map:
+        input_view = memoryview(input_map)
+        output_view = memoryview(output_map)
+        output_view[:len(header)] = header
+        output_view[len(header):data_start] = encrypt_frame(key, header, nonce_prefix, 0, filename_bytes, False)
+
+        def seal(counter, start, end, offset):
+            output_end = offset + FRAME_LENGTH_SIZE + (end - start) + TAG_SIZE
+            seal_frame_into(key, header, nonce_prefix, counter, input_view[start:end], counter == frames,
+                            output_view[offset:output_end])
+            release_pages(input_map, start, end)
+            release_pages(output_map, offset, output_end)
+
+        jobs = []
+        for index in range(frames):
+            start = index * chunk_size
+            offset = data_start + index * (FRAME_LENGTH_SIZE + chunk_size + TAG_SIZE)
+            jobs.append((seal, (index + 1, start, min(start + chunk_size, size), offset)))
+        try:
+            run_frames(jobs, workers, in_flight or IN_FLIGHT * workers)
+        finally:
+            input_view.release()
+            output_view.release()
+    logger.debug(f"Encrypted {size} bytes in {frames} memory-mapped frames with {workers} workers.")
+    return size
+
+def decrypt_mapped(source: BinaryIO, destination: BinaryIO, key: bytes, header: bytes, nonce_prefix: bytes,
+                   chunk_size: int, workers: int = DEFAULT_WORKERS, in_flight: Optional[int] = None) -> int:
+    """
+    Decrypts the data frames of a stream through memory mappings: frames are located from their length fields and
+    decrypted from memoryview slices of the input straight into a preallocated output. Fails like decrypt_stream
+    on missing, reordered, modified or truncated frames, after which the output must be discarded.
+
+    Args:
+        source (BinaryIO): The encrypted file, positioned right after the filename frame.
+        destination (BinaryIO): The output file, opened for reading and writing.
+        key (bytes): The AES-256 key (32 bytes).
+        header (bytes): The stream header.
+        nonce_prefix (bytes): The random nonce prefix of the stream.
+        chunk_size (int): The chunk size from the stream header.
+        workers (int): The number of decryption threads.
+        in_flight (Optional[int]): The largest number of frames pending at once; IN_FLIGHT per worker by default.
+
+    Returns:
+        int: The number of plaintext bytes written.
+    """
+    # Only the length fields are read to lay out the frames. They are read from the file rather than the mapping,
+    # where touching one field faults in the pages around it too
+    file_size = os.fstat(source.fileno()).st_size
+    frames = []
+    offset = source.tell()
+    size = 0
+    final = False
+    while not final:
+        source.seek(offset)
+        length_bytes = source.read(FRAME_LENGTH_SIZE)
+        if len(length_bytes) != FRAME_LENGTH_SIZE:
+            raise ValueError("Encrypted file is truncated.")
+        length = int.from_bytes(length_bytes, 'big')
+        final = bool(length & FINAL_FRAME)
+        length &= ~FINAL_FRAME
+        if length > chunk_size:
+            raise ValueError("Frame is larger than the stream's chunk size.")
+        end = offset + FRAME_LENGTH_SIZE + length + TAG_SIZE
+        if end > file_size:
+            raise ValueError("Encrypted file is truncated.")
+        frames.append((len(frames) + 1, offset, end, final, size))
+        size += length
+        offset = end
+    if offset != file_size:
+        raise ValueError("Unexpected data after the final frame.")
+
+    destination.truncate(size)
+    with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as input_map:
+        if size == 0:
+            # Nothing to map; the empty final frame still has to verify
+            counter, start, end, final, _ = frames[0]
+            open_frame_into(key, header, nonce_prefix, counter, memoryview(input_map[start:end]), final,
+                            memoryview(bytearray()))
+            return 0
+        with mmap.mmap(destination.fileno(), 0) as output_map:
+            input_view = memoryview(input_map)
+            output_view = memoryview(output_map)
+
+            def open_into(counter, start, end, final, output_start):
+                output_end = output_start + end - start - FRAME_LENGTH_SIZE - TAG_SIZE
+                open_frame_into(key, header, nonce_prefix, counter, input_view[start:end], final,
+                                output_view[output_start:output_end])
+                release_pages(input_map, start, end)
+                release_pages(output_map, output_start, output_end)
+
+            try:
+                run_frames([(open_into, frame) for frame in frames], workers, in_flight or IN_FLIGHT * workers)
+            finally:
+                input_view.release()
+                output_view.release()
+    logger.debug(f"Decrypted {size} bytes from {len(frames)} memory-mapped frames with {workers} workers.")
+    return size
+
 # ====================
 # File Handling Functions
 # ====================
@@ -155,6 +740,21 @@ def save_to_file(data: bytes, filename: str) -> None:
         file.write(data)
     logger.debug(f"Data saved to {filename}.")
 
+def partial_output(filename: str) -> BinaryIO:
+    """
+    Creates a new temporary file next to an output file, to be renamed over it once complete. The name is unique,
+    so no existing file is overwritten or removed along with a failed output.
+
+    Args:
+        filename (str): The path of the output file.
+
+    Returns:
+        BinaryIO: The temporary file, opened for reading and writing. It is kept when closed.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    return tempfile.NamedTemporaryFile(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix='.part',
+                                       delete=False)
+
 def compute_hash(data: bytes) -> str:
     """
     Computes SHA-256 hash of the given data.
@@ -286,9 +886,16 @@ def generate_key_pair() -> None:
     print("\nPlease share your public key file with the recipient securely.")
     print("Ensure that you keep your private key file confidential.\n")
 
-def encrypt_file_interactive() -> None:
+def encrypt_file_interactive(chunk_size: int = CHUNK_SIZE, workers: int = DEFAULT_WORKERS,
+                             in_flight: Optional[int] = None, use_mmap: bool = True) -> None:
     """
     Interactive function to encrypt a file for a recipient using their public key.
+
+    Args:
+        chunk_size (int): The plaintext size of each encrypted frame.
+        workers (int): The number of encryption threads.
+        in_flight (Optional[int]): The largest number of frames held in memory.
+        use_mmap (bool): Whether to work on memory mappings instead of buffered reads and writes.
     """
     # Prompt for the user's private key file name
     private_key_file = input("Enter your private key file name (e.g., 'jak_kyber_private_key.bin'): ").strip()
@@ -308,15 +915,8 @@ def encrypt_file_interactive() -> None:
         print(f"Input file '{input_file}' does not exist.")
         return
 
-    # Check file size
-    file_size = os.path.getsize(input_file)
-    if file_size > MAX_FILE_SIZE:
-        print(f"File size exceeds the maximum allowed size of {MAX_FILE_SIZE} bytes.")
-        return
-
-    # Define output files
+    # Define output file; the encapsulated key goes into its header
     encrypted_file = f"{input_file}.enc"
-    encapsulated_key_file = f"{input_file}.enc.key"
 
     # Load recipient's public key
     try:
@@ -327,11 +927,9 @@ def encrypt_file_interactive() -> None:
 
     # Encapsulate shared secret
     ciphertext, shared_secret = encapsulate_kyber_key(public_key)
-    save_to_file(ciphertext, encapsulated_key_file)
-    logger.info(f"Kyber encapsulated key saved to '{encapsulated_key_file}'.")
 
     # Generate a random salt
-    salt = os.urandom(16)  # 16 bytes of random data
+    salt = os.urandom(SALT_SIZE)  # 16 bytes of random data
 
     # Derive AES-256 key using HKDF with salt
     try:
@@ -342,31 +940,40 @@ def encrypt_file_interactive() -> None:
         print("Encryption failed due to a key derivation error.")
         return
 
-    # Load input data
+    # Encrypt the file chunk by chunk, so its size is not limited by memory, into a temporary file that only
+    # replaces the output once complete
+    destination = None
     try:
-        data = load_file_data(input_file)
-        logger.info(f"Input file '{input_file}' loaded.")
+        with open(input_file, 'rb') as source, partial_output(encrypted_file) as destination:
+            if use_mmap and os.path.getsize(input_file) > 0:
+                total = encrypt_mapped(source, destination, aes_key, salt, ciphertext, input_file, chunk_size,
+                                       workers, in_flight)
+            else:
+                total = encrypt_stream(source, destination, aes_key, salt, ciphertext, input_file, chunk_size,
+                                       workers, in_flight)
+        os.replace(destination.name, encrypted_file)
+        logger.info(f"Input file '{input_file}' ({total} bytes) encrypted to '{encrypted_file}'.")
     except Exception as e:
-        print(f"Failed to load input file: {e}")
+        if destination is not None and os.path.exists(destination.name):
+            os.remove(destination.name)
+        print(f"Failed to encrypt input file: {e}")
         return
 
-    # Encrypt data
-    encrypted_data = encrypt_data(data, aes_key, nonce_counter=1, original_filename=input_file, salt=salt)
-    save_to_file(encrypted_data, encrypted_file)
-    logger.info(f"Encrypted data saved to '{encrypted_file}'.")
-
-    # Inform the user about the files to send
+    # Inform the user about the file to send
     print("\n=== Encryption Successful ===")
     print(f"Encrypted File: {encrypted_file}")
-    print(f"Encapsulated Key File: {encapsulated_key_file}")
-    print("\nTo allow the recipient to decrypt the file, send them the following files securely:")
-    print(f"- Encrypted File: {encrypted_file}")
-    print(f"- Encapsulated Key File: {encapsulated_key_file}")
+    print("\nTo allow the recipient to decrypt the file, send them the encrypted file. It carries the encapsulated key.")
     print(f"\nDO NOT share your private key file: {private_key_file}\n")
 
-def decrypt_file_interactive() -> None:
+def decrypt_file_interactive(workers: int = DEFAULT_WORKERS, in_flight: Optional[int] = None,
+                             use_mmap: bool = True) -> None:
     """
     Interactive function to decrypt a received encrypted file using the user's private key.
+
+    Args:
+        workers (int): The number of decryption threads.
+        in_flight (Optional[int]): The largest number of frames held in memory.
+        use_mmap (bool): Whether to work on memory mappings instead of buffered reads and writes.
     """
     # Prompt for the user's private key file name
     private_key_file = input("Enter your private key file name (e.g., 'alice_kyber_private_key.bin'): ").strip()
@@ -380,12 +987,6 @@ def decrypt_file_interactive() -> None:
         print(f"Encrypted file '{encrypted_file}' does not exist.")
         return
 
-    # Prompt for the encapsulated key file name
-    encapsulated_key_file = input("Enter the encapsulated key file name (e.g., 'document.txt.enc.key'): ").strip()
-    if not os.path.exists(encapsulated_key_file):
-        print(f"Encapsulated key file '{encapsulated_key_file}' does not exist.")
-        return
-
     # Load user's private key
     try:
         private_key = load_private_key(private_key_file)
@@ -393,58 +994,184 @@ def decrypt_file_interactive() -> None:
         print(f"Failed to load your private key: {e}")
         return
 
-    # Load encapsulated key (ciphertext)
+    # Read the stream header; files written by older versions of this tool have none
     try:
-        ciphertext = load_file_data(encapsulated_key_file)
-        logger.info(f"Kyber encapsulated key loaded from '{encapsulated_key_file}'.")
+        source = open(encrypted_file, 'rb')
     except Exception as e:
-        print(f"Failed to load encapsulated key file: {e}")
+        print(f"Failed to load encrypted file: {e}")
         return
 
-    # Decapsulate shared secret
-    try:
-        shared_secret = decapsulate_kyber_key(ciphertext, private_key)
-    except Exception as e:
-        print(f"Failed to decapsulate the shared secret: {e}")
+    with source:
+        try:
+            stream = read_stream_header(source)
+        except ValueError as e:
+            print(f"Failed to load encrypted file: {e}")
+            return
+
+        # Containers carry the encapsulated key; older layouts keep it in a separate file
+        if stream is not None and stream[4] is not None:
+            ciphertext = stream[4]
+        else:
+            ciphertext = load_encapsulated_key()
+            if ciphertext is None:
+                return
+
+        # Decapsulate shared secret
+        try:
+            shared_secret = decapsulate_kyber_key(ciphertext, private_key)
+        except Exception as e:
+            print(f"Failed to decapsulate the shared secret: {e}")
+            return
+
+        if stream is None:
+            source.seek(0)
+            safe_filename = decrypt_legacy_file(source, shared_secret)
+        else:
+            safe_filename = decrypt_stream_file(source, shared_secret, stream, workers, in_flight, use_mmap)
+    if safe_filename is None:
         return
 
-    # Load encrypted data
+    print("\n=== Decryption Successful ===")
+    print(f"Decrypted File: {safe_filename}\n")
+
+def load_encapsulated_key() -> Optional[bytes]:
+    """
+    Prompts for and loads the encapsulated key file of a file in the two-file layout of older versions of this tool.
+
+    Returns:
+        Optional[bytes]: The Kyber ciphertext, or None if it could not be loaded.
+    """
+    encapsulated_key_file = input("Enter the encapsulated key file name (e.g., 'document.txt.enc.key'): ").strip()
+    if not os.path.exists(encapsulated_key_file):
+        print(f"Encapsulated key file '{encapsulated_key_file}' does not exist.")
+        return None
     try:
-        encrypted_data = load_file_data(encrypted_file)
-        logger.info(f"Encrypted file '{encrypted_file}' loaded.")
+        ciphertext = load_file_data(encapsulated_key_file)
+        logger.info(f"Kyber encapsulated key loaded from '{encapsulated_key_file}'.")
+        return ciphertext
     except Exception as e:
-        print(f"Failed to load encrypted file: {e}")
-        return
+        print(f"Failed to load encapsulated key file: {e}")
+        return None
 
-    # Extract the salt from the beginning of the encrypted data
-    salt = encrypted_data[:16]  # CHANGED
-    encrypted_data = encrypted_data[16:]  # CHANGED
+def derive_aes_key(shared_secret: bytes, salt: bytes) -> Optional[bytes]:
+    """
+    Derives the AES-256 key from the shared secret with HKDF.
+
+    Args:
+        shared_secret (bytes): The Kyber shared secret.
+        salt (bytes): The salt used in HKDF.
 
-    # Derive AES-256 key using HKDF with the extracted salt
+    Returns:
+        Optional[bytes]: The AES-256 key, or None if the derivation failed.
+    """
     try:
         aes_key = HKDF(master=shared_secret, key_len=AES_KEY_SIZE, salt=salt, hashmod=SHA256)
         logger.debug("AES-256 Key derived using extracted salt.")
+        return aes_key
     except TypeError as e:
         logger.error(f"HKDF() error: {e}")
         print("Decryption failed due to a key derivation error.")
-        return
+        return None
+
+def confirm_overwrite(filename: str) -> bool:
+    """
+    Asks before a decrypted file replaces an existing one.
+
+    Args:
+        filename (str): The path the decrypted data would be saved to.
+
+    Returns:
+        bool: Whether the file may be written.
+    """
+    if os.path.exists(filename):
+        overwrite_input = input(f"File '{filename}' already exists. Do you want to overwrite it? (yes/no): ").strip().lower()
+        if overwrite_input not in ['yes', 'y']:
+            print("Decryption aborted.")
+            return False
+    return True
+
+def decrypt_stream_file(source: BinaryIO, shared_secret: bytes, stream: Tuple[bytes, int, bytes, bytes, Optional[bytes]],
+                        workers: int = DEFAULT_WORKERS, in_flight: Optional[int] = None,
+                        use_mmap: bool = True) -> Optional[str]:
+    """
+    Decrypts a file in the streaming format chunk by chunk.
+
+    Args:
+        source (BinaryIO): The encrypted file, positioned right after its header.
+        shared_secret (bytes): The Kyber shared secret.
+        stream (Tuple[bytes, int, bytes, bytes, Optional[bytes]]): The stream header as read by read_stream_header.
+        workers (int): The number of decryption threads.
+        in_flight (Optional[int]): The largest number of frames held in memory.
+        use_mmap (bool): Whether to work on memory mappings instead of buffered reads and writes.
+
+    Returns:
+        Optional[str]: The path the decrypted data was saved to, or None if decryption failed or was aborted.
+    """
+    header, chunk_size, salt, nonce_prefix, _ = stream
+    aes_key = derive_aes_key(shared_secret, salt)
+    if aes_key is None:
+        return None
+
+    # Decrypt and sanitize the original filename
+    try:
+        original_filename = read_stream_filename(source, aes_key, header, nonce_prefix)
+    except Exception as e:
+        print(f"Failed to decrypt the data: {e}")
+        return None
+    safe_filename = os.path.basename(original_filename)
+    if not confirm_overwrite(safe_filename):
+        return None
+
+    # Decrypt into a temporary file, so a frame that fails verification never leaves partial plaintext behind
+    destination = None
+    try:
+        with partial_output(safe_filename) as destination:
+            if use_mmap:
+                total = decrypt_mapped(source, destination, aes_key, header, nonce_prefix, chunk_size, workers,
+                                       in_flight)
+            else:
+                total = decrypt_stream(source, destination, aes_key, header, nonce_prefix, chunk_size, workers,
+                                       in_flight)
+        os.replace(destination.name, safe_filename)
+        logger.info(f"Decrypted data ({total} bytes) saved to '{safe_filename}'.")
+    except Exception as e:
+        if destination is not None and os.path.exists(destination.name):
+            os.remove(destination.name)
+        print(f"Failed to decrypt the data: {e}")
+        return None
+    return safe_filename
+
+def decrypt_legacy_file(source: BinaryIO, shared_secret: bytes) -> Optional[str]:
+    """
+    Decrypts a file written by an older version of this tool as a single AES-GCM message.
+
+    Args:
+        source (BinaryIO): The encrypted file, positioned at its start.
+        shared_secret (bytes): The Kyber shared secret.
+
+    Returns:
+        Optional[str]: The path the decrypted data was saved to, or None if decryption failed or was aborted.
+    """
+    encrypted_data = source.read()
+
+    # Extract the salt from the beginning of the encrypted data
+    salt = encrypted_data[:SALT_SIZE]
+    encrypted_data = encrypted_data[SALT_SIZE:]
+    aes_key = derive_aes_key(shared_secret, salt)
+    if aes_key is None:
+        return None
 
     # Decrypt data and extract original filename
     try:
         data, original_filename = decrypt_data(encrypted_data, aes_key)
     except Exception as e:
         print(f"Failed to decrypt the data: {e}")
-        return
+        return None
 
     # Sanitize the original filename
     safe_filename = os.path.basename(original_filename)
-
-    # Check if file exists
-    if os.path.exists(safe_filename):
-        overwrite_input = input(f"File '{safe_filename}' already exists. Do you want to overwrite it? (yes/no): ").strip().lower()
-        if overwrite_input not in ['yes', 'y']:
-            print("Decryption aborted.")
-            return
+    if not confirm_overwrite(safe_filename):
+        return None
 
     # Save decrypted data
     try:
@@ -452,10 +1179,8 @@ def decrypt_file_interactive() -> None:
         logger.info(f"Decrypted data saved to '{safe_filename}'.")
     except Exception as e:
         print(f"Failed to save decrypted data: {e}")
-        return
-
-    print("\n=== Decryption Successful ===")
-    print(f"Decrypted File: {safe_filename}\n")
+        return None
+    return safe_filename
 
 # ====================
 # Argument Parser Setup
@@ -464,6 +1189,14 @@ def decrypt_file_interactive() -> None:
 def main():
     parser = argparse.ArgumentParser(description="Kyber KEM-based File Encryption and Decryption Tool")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose logging")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Plaintext bytes per encrypted frame")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Threads encrypting and verifying frames")
+    parser.add_argument("--in-flight", type=int, default=None,
+                        help=f"Frames held in memory at once (default: {IN_FLIGHT} per worker)")
+    parser.add_argument("--no-mmap", action="store_true",
+                        help="Use buffered reads and writes instead of memory mappings (for filesystems without mmap)")
+    parser.add_argument("--inspect", nargs='+', metavar="FILE",
+                        help="Print the format of encrypted files from their headers and exit")
 
     args = parser.parse_args()
 
@@ -473,6 +1206,14 @@ def main():
     else:
         logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s:%(message)s')
 
+    if args.inspect:
+        for filename in args.inspect:
+            try:
+                print(f"{filename}: {describe_encrypted_file(filename)}")
+            except OSError as e:
+                print(f"{filename}: {e}")
+        return
+
     while True:
         print("=== Kyber KEM File Encryption Tool ===")
         print("Select an option:")
@@ -486,9 +1227,9 @@ def main():
         if choice == '1':
             generate_key_pair()
         elif choice == '2':
-            encrypt_file_interactive()
+            encrypt_file_interactive(args.chunk_size, args.workers, args.in_flight, not args.no_mmap)
         elif choice == '3':
-            decrypt_file_interactive()
+            decrypt_file_interactive(args.workers, args.in_flight, not args.no_mmap)
         elif choice == '4':
             print("Exiting the tool. Goodbye!")
             break